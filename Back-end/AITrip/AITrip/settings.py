@@ -21,12 +21,18 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = "django-insecure-h5og#30o!%bjl&nkrc+_5+xb6eb68ywf#2t)5kjd$ht6^s(6)r"
+SECRET_KEY = os.environ.get(
+    "DJANGO_SECRET_KEY", "django-insecure-h5og#30o!%bjl&nkrc+_5+xb6eb68ywf#2t)5kjd$ht6^s(6)r"
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get("DJANGO_DEBUG", "1") == "1"
 
-ALLOWED_HOSTS = []
+# Comma separated, e.g. DJANGO_ALLOWED_HOSTS=api.example.com,10.0.0.5
+ALLOWED_HOSTS = [host for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "").split(",") if host]
+
+# Client addresses trusted with diagnostics such as Server-Timing, comma separated
+INTERNAL_IPS = [ip for ip in os.environ.get("DJANGO_INTERNAL_IPS", "").split(",") if ip]
 
 
 # Application definition
@@ -44,9 +50,11 @@ INSTALLED_APPS = [
     "acounts",
     'itinerary',
     'review',
+    'travel',
 ]
 
 MIDDLEWARE = [
+    "utils.instrumentation.InstrumentationMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -91,6 +99,16 @@ DATABASES = {
     }
 }
 
+# DB_ENGINE=sqlite runs against a local SQLite file instead, e.g. to load
+# seed_scale data without a MySQL server
+if os.environ.get("DB_ENGINE") == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -111,9 +129,114 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 REST_FRAMEWORK = {
+    # JWTAuthentication with users cached per process and in CACHES (see
+    # acounts/authentication.py)
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'acounts.authentication.CachedJWTAuthentication',
+    ),
+    # orjson-backed JSON with the {success,msg,data} envelope written at render time
+    # (see utils/renderers.py); falls back to the stdlib when orjson is missing
+    'DEFAULT_RENDERER_CLASSES': (
+        'utils.renderers.EnvelopeJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'utils.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
+    # Proxies in front of the app appending to X-Forwarded-For; unset, client
+    # IPs come from REMOTE_ADDR only (login throttling, see acounts/throttling.py)
+    'NUM_PROXIES': int(os.environ["NUM_PROXIES"]) if os.environ.get("NUM_PROXIES") else None,
+}
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory (LRU culling, per process) by default; point CACHE_BACKEND /
+# CACHE_LOCATION at e.g. django.core.cache.backends.redis.RedisCache to share
+# entries between worker processes.
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache")
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.environ.get("CACHE_LOCATION", "aitrip"),
+        "TIMEOUT": 300,
+    }
+}
+if CACHE_BACKEND.endswith("LocMemCache"):
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": 10000, "CULL_FREQUENCY": 4}
+
+# Feature settings below only list what differs from the defaults kept in the
+# DEFAULTS of the module named next to each; see utils/config.py
+
+# Read-through cache for itinerary details (see itinerary/cache.py)
+ITINERARY_CACHE = {}
+
+# Users resolved by CachedJWTAuthentication (see acounts/authentication.py)
+AUTH_USER_CACHE = {}
+
+# Revoked JWTs (see acounts/revocation.py)
+TOKEN_REVOCATION = {}
+
+# Login attempt limits (see acounts/throttling.py); rates are '<count>/<s|m|h|d>'
+LOGIN_THROTTLE = {}
+
+# Password hashing for logins (see acounts/hashing.py)
+PASSWORD_HASH_POOL = {}
+
+# Admin bulk user import, POST /api/users/import/ (see acounts/provisioning.py);
+# manage.py import_users has no row limit and hashes on processes instead.
+# Passwords are hashed on PASSWORD_HASH_POOL; a request may bring as many as
+# the pool hashes in HASH_SECONDS (measured per process), which must stay well
+# below the worker timeout (start_server.py --timeout, 30 s)
+USER_IMPORT = {
+    "MAX_ROWS": 2000,
+    "BATCH_SIZE": 100,
+    "HASH_SECONDS": 15,
+}
+
+# POI search (see itinerary/search.py); on MySQL these must match the server's
+# innodb_ft_min_token_size and stopword list, FULLTEXT_STOPWORDS defaults to
+# InnoDB's built-in list
+POI_SEARCH = {}
+
+# Maximum SQL queries per viewset action (see utils/queryBudget.py)
+# Keys are '<ViewSetName>.<action>' and override the viewset's own query_budgets;
+# 'default' applies to actions without a budget. Over-budget requests are logged.
+QUERY_BUDGETS = {
+    'default': None,
+}
+
+# Request instrumentation (see utils/instrumentation.py), off unless enabled
+# A SAMPLE_RATE share of requests gets a JSON log line with its SQL,
+# serialization, envelope and render timings; queries slower than
+# SLOW_QUERY_MS are logged with a normalized fingerprint. With SERVER_TIMING
+# the timings are also sent in a Server-Timing header, to INTERNAL_IPS only.
+INSTRUMENTATION = {
+    "ENABLED": os.environ.get("INSTRUMENTATION_ENABLED", "0") == "1",
+    "SAMPLE_RATE": float(os.environ.get("INSTRUMENTATION_SAMPLE_RATE", "0.1")),
+    "SLOW_QUERY_MS": float(os.environ.get("SLOW_QUERY_MS", "100")),
+    "SERVER_TIMING": os.environ.get("INSTRUMENTATION_SERVER_TIMING", "0") == "1",
+}
+
+# Microbenchmark suite (python manage.py benchmark, see utils/benchmark.py)
+# Runs are appended to HISTORY and compared with BASELINE; a median more than
+# TOLERANCE slower than the baseline counts as a regression.
+BENCHMARKS = {}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "utils.instrumentation": {
+            "handlers": ["console"],
+            "level": os.environ.get("INSTRUMENTATION_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
 }
 
 
@@ -151,4 +274,23 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "AUTH_HEADER_TYPES": ("Bearer",),
-}
\ No newline at end of file
+}
+
+
+# AI itinerary generation (see travel/services.py)
+# CLIENT is the dotted path of a travel.clients.BaseItineraryClient subclass;
+# the stub client works offline and can simulate model latency for load tests.
+ITINERARY_GENERATION = {
+    "CLIENT": os.environ.get("ITINERARY_CLIENT", "travel.clients.StubItineraryClient"),
+    "CLIENT_OPTIONS": {},
+    "WORKERS": 4,
+    "MAX_PENDING": 32,
+    # Pending/running jobs untouched this long (seconds) were lost to a restart
+    "STALE_AFTER": 900,
+}
+
+# Route ordering of daily schedules (see itinerary/catalog.py): itineraries with
+# at least PARALLEL_MIN_DAYS days are optimized over WORKERS processes
+ITINERARY_ROUTING = {
+    "WORKERS": 2,
+}
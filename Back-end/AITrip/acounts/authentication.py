@@ -0,0 +1,289 @@
+"""
+JWT authentication with cached user resolution
+
+JWTAuthentication loads the user from the database on every request.
+CachedJWTAuthentication resolves it from two cache tiers instead:
+
+    local   per-process LRU, LOCAL_TIMEOUT seconds; no I/O at all
+    shared  the Django cache in settings.AUTH_USER_CACHE['ALIAS'], TIMEOUT
+            seconds; shared by every worker process
+
+Saving or deleting a user (profile updates, password changes, is_active
+changes) deletes its entries right away and bumps its version in the shared
+cache once the transaction commits, so entries written from the old row in
+between are ignored. Other processes may serve their local copy for up to
+LOCAL_TIMEOUT seconds. Bulk QuerySet.update() sends no signals; call
+invalidate_user() after one.
+
+The shared tier needs a cache every process reads, such as Redis or
+Memcached. A LocMemCache lives in one process, so the deletes and version
+bumps would never reach the others and they would serve stale users for up
+to TIMEOUT seconds; with SHARED left at None the tier is skipped for it and
+users come from the local tier or the database.
+
+Tokens revoked through revocation.py are rejected before any user lookup.
+
+aauthenticate() does the same for the async views of itinerary/async_views.py
+through the async cache and ORM APIs.
+
+Claims mode (CLAIMS_USER) skips the lookup altogether for safe requests to
+views that set ``claims_user = True``: request.user is an unsaved User built
+from the token's user id, never staff. Use it only for views that need
+nothing but the user's id.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from utils.cacheVersion import bump_version
+from utils.config import load_config
+
+from .revocation import ais_revoked, is_revoked
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 300,             # seconds a user lives in the shared cache
+    'LOCAL_TIMEOUT': 5,         # seconds a user lives in the process; other
+                                # processes see changes after at most this long
+    'LOCAL_MAX_ENTRIES': 10000,
+    'CLAIMS_USER': False,       # token-claims users for views with claims_user = True
+    # None: use the shared tier unless ALIAS is a per-process LocMemCache
+    'SHARED': None,
+}
+
+
+def get_config():
+    return load_config('AUTH_USER_CACHE', DEFAULTS)
+
+
+def get_shared_cache(config=None):
+    """The cache of the shared tier, or None when it is skipped"""
+    config = config or get_config()
+    cache = caches[config['ALIAS']]
+    shared = config['SHARED']
+    if shared is None:
+        shared = not isinstance(cache, LocMemCache)
+    return cache if shared else None
+
+
+def user_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def version_key(user_id):
+    return f"auth:user-version:{user_id}"
+
+
+class LocalUserCache:
+    """
+    Thread-safe LRU of users for this process, with a per-entry expiry
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, user, timeout, max_entries):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + timeout, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_users = LocalUserCache()
+
+
+def _shared_entry(values, user_id):
+    """(user or None, version) from the shared cache values of a user"""
+    version = values.get(version_key(user_id), 0)
+    entry = values.get(user_key(user_id))
+    if entry is not None and entry[0] == version:
+        return entry[1], version
+    return None, version
+
+
+def get_cached_user(user_id, load):
+    """
+    Return the user with the given id from the caches, calling load() on a miss
+
+    load() must return an active user or raise; only its result is cached.
+    Callers get their own copy, so changing request.user never changes the cache.
+    """
+    config = get_config()
+    user = local_users.get(user_id)
+    if user is None:
+        cache = get_shared_cache(config)
+        if cache is None:
+            user = load()
+        else:
+            user, version = _shared_entry(cache.get_many([user_key(user_id), version_key(user_id)]), user_id)
+            if user is None:
+                user = load()
+                cache.set(user_key(user_id), (version, user), config['TIMEOUT'])
+        local_users.set(user_id, user, config['LOCAL_TIMEOUT'], config['LOCAL_MAX_ENTRIES'])
+    return copy.copy(user)
+
+
+async def aget_cached_user(user_id, aload):
+    """get_cached_user() for async views; aload is a coroutine function"""
+    config = get_config()
+    user = local_users.get(user_id)
+    if user is None:
+        cache = get_shared_cache(config)
+        if cache is None:
+            user = await aload()
+        else:
+            user, version = _shared_entry(await cache.aget_many([user_key(user_id), version_key(user_id)]), user_id)
+            if user is None:
+                user = await aload()
+                await cache.aset(user_key(user_id), (version, user), config['TIMEOUT'])
+        local_users.set(user_id, user, config['LOCAL_TIMEOUT'], config['LOCAL_MAX_ENTRIES'])
+    return copy.copy(user)
+
+
+def _invalidate(user_id):
+    cache = get_shared_cache()
+    if cache is not None:
+        bump_version(cache, version_key(user_id))
+        cache.delete(user_key(user_id))
+    local_users.delete(user_id)
+
+
+def invalidate_user(user_id):
+    """
+    Drop the cached user now and again once the current transaction commits,
+    so a request racing with the write can't cache the old row
+    """
+    cache = get_shared_cache()
+    if cache is not None:
+        cache.delete(user_key(user_id))
+    local_users.delete(user_id)
+    transaction.on_commit(lambda: _invalidate(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication rejecting revoked tokens and resolving users through
+    get_cached_user()
+    """
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken("Token has been revoked")
+        return token
+
+    def get_user(self, validated_token):
+        config = get_config()
+        if not config['ENABLED']:
+            return super().get_user(validated_token)
+        user_id = self.get_user_id(validated_token)
+        if config['CLAIMS_USER'] and self.claims_user_allowed():
+            return self.get_claims_user(user_id)
+
+        user = get_cached_user(user_id, lambda: super(CachedJWTAuthentication, self).get_user(validated_token))
+        self.check_password_claim(validated_token, user)
+        return user
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+    def check_password_claim(self, validated_token, user):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Checked by JWTAuthentication.get_user on misses only
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("The user's password has been changed.", code="password_changed")
+
+    def claims_user_allowed(self, view=None):
+        request = getattr(self, 'request', None)
+        if view is None:
+            view = (getattr(request, 'parser_context', None) or {}).get('view')
+        return request is not None and request.method in SAFE_METHODS and getattr(view, 'claims_user', False)
+
+    def get_claims_user(self, user_id):
+        """Unsaved user carrying only the id of the token; never staff"""
+        user = self.user_model(**{api_settings.USER_ID_FIELD: user_id})
+        user.is_active = True
+        user.from_token_claims = True
+        return user
+
+    def authenticate(self, request):
+        self.request = request
+        return super().authenticate(request)
+
+    async def aauthenticate(self, request, view=None):
+        """
+        authenticate() for async views
+
+        The token is checked and the user resolved on the event loop; only
+        cache misses, revocation list reloads and bloom filter hits wait on
+        the database.
+        """
+        self.request = request
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = JWTAuthentication.get_validated_token(self, raw_token)
+        if await ais_revoked(validated_token):
+            raise InvalidToken("Token has been revoked")
+        return await self.aget_user(validated_token, view), validated_token
+
+    async def aget_user(self, validated_token, view=None):
+        config = get_config()
+        user_id = self.get_user_id(validated_token)
+        if config['ENABLED'] and config['CLAIMS_USER'] and self.claims_user_allowed(view):
+            return self.get_claims_user(user_id)
+
+        async def aload():
+            try:
+                user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+                raise AuthenticationFailed("User is inactive", code="user_inactive")
+            return user
+
+        if config['ENABLED']:
+            user = await aget_cached_user(user_id, aload)
+        else:
+            user = await aload()
+        self.check_password_claim(validated_token, user)
+        return user
@@ -0,0 +1,157 @@
+"""
+Bounded pool for password hashing
+
+Login hashes passwords (PBKDF2 by default) on a few worker threads instead
+of the request threads, so a burst of attempts can use at most WORKERS
+cores. hashlib releases the GIL while hashing, so the workers run in
+parallel. At most MAX_PENDING hashes may be queued or running; attempts
+beyond that are shed with HashPoolFull (answered with 503) instead of
+queueing up behind the burst, which keeps the wait of admitted logins short.
+
+Bulk work (the admin user import) goes through map(), which waits for
+slots instead of being shed; all map() calls together hold at most half of
+them, so logins are still admitted while imports run.
+
+Workers never touch the database: callers look the user up first and save a
+rehashed password themselves.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+
+from utils.config import load_config
+
+DEFAULTS = {
+    'WORKERS': None,            # None: one per CPU
+    'MAX_PENDING': None,        # None: four hashes per worker
+}
+
+
+class HashPoolFull(Exception):
+    """Raised when the pool already holds the maximum number of pending hashes"""
+
+
+class PasswordHashPool:
+    """
+    Bounded worker pool for password hashes
+
+    Args:
+        workers: Number of hashing threads; 0 hashes inline (tests, debugging)
+        max_pending: Maximum number of queued plus running hashes in this process
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.max_pending = 4 * max(self.workers, 1) if max_pending is None else max_pending
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # Shared by every map() call, however many run at once
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_concurrency)
+        self._hash_seconds = None
+        self._executor = None
+        if self.workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+
+    def run(self, func, *args):
+        """
+        Run func(*args) on the pool and wait for its result
+
+        Raises:
+            HashPoolFull: when no slot is free
+        """
+        if not self._slots.acquire(blocking=False):
+            raise HashPoolFull('Too many login attempts are being processed, please retry later')
+        try:
+            if self._executor is None:
+                return func(*args)
+            return self._executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def check_password(self, password, encoded):
+        """
+        Returns:
+            (valid, must_update): whether the password matches and whether the
+            stored hash should be upgraded
+        """
+        return self.run(_check, password, encoded)
+
+    def make_password(self, password):
+        return self.run(make_password, password)
+
+    @property
+    def bulk_concurrency(self):
+        """Number of hashes all map() calls together run at the same time"""
+        return max(min(self.workers, self.max_pending // 2), 1)
+
+    def map(self, func, iterable, chunksize=1):
+        """
+        Iterator of func(item) for every item in order, computed on the pool
+
+        Like Executor.map (chunksize is ignored), the first hashes start
+        right away; but it waits for free slots, and together with the other
+        map() calls in flight holds at most bulk_concurrency of them.
+        """
+        if self._executor is None:
+            return map(func, iterable)
+        items = iter(iterable)
+        pending = deque(self._submit_waiting(func, item) for item in islice(items, self.bulk_concurrency))
+        return self._results(func, items, pending)
+
+    def _submit_waiting(self, func, item):
+        self._bulk_slots.acquire()
+        self._slots.acquire()
+        return self._executor.submit(self._run_releasing, func, item)
+
+    def _run_releasing(self, func, item):
+        try:
+            return func(item)
+        finally:
+            self._slots.release()
+            self._bulk_slots.release()
+
+    def _results(self, func, items, pending):
+        for item in items:
+            yield pending.popleft().result()
+            pending.append(self._submit_waiting(func, item))
+        while pending:
+            yield pending.popleft().result()
+
+    def hash_seconds(self):
+        """Seconds make_password() takes with the current hasher, measured once"""
+        if self._hash_seconds is None:
+            started = time.perf_counter()
+            make_password('calibration-password')
+            self._hash_seconds = time.perf_counter() - started
+        return self._hash_seconds
+
+
+def _check(password, encoded):
+    valid = check_password(password, encoded)
+    must_update = valid and identify_hasher(encoded).must_update(encoded)
+    return valid, must_update
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> PasswordHashPool:
+    """
+    Return the per-process hashing pool, creating it on first use
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = load_config('PASSWORD_HASH_POOL', DEFAULTS)
+                _pool = PasswordHashPool(
+                    workers=config['WORKERS'],
+                    max_pending=config['MAX_PENDING'],
+                )
+    return _pool
@@ -0,0 +1,80 @@
+"""
+Create users in bulk from a CSV or NDJSON file
+
+CSV files need a header row; NDJSON files hold one JSON object per line.
+Recognised columns/keys: email, username, first_name, middle_name,
+last_name, password (optional; users without one get an unusable password).
+Rows are streamed, validated, hashed on a pool of forked processes and
+inserted in batches (see acounts/provisioning.py). Rejected rows are listed
+on stderr with their line number; the others are imported.
+
+Usage:
+    python manage.py import_users users.csv [--format csv|ndjson] \\
+        [--batch-size 1000] [--workers 4] [--dry-run]
+    cat users.ndjson | python manage.py import_users - --format ndjson
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from acounts.provisioning import FORMATS, UserImporter, guess_format, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Import users from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin")
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='File format; guessed from the extension by default (csv for stdin)'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows inserted per transaction')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Processes hashing passwords (default: CPU count)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Validate without hashing or writing')
+
+    def handle(self, *args, **options):
+        path, workers = options['path'], options['workers']
+        format = options['format'] or guess_format('' if path == '-' else path)
+        try:
+            stream = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f"Can't read {path}: {e}")
+
+        started = time.perf_counter()
+        executor = None
+        if workers > 1 and not options['dry_run']:
+            # Workers inherit the configured hashers and never touch the database
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+        try:
+            importer = UserImporter(
+                batch_size=options['batch_size'], executor=executor, workers=workers,
+                dry_run=options['dry_run'],
+            )
+            report = importer.run(read_rows(stream, format))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            if stream is not sys.stdin:
+                stream.close()
+
+        for error in report.errors:
+            messages = '; '.join(
+                f"{field}: {' '.join(str(message) for message in messages)}"
+                for field, messages in error['errors'].items()
+            )
+            self.stderr.write(f"line {error['line']}: {messages}")
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report.created} of {report.rows} users in {time.perf_counter() - started:.1f}s"
+            f" ({report.failed} rejected)"
+        ))
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 17:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('acounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jti', models.CharField(blank=True, help_text='jti claim of the revoked token; empty for all sessions of the user', max_length=255, null=True, unique=True, verbose_name='Token ID')),
+                ('revoked_at', models.DateTimeField(db_index=True, verbose_name='Revoked At')),
+                ('expires_at', models.DateTimeField(db_index=True, help_text='Time after which no token matching this row is valid', verbose_name='Expires At')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revoked_tokens', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Revoked Token',
+                'verbose_name_plural': 'Revoked Tokens',
+                'db_table': 'auth_revoked_token',
+            },
+        ),
+    ]
@@ -68,3 +68,45 @@ class User(AbstractUser):
         full_name = " ".join(part for part in name_parts if part)
         return full_name 
     
+
+
+class RevokedToken(models.Model):
+    """
+    Revoked JWTs (see revocation.py)
+
+    A row with a jti revokes that one token; a row without one revokes every
+    token of the user issued at or before revoked_at ("log out all sessions").
+    Rows are purged once expires_at passes, when no token they match can be
+    valid anymore.
+    """
+    jti = models.CharField(
+        max_length=255,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name='Token ID',
+        help_text='jti claim of the revoked token; empty for all sessions of the user'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='revoked_tokens',
+        verbose_name='User'
+    )
+    revoked_at = models.DateTimeField(
+        verbose_name='Revoked At',
+        db_index=True
+    )
+    expires_at = models.DateTimeField(
+        verbose_name='Expires At',
+        db_index=True,
+        help_text='Time after which no token matching this row is valid'
+    )
+
+    class Meta:
+        db_table = 'auth_revoked_token'
+        verbose_name = 'Revoked Token'
+        verbose_name_plural = 'Revoked Tokens'
+
+    def __str__(self):
+        return f"{self.user_id} - {self.jti or 'all sessions'}"
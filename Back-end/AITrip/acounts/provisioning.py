@@ -0,0 +1,218 @@
+"""
+Bulk user provisioning
+
+Used by the import_users command and the admin bulk endpoint
+(POST /api/users/import/). Rows are read as a stream from CSV or NDJSON
+(one JSON object per line) and imported in batches:
+
+    1. every row is validated by UserImportSerializer, without queries
+    2. emails and usernames are checked against earlier rows and, with one
+       query each per batch, against the database
+    3. passwords are hashed on the given executor (processes for the
+       command, the login hashing pool for the endpoint); rows without one
+       get an unusable password
+    4. the batch is inserted with one bulk_create in its own transaction
+
+Hashing of a batch overlaps with the insert of the previous one. A row that
+fails any step is reported with its line number and the other rows are still
+imported; when a concurrent registration makes bulk_create fail, the batch is
+retried row by row.
+
+bulk_create sends no post_save signals; none of the receivers matter for
+users that didn't exist before.
+"""
+
+import csv
+import io
+import json
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+
+from .models import User
+from .serializers import UserImportSerializer
+
+FORMATS = ('csv', 'ndjson')
+
+
+def guess_format(name):
+    """'ndjson' for .ndjson/.jsonl/.json names, else 'csv'"""
+    return 'ndjson' if name.lower().endswith(('.ndjson', '.jsonl', '.json')) else 'csv'
+
+
+def read_rows(stream, format):
+    """
+    Yield (line number, row) for every record of a text stream
+
+    Rows that can't be parsed are yielded as (line number, error message).
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Blank cells are missing values, like missing keys in NDJSON
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}
+    elif format == 'ndjson':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, f'Invalid JSON: {e}'
+                continue
+            yield number, row if isinstance(row, dict) else 'Expected a JSON object'
+    else:
+        raise ValueError(f"Unknown format '{format}', expected one of {', '.join(FORMATS)}")
+
+
+def read_upload(upload, format=None):
+    """read_rows() over an uploaded file, decoded as UTF-8"""
+    stream = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+    return read_rows(stream, format or guess_format(upload.name or ''))
+
+
+class ImportReport:
+    """
+    Outcome of an import
+
+    Attributes:
+        rows: Rows read
+        created: Users created (or that would be, in a dry run)
+        errors: [{'line': n, 'errors': {field: [messages]}}] in line order
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        if isinstance(errors, str):
+            errors = {'non_field_errors': [errors]}
+        self.errors.append({'line': line, 'errors': errors})
+
+    @property
+    def failed(self):
+        return len(self.errors)
+
+    def as_dict(self):
+        return {'rows': self.rows, 'created': self.created, 'failed': self.failed, 'errors': self.errors}
+
+
+class UserImporter:
+    """
+    Args:
+        batch_size: Rows validated, hashed and inserted together
+        executor: concurrent.futures executor (or PasswordHashPool) hashing
+            passwords; None hashes in the calling thread
+        workers: Number of workers of the executor, to split batches evenly
+        dry_run: Validate and check duplicates only; nothing is hashed or saved
+    """
+
+    def __init__(self, batch_size=1000, executor=None, workers=1, dry_run=False):
+        self.batch_size = max(batch_size, 1)
+        self.executor = executor
+        self.workers = max(workers, 1)
+        self.dry_run = dry_run
+        self.emails = {}
+        self.usernames = {}
+
+    def run(self, rows):
+        """
+        Import (line number, row) pairs as produced by read_rows()
+
+        Returns:
+            ImportReport
+        """
+        report = ImportReport()
+        rows = iter(rows)
+        pending = None
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            report.rows += len(batch)
+            valid = self.validate(batch, report)
+            hashing = None if self.dry_run else self.hash_passwords(valid)
+            if pending is not None:
+                self.insert(*pending, report)
+            pending = (valid, hashing) if hashing is not None else None
+            if self.dry_run:
+                report.created += len(valid)
+        if pending is not None:
+            self.insert(*pending, report)
+        report.errors.sort(key=lambda error: error['line'])
+        return report
+
+    def validate(self, batch, report):
+        """
+        Valid rows of the batch as [(line, validated data)]; the others go to the report
+        """
+        valid = []
+        for line, row in batch:
+            if isinstance(row, str):
+                report.add_error(line, row)
+                continue
+            serializer = UserImportSerializer(data=row)
+            if not serializer.is_valid():
+                report.add_error(line, serializer.errors)
+                continue
+            data = serializer.validated_data
+            data['email'] = User.objects.normalize_email(data['email'])
+            errors = {}
+            for field, seen in (('email', self.emails), ('username', self.usernames)):
+                if data[field] in seen:
+                    errors[field] = [f'Duplicate {field}, first used on line {seen[data[field]]}.']
+            if errors:
+                report.add_error(line, errors)
+                continue
+            self.emails[data['email']] = self.usernames[data['username']] = line
+            valid.append((line, data))
+
+        if valid:
+            taken_emails = set(User.objects.filter(
+                email__in=[data['email'] for _, data in valid]
+            ).values_list('email', flat=True))
+            taken_usernames = set(User.objects.filter(
+                username__in=[data['username'] for _, data in valid]
+            ).values_list('username', flat=True))
+            if taken_emails or taken_usernames:
+                remaining = []
+                for line, data in valid:
+                    errors = {}
+                    if data['email'] in taken_emails:
+                        errors['email'] = ['Email already exists.']
+                    if data['username'] in taken_usernames:
+                        errors['username'] = ['Username already exists.']
+                    if errors:
+                        report.add_error(line, errors)
+                    else:
+                        remaining.append((line, data))
+                valid = remaining
+        return valid
+
+    def hash_passwords(self, valid):
+        """Hashes of the rows' passwords, or a future of them on the executor"""
+        passwords = [data.pop('password', None) for _, data in valid]
+        if self.executor is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(len(passwords) // (self.workers * 4), 1)
+        return self.executor.map(make_password, passwords, chunksize=chunksize)
+
+    def insert(self, valid, hashes, report):
+        users = [User(password=encoded, **data) for (_, data), encoded in zip(valid, hashes)]
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+            report.created += len(users)
+        except IntegrityError:
+            # Taken since validate(); find the rows one by one
+            with transaction.atomic():
+                for (line, _), user in zip(valid, users):
+                    try:
+                        with transaction.atomic():
+                            user.save(force_insert=True)
+                        report.created += 1
+                    except IntegrityError:
+                        report.add_error(line, 'Email or username already exists.')
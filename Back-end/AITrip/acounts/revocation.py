@@ -0,0 +1,193 @@
+"""
+JWT revocation
+
+Revocations are stored as RevokedToken rows: one per revoked token (by jti)
+and one per "log out all sessions" (every token of the user issued until
+then). Rows are purged whenever a token is revoked, once no token they match
+can still be valid.
+
+Each process keeps a RevocationList in memory: a bloom filter of revoked
+jtis and the latest all-sessions cutoff per user. CachedJWTAuthentication
+checks every token against it, so a token that was never revoked costs no
+query; only bloom filter hits (revoked tokens and ~ERROR_RATE false
+positives) are confirmed in the database. The list is reloaded from the
+store at most every REFRESH_INTERVAL seconds by the request that finds it
+stale, with one query for the revocations made since the last load (the
+OVERLAP re-read covers transactions that commit late and clock skew), or
+all unexpired ones every REBUILD_INTERVAL seconds and whenever the filter is
+full. Revocations made in this process apply immediately; other processes
+pick them up within REFRESH_INTERVAL seconds.
+
+Token iat claims have second precision, so tokens issued in the same second
+as a "log out all sessions" are revoked too.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from utils.bloomFilter import BloomFilter
+from utils.config import load_config
+from .models import RevokedToken
+
+DEFAULTS = {
+    'REFRESH_INTERVAL': 5,      # seconds before other processes see a revocation
+    'REBUILD_INTERVAL': 600,    # seconds between full reloads of the bloom filter
+    'OVERLAP': 60,              # seconds re-read by each reload (late commits, clock skew)
+    'CAPACITY': 100000,         # revoked tokens per filter at ERROR_RATE
+    'ERROR_RATE': 0.001,        # share of valid tokens confirmed with a query
+}
+
+
+def get_config():
+    return load_config('TOKEN_REVOCATION', DEFAULTS)
+
+
+class RevocationList:
+    """
+    Per-process view of the revocation store
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything; the next check loads the store again"""
+        self.bloom = None
+        self.cutoffs = {}
+        self.loaded_at = None
+        self.refreshed = self.rebuilt = float('-inf')
+
+    def refresh(self, force=False):
+        """
+        Load the revocations made since the last load, or all of them when a
+        rebuild is due; does nothing within REFRESH_INTERVAL of the last load
+        """
+        config = get_config()
+        if not force and time.monotonic() - self.refreshed < config['REFRESH_INTERVAL']:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self.refreshed < config['REFRESH_INTERVAL']:
+                return
+            started = timezone.now()
+            rebuild = (
+                self.bloom is None or self.bloom.is_full
+                or now - self.rebuilt >= config['REBUILD_INTERVAL']
+            )
+            if rebuild:
+                rows = RevokedToken.objects.filter(expires_at__gt=started)
+            else:
+                since = self.loaded_at - timedelta(seconds=config['OVERLAP'])
+                rows = RevokedToken.objects.filter(revoked_at__gte=since)
+            rows = list(rows.values_list('jti', 'user_id', 'revoked_at'))
+
+            if rebuild:
+                bloom = BloomFilter(max(config['CAPACITY'], 2 * len(rows)), config['ERROR_RATE'])
+                cutoffs = {}
+            else:
+                bloom, cutoffs = self.bloom, dict(self.cutoffs)
+            for jti, user_id, revoked_at in rows:
+                if jti is None:
+                    self._add_cutoff(cutoffs, user_id, revoked_at)
+                else:
+                    bloom.add(jti)
+
+            self.bloom, self.cutoffs, self.loaded_at = bloom, cutoffs, started
+            self.refreshed = now
+            if rebuild:
+                self.rebuilt = now
+
+    @staticmethod
+    def _add_cutoff(cutoffs, user_id, revoked_at):
+        key = str(user_id)
+        timestamp = revoked_at.timestamp()
+        if timestamp > cutoffs.get(key, float('-inf')):
+            cutoffs[key] = timestamp
+
+    def add_jti(self, jti):
+        with self._lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+    def add_cutoff(self, user_id, revoked_at):
+        with self._lock:
+            cutoffs = dict(self.cutoffs)
+            self._add_cutoff(cutoffs, user_id, revoked_at)
+            self.cutoffs = cutoffs
+
+    def is_stale(self):
+        return time.monotonic() - self.refreshed >= get_config()['REFRESH_INTERVAL']
+
+    def verdict(self, token):
+        """True or False when memory decides, None when the jti must be confirmed"""
+        cutoff = self.cutoffs.get(str(token.get(api_settings.USER_ID_CLAIM)))
+        if cutoff is not None and token.get('iat', float('-inf')) <= cutoff:
+            return True
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti is None or jti not in self.bloom:
+            return False
+        return None
+
+    def is_revoked(self, token):
+        self.refresh()
+        revoked = self.verdict(token)
+        if revoked is None:
+            return RevokedToken.objects.filter(jti=token[api_settings.JTI_CLAIM]).exists()
+        return revoked
+
+    async def ais_revoked(self, token):
+        """is_revoked() for async views; only reloads run in a thread"""
+        if self.is_stale():
+            await sync_to_async(self.refresh)()
+        revoked = self.verdict(token)
+        if revoked is None:
+            return await RevokedToken.objects.filter(jti=token[api_settings.JTI_CLAIM]).aexists()
+        return revoked
+
+
+revocations = RevocationList()
+
+
+def purge_expired():
+    """Delete rows no valid token can match anymore"""
+    return RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def revoke_token(token):
+    """
+    Revoke one validated access or refresh token until it expires
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    RevokedToken.objects.get_or_create(jti=jti, defaults={
+        'user_id': token[api_settings.USER_ID_CLAIM],
+        'revoked_at': timezone.now(),
+        'expires_at': datetime_from_epoch(token['exp']),
+    })
+    revocations.add_jti(jti)
+    purge_expired()
+
+
+def revoke_user(user):
+    """
+    Revoke every token issued to the user so far ("log out all sessions")
+    """
+    now = timezone.now()
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    RevokedToken.objects.create(user=user, revoked_at=now, expires_at=now + lifetime)
+    revocations.add_cutoff(user.pk, now)
+    purge_expired()
+
+
+def is_revoked(token):
+    return revocations.is_revoked(token)
+
+
+async def ais_revoked(token):
+    return await revocations.ais_revoked(token)
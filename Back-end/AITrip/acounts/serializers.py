@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
-from django.contrib.auth import authenticate
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.contrib.auth.signals import user_login_failed
+from .hashing import get_pool
 from .models import User
 
 
@@ -43,10 +45,32 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         Create user with encrypted password
         """
         password = validated_data.pop('password')
-        user = User.objects.create_user(**validated_data)
-        user.set_password(password)
-        user.save()
-        return user
+        # create_user hashes the password before the INSERT, no second UPDATE
+        return User.objects.create_user(password=password, **validated_data)
+
+
+class UserImportSerializer(serializers.ModelSerializer):
+    """
+    One row of a bulk import (see provisioning.py)
+
+    Like registration, but uniqueness is checked for the whole batch by the
+    importer instead of with two queries per row, and the password may be
+    left out (the user gets an unusable one and sets it through a reset).
+    """
+    password = serializers.CharField(
+        write_only=True,
+        required=False,
+        min_length=8,
+        validators=[validate_password],
+    )
+
+    class Meta:
+        model = User
+        fields = ('email', 'username', 'first_name', 'middle_name', 'last_name', 'password')
+        extra_kwargs = {
+            'email': {'validators': []},
+            'username': {'validators': [UnicodeUsernameValidator()]},
+        }
 
 
 class UserLoginSerializer(serializers.Serializer):
@@ -63,28 +87,39 @@ class UserLoginSerializer(serializers.Serializer):
     def validate(self, attrs):
         """
         Validate user credentials
+
+        Hashing runs on the bounded pool of hashing.py and may raise
+        HashPoolFull. Unknown emails and wrong passwords get the same message
+        and take the same time.
         """
         email = attrs.get('email')
         password = attrs.get('password')
 
         if email and password:
-            # Authenticate using email instead of username
-            user = authenticate(
-                request=self.context.get('request'),
-                username=email,  # AbstractUser uses username field for authentication
-                password=password
-            )
-            
-            if not user:
-                # Try to find user by email and check if they exist
-                try:
-                    User.objects.get(email=email)
-                    raise serializers.ValidationError('Incorrect password.')
-                except User.DoesNotExist:
-                    raise serializers.ValidationError('User with this email does not exist.')
+            pool = get_pool()
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                # Hash anyway so the response time doesn't reveal unknown emails
+                pool.make_password(password)
+                valid = must_update = False
+            else:
+                valid, must_update = pool.check_password(password, user.password)
+
+            if not valid:
+                user_login_failed.send(
+                    sender=__name__,
+                    credentials={'username': email, 'password': '********'},
+                    request=self.context.get('request'),
+                )
+                raise serializers.ValidationError('Incorrect email or password.')
             
             if not user.is_active:
                 raise serializers.ValidationError('User account is disabled.')
+
+            if must_update:
+                # Upgrade the hash to the current hasher settings
+                user.password = pool.make_password(password)
+                user.save(update_fields=['password'])
             
             attrs['user'] = user
             return attrs
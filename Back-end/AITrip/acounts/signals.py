@@ -0,0 +1,18 @@
+"""
+Invalidation of cached users (see authentication.py)
+
+Every User save goes through here: profile updates, password changes
+(UserPasswordChangeSerializer.save), is_active changes and last_login updates.
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import invalidate_user
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
@@ -1,3 +1,468 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from utils.queryBudget import count_queries, get_query_budget
+from utils.testing import AuthenticatedAPITestCase
+from .authentication import local_users, user_key
+from .hashing import PasswordHashPool
+from .provisioning import UserImporter
+from .models import RevokedToken, User
+from .revocation import is_revoked, revocations, revoke_token
+from .throttling import LocalWindowStore, SlidingWindowLimit, local_store
+from .views import UserLoginView, UserRegistrationView
+
+
+class AuthQueryBudgetTestCase(APITestCase):
+    """
+    Registration and login stay within their query budgets
+    """
+
+    def register(self, email='new@aitrip.com', username='new'):
+        return self.client.post('/auth/register/', {
+            'email': email,
+            'username': username,
+            'first_name': 'New',
+            'last_name': 'User',
+            'password': 'register-pass-123',
+        }, format='json')
+
+    def test_registration(self):
+        with count_queries() as counter:
+            response = self.register()
+        self.assertEqual(response.status_code, 201)
+        self.assertLessEqual(counter.count, get_query_budget(UserRegistrationView(), 'post'))
+        self.assertTrue(User.objects.get(email='new@aitrip.com').check_password('register-pass-123'))
+
+        response = self.register(username='other')
+        self.assertEqual(response.status_code, 400)
+
+    def test_login(self):
+        User.objects.create_user(email='login@aitrip.com', username='login', password='login-pass-123')
+        with count_queries() as counter:
+            response = self.client.post(
+                '/auth/login/', {'email': 'login@aitrip.com', 'password': 'login-pass-123'}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data['data']['tokens'])
+        self.assertLessEqual(counter.count, get_query_budget(UserLoginView(), 'post'))
+
+    def test_budget_overrun_is_logged(self):
+        User.objects.create_user(email='login@aitrip.com', username='login', password='login-pass-123')
+        with self.settings(QUERY_BUDGETS={'UserLoginView.post': 0}):
+            with self.assertLogs('utils.queryBudget', 'WARNING') as logs:
+                self.client.post(
+                    '/auth/login/', {'email': 'login@aitrip.com', 'password': 'login-pass-123'}, format='json'
+                )
+        self.assertIn('UserLoginView.post', logs.output[0])
+
+
+class CachedJWTAuthenticationTestCase(AuthenticatedAPITestCase):
+    """
+    Authenticated requests resolve the user from the cache until it changes
+    """
+
+    username = 'cached'
+    token_auth = True
+
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        super().setUp()
+
+    def authenticate(self, user=None):
+        token = RefreshToken.for_user(user or self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def user_queries(self, path='/auth/profile/'):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        return response, [query['sql'] for query in context.captured_queries if User._meta.db_table in query['sql']]
+
+    @override_settings(AUTH_USER_CACHE={'SHARED': True})
+    def test_hit_skips_database(self):
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+        response, queries = self.user_queries()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['email'], 'cached@aitrip.com')
+        self.assertEqual(queries, [])
+
+        # Another process only has the shared entry
+        local_users.clear()
+        response, queries = self.user_queries()
+        self.assertEqual(queries, [])
+
+    def test_process_local_cache_is_not_shared(self):
+        # The default LocMemCache is invisible to other processes
+        self.user_queries()
+        self.assertIsNone(cache.get(user_key(self.user.pk)))
+        response, queries = self.user_queries()
+        self.assertEqual(queries, [])
+        local_users.clear()
+        response, queries = self.user_queries()
+        self.assertEqual(len(queries), 1)
+
+    def test_save_invalidates(self):
+        self.user_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put('/auth/profile/', {'first_name': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        local_users.clear()
+        response, queries = self.user_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['data']['first_name'], 'Renamed')
+
+    def test_deactivation_invalidates(self):
+        self.user_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.get(pk=self.user.pk)
+            user.is_active = False
+            user.save()
+        response, _ = self.user_queries()
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_change_invalidates(self):
+        self.user_queries()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/auth/change-password/', {
+                'old_password': 'cached-pass-123',
+                'new_password': 'changed-pass-456',
+                'new_password_confirm': 'changed-pass-456',
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        local_users.clear()
+        response, queries = self.user_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('changed-pass-456'))
+
+    def test_claims_user(self):
+        with self.settings(AUTH_USER_CACHE={'CLAIMS_USER': True}):
+            response, queries = self.user_queries('/api/itinerary/pois/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(queries, [])
+            self.assertFalse(local_users.get(self.user.pk))
+
+            # Views without claims_user still load the user
+            response, queries = self.user_queries()
+            self.assertEqual(len(queries), 1)
+
+
+class TokenRevocationTestCase(APITestCase):
+    """
+    Logged out tokens are rejected; valid ones are checked without queries
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_users.clear()
+        revocations.reset()
+        self.addCleanup(revocations.reset)
+        self.user = User.objects.create_user(email='revoke@aitrip.com', username='revoke', password='revoke-pass-123')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = self.refresh.access_token
+
+    def get_profile(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        return self.client.get('/auth/profile/')
+
+    def test_valid_token_costs_no_query(self):
+        self.get_profile(self.access)
+        with CaptureQueriesContext(connection) as context:
+            response = self.get_profile(self.access)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(context.captured_queries, [])
+
+    def test_logout_revokes_access_and_refresh_token(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        response = self.client.post('/auth/logout/', {'refresh_token': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        self.assertEqual(self.get_profile(self.access).status_code, 401)
+        self.assertTrue(is_revoked(RefreshToken(str(self.refresh))))
+
+        # Other processes find it in the store
+        revocations.reset()
+        self.assertEqual(self.get_profile(self.access).status_code, 401)
+        self.assertEqual(self.get_profile(RefreshToken.for_user(self.user).access_token).status_code, 200)
+
+    def test_logout_all_sessions(self):
+        other = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+        self.assertEqual(self.client.post('/auth/logout-all/').status_code, 200)
+        self.assertEqual(self.get_profile(self.access).status_code, 401)
+        self.assertEqual(self.get_profile(other).status_code, 401)
+
+        revocations.reset()
+        self.assertEqual(self.get_profile(other).status_code, 401)
+
+    def test_expired_rows_are_purged(self):
+        RevokedToken.objects.create(
+            jti='expired', user=self.user, revoked_at=timezone.now() - timedelta(days=2),
+            expires_at=timezone.now() - timedelta(days=1),
+        )
+        revoke_token(self.access)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), [self.access['jti']])
+
+    def test_incremental_refresh(self):
+        with self.settings(TOKEN_REVOCATION={'REFRESH_INTERVAL': 0}):
+            self.assertFalse(is_revoked(self.access))
+            # Revoked by another process
+            RevokedToken.objects.create(
+                jti=self.access['jti'], user=self.user, revoked_at=timezone.now(),
+                expires_at=timezone.now() + timedelta(hours=1),
+            )
+            self.assertTrue(is_revoked(self.access))
+            self.assertIn(self.access['jti'], revocations.bloom)
+
+
+class LoginProtectionTestCase(APITestCase):
+    """
+    Login attempts are throttled before hashing and shed when the pool is full
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_store.clear()
+        User.objects.create_user(email='login@aitrip.com', username='login', password='login-pass-123')
+
+    def login(self, email='login@aitrip.com', password='login-pass-123'):
+        return self.client.post('/auth/login/', {'email': email, 'password': password}, format='json')
+
+    def test_failure_takes_one_query(self):
+        for email in ('login@aitrip.com', 'unknown@aitrip.com'):
+            with count_queries() as counter:
+                response = self.login(email, 'wrong-pass-123')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(counter.count, 1)
+            self.assertEqual(response.data['data']['non_field_errors'], ['Incorrect email or password.'])
+
+    def test_ip_limit(self):
+        with self.settings(LOGIN_THROTTLE={'IP_RATE': '2/m', 'EMAIL_RATE': None}):
+            self.assertEqual(self.login().status_code, 200)
+            self.assertEqual(self.login(password='wrong-pass-123').status_code, 400)
+            with count_queries() as counter:
+                response = self.login()
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response['Retry-After']), 0)
+            self.assertEqual(counter.count, 0)
+
+    def test_forwarded_for_needs_num_proxies(self):
+        with self.settings(LOGIN_THROTTLE={'IP_RATE': '2/m', 'EMAIL_RATE': None}):
+            for attempt in range(3):
+                response = self.client.post(
+                    '/auth/login/', {'email': 'login@aitrip.com', 'password': 'wrong-pass-123'},
+                    format='json', HTTP_X_FORWARDED_FOR=f'203.0.113.{attempt}',
+                )
+            self.assertEqual(response.status_code, 429)
+
+            local_store.clear()
+            cache.clear()
+            with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+                for attempt in range(3):
+                    response = self.client.post(
+                        '/auth/login/', {'email': 'login@aitrip.com', 'password': 'wrong-pass-123'},
+                        format='json', HTTP_X_FORWARDED_FOR=f'203.0.113.{attempt}',
+                    )
+                    self.assertEqual(response.status_code, 400)
+
+    def test_email_limit_counts_failures(self):
+        User.objects.create_user(email='other@aitrip.com', username='other', password='other-pass-123')
+        with self.settings(LOGIN_THROTTLE={'IP_RATE': None, 'EMAIL_RATE': '2/h'}):
+            self.assertEqual(self.login().status_code, 200)
+            self.login(password='wrong-pass-123')
+            self.login(email='LOGIN@aitrip.com', password='wrong-pass-123')
+            self.assertEqual(self.login().status_code, 429)
+            self.assertEqual(self.login('other@aitrip.com', 'other-pass-123').status_code, 200)
+
+    def test_sliding_window(self):
+        limit = SlidingWindowLimit('test', '10/m', LocalWindowStore())
+        for _ in range(10):
+            self.assertEqual(limit.wait('ip', now=6000), 0)
+            limit.hit('ip', now=6000)
+        self.assertEqual(limit.wait('ip', now=6059), 1)
+        # Half of the previous window still counts
+        self.assertEqual(limit.wait('ip', now=6090), 0)
+        for _ in range(5):
+            limit.hit('ip', now=6090)
+        self.assertGreater(limit.wait('ip', now=6090), 0)
+
+    def test_full_pool_sheds(self):
+        pool = PasswordHashPool(workers=1, max_pending=1)
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait()
+
+        busy = threading.Thread(target=pool.run, args=(hold,))
+        busy.start()
+        self.addCleanup(busy.join)
+        self.addCleanup(release.set)
+        started.wait(5)
+
+        with mock.patch('acounts.serializers.get_pool', return_value=pool):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+IMPORT_CSV = """email,username,first_name,last_name,password
+ada@partner.com,ada,Ada,Lovelace,import-pass-123
+grace@partner.com,grace,Grace,Hopper,
+ada@partner.com,ada2,Ada,Again,import-pass-123
+taken@aitrip.com,taken2,Taken,Email,import-pass-123
+not-an-email,bad,Bad,Email,import-pass-123
+alan@partner.com,alan,Alan,Turing,short
+"""
+
+
+class UserImportTestCase(APITestCase):
+    """
+    Bulk imports create valid rows in batches and report the others by line
+    """
+
+    def setUp(self):
+        User.objects.create_user(email='taken@aitrip.com', username='taken', password='taken-pass-123')
+
+    def import_file(self, content, suffix, **options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as handle:
+            handle.write(content)
+        self.addCleanup(os.remove, handle.name)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_users', handle.name, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv(self):
+        stdout, stderr = self.import_file(IMPORT_CSV, '.csv', workers=1, batch_size=2)
+        self.assertIn('Created 2 of 6 users', stdout)
+        self.assertTrue(User.objects.get(email='ada@partner.com').check_password('import-pass-123'))
+        self.assertFalse(User.objects.get(email='grace@partner.com').has_usable_password())
+        errors = stderr.splitlines()
+        self.assertEqual([line.split(':')[0] for line in errors], ['line 4', 'line 5', 'line 6', 'line 7'])
+        self.assertIn('first used on line 2', errors[0])
+        self.assertIn('Email already exists', errors[1])
+
+    def test_ndjson_on_process_pool(self):
+        rows = [
+            {'email': f'user{i}@partner.com', 'username': f'user{i}', 'password': f'import-pass-{i:03}'}
+            for i in range(4)
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows) + '\n[1]\n{oops\n'
+        stdout, stderr = self.import_file(content, '.ndjson', workers=2, batch_size=3)
+        self.assertIn('Created 4 of 6 users', stdout)
+        self.assertIn('line 5: non_field_errors: Expected a JSON object', stderr)
+        self.assertTrue(User.objects.get(username='user3').check_password('import-pass-003'))
+
+    def test_queries_per_batch(self):
+        rows = [(i, {'email': f'u{i}@partner.com', 'username': f'u{i}'}) for i in range(50)]
+        with count_queries() as counter:
+            report = UserImporter(batch_size=25).run(rows)
+        self.assertEqual(report.created, 50)
+        # Two duplicate checks and one bulk insert per batch, plus transactions
+        self.assertLessEqual(counter.count, 2 * 5)
+
+    def test_dry_run(self):
+        stdout, _ = self.import_file(IMPORT_CSV, '.csv', dry_run=True)
+        self.assertIn('Would create 2 of 6 users', stdout)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_endpoint(self):
+        staff = User.objects.create_user(
+            email='admin@aitrip.com', username='admin', password='admin-pass-123', is_staff=True
+        )
+        member = User.objects.get(email='taken@aitrip.com')
+
+        self.client.force_authenticate(member)
+        response = self.client.post('/api/users/import/', {'users': []}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(staff)
+        response = self.client.post('/api/users/import/', {'users': [
+            {'email': 'json@partner.com', 'username': 'json', 'password': 'import-pass-123'},
+            {'email': 'taken@aitrip.com', 'username': 'other'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['data']['created'], 1)
+        self.assertEqual(response.data['data']['errors'], [
+            {'line': 2, 'errors': {'email': ['Email already exists.']}},
+        ])
+
+        upload = SimpleUploadedFile('partners.csv', IMPORT_CSV.encode(), content_type='text/csv')
+        response = self.client.post('/api/users/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['data']['created'], 2)
+        self.assertEqual(response.data['data']['failed'], 4)
+
+        with self.settings(USER_IMPORT={'MAX_ROWS': 1, 'BATCH_SIZE': 1, 'HASH_SECONDS': 15}):
+            response = self.client.post('/api/users/import/', {'users': [{}, {}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_endpoint_hashes_what_fits_the_timeout(self):
+        staff = User.objects.create_user(
+            email='admin@aitrip.com', username='admin', password='admin-pass-123', is_staff=True
+        )
+        self.client.force_authenticate(staff)
+        pool = PasswordHashPool(workers=2, max_pending=4)
+        self.addCleanup(pool._executor.shutdown)
+        pool._hash_seconds = 4.0
+        users = [
+            {'email': f'fit{i}@partner.com', 'username': f'fit{i}', 'password': f'import-pass-{i:03}'}
+            for i in range(3)
+        ]
+        with mock.patch('acounts.views.get_pool', return_value=pool):
+            with self.settings(USER_IMPORT={'MAX_ROWS': 10, 'BATCH_SIZE': 2, 'HASH_SECONDS': 10}):
+                # Two hashes at a time, 4 s each: five fit in 10 s
+                response = self.client.post('/api/users/import/', {'users': users * 2}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('At most 5 users', response.data['msg'])
+
+                response = self.client.post('/api/users/import/', {'users': users}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['data']['created'], 3)
+        self.assertTrue(User.objects.get(username='fit2').check_password('import-pass-002'))
+        # Every slot is free again for logins
+        for _ in range(pool.max_pending):
+            self.assertTrue(pool._slots.acquire(blocking=False))
+
+    def test_concurrent_maps_share_bulk_slots(self):
+        pool = PasswordHashPool(workers=4, max_pending=4)
+        self.addCleanup(pool._executor.shutdown)
+        lock = threading.Lock()
+        running, peak = [0], [0]
+
+        def work(item):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+            return item
+
+        # Like UserImporter.run, which keeps two batches in flight
+        first = pool.map(work, range(10))
+        second = pool.map(work, range(10, 20))
+        self.assertEqual(list(second) + list(first), list(range(10, 20)) + list(range(10)))
+        self.assertEqual(pool.bulk_concurrency, 2)
+        self.assertLessEqual(peak[0], pool.bulk_concurrency)
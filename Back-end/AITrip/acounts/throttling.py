@@ -0,0 +1,227 @@
+"""
+Login throttling
+
+Sliding window counters limit login attempts per client IP (every attempt)
+and per email (failed attempts only). Both are checked before the password
+is hashed, so throttled traffic costs no hashing and no query.
+
+Each limit counts hits in fixed windows of its period and estimates the
+sliding window as the current window plus the previous one weighted by how
+much of it still overlaps, which takes two counters per key however many
+attempts are made.
+
+The client IP is REMOTE_ADDR. X-Forwarded-For is only read when
+REST_FRAMEWORK['NUM_PROXIES'] is set to the number of proxies in front of
+the app; otherwise any client could send a new address with every attempt.
+
+Counters live in the Django cache settings.LOGIN_THROTTLE['ALIAS'] so every
+process shares them. The in-process LocalWindowStore stands in whenever that
+cache fails, or always with BACKEND 'local' (single process deployments,
+development).
+"""
+
+import hashlib
+import logging
+import math
+import threading
+import time
+
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from utils.config import load_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BACKEND': 'cache',         # 'local' counts per process only
+    'ALIAS': 'default',
+    'IP_RATE': '30/m',          # attempts per client IP
+    'EMAIL_RATE': '10/h',       # failed attempts per email
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def get_config():
+    return load_config('LOGIN_THROTTLE', DEFAULTS)
+
+
+def parse_rate(rate):
+    """
+    '<count>/<period>' with period s, m, h or d (or a word starting with one)
+
+    Returns:
+        (count, seconds), or None for a rate of None (no limit)
+    """
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), PERIODS[period.strip()[0]]
+
+
+class LocalWindowStore:
+    """
+    Counters for this process only, dropped once their timeout passes
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._next_purge = 0
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            values = {}
+            for key in keys:
+                entry = self._counters.get(key)
+                if entry is not None and entry[0] > now:
+                    values[key] = entry[1]
+            return values
+
+    def incr(self, key, timeout):
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_purge:
+                self._counters = {k: v for k, v in self._counters.items() if v[0] > now}
+                self._next_purge = now + 60
+            expires, value = self._counters.get(key, (0, 0))
+            if expires <= now:
+                expires, value = now + timeout, 0
+            self._counters[key] = (expires, value + 1)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+
+
+class CacheWindowStore:
+    """
+    Counters in a Django cache, falling back to the local store while it fails
+    """
+
+    def __init__(self, alias, fallback):
+        self.alias = alias
+        self.fallback = fallback
+
+    def get_many(self, keys):
+        try:
+            return caches[self.alias].get_many(keys)
+        except Exception:
+            logger.warning("Login throttle cache unavailable, counting in this process", exc_info=True)
+            return self.fallback.get_many(keys)
+
+    def incr(self, key, timeout):
+        try:
+            cache = caches[self.alias]
+            if not cache.add(key, 1, timeout):
+                cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            caches[self.alias].add(key, 1, timeout)
+        except Exception:
+            logger.warning("Login throttle cache unavailable, counting in this process", exc_info=True)
+            self.fallback.incr(key, timeout)
+
+
+local_store = LocalWindowStore()
+
+
+def get_store():
+    config = get_config()
+    if config['BACKEND'] == 'local':
+        return local_store
+    return CacheWindowStore(config['ALIAS'], local_store)
+
+
+class SlidingWindowLimit:
+    """
+    At most ``limit`` hits per key in any ``period`` seconds (estimated)
+
+    Args:
+        scope: Prefix of the counter keys
+        rate: '<count>/<period>', see parse_rate(); None disables the limit
+    """
+
+    def __init__(self, scope, rate, store=None):
+        self.scope = scope
+        self.rate = parse_rate(rate)
+        self.store = store or get_store()
+
+    def _keys(self, ident, now):
+        window = int(now // self.rate[1])
+        return (
+            f"throttle:{self.scope}:{ident}:{window}",
+            f"throttle:{self.scope}:{ident}:{window - 1}",
+            now - window * self.rate[1],
+        )
+
+    def wait(self, ident, now=None):
+        """
+        Seconds until the key may be hit again; 0 when it may be hit now
+        """
+        if self.rate is None:
+            return 0
+        limit, period = self.rate
+        now = time.time() if now is None else now
+        current_key, previous_key, elapsed = self._keys(ident, now)
+        counts = self.store.get_many([current_key, previous_key])
+        current = counts.get(current_key, 0)
+        previous = counts.get(previous_key, 0)
+        if previous * (1 - elapsed / period) + current < limit:
+            return 0
+        if current >= limit:
+            # Only once the current window becomes the previous one and fades
+            wait = period - elapsed + period * (1 - limit / current)
+        else:
+            wait = period * (1 - (limit - current) / previous) - elapsed
+        return max(math.ceil(wait), 1)
+
+    def hit(self, ident, now=None):
+        if self.rate is None:
+            return
+        now = time.time() if now is None else now
+        current_key, _, _ = self._keys(ident, now)
+        # The counter is read as the previous window during the next period
+        self.store.incr(current_key, 2 * self.rate[1])
+
+
+def client_ip(request):
+    """The address the IP limit counts; see the module docstring"""
+    if api_settings.NUM_PROXIES is not None:
+        return BaseThrottle().get_ident(request)
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class LoginThrottle:
+    """
+    Attempt limits of one login request
+    """
+
+    def __init__(self, request, email):
+        config = get_config()
+        store = get_store()
+        self.ip = client_ip(request)
+        email = str(email or '').strip().lower()
+        # Hashed to keep addresses out of the cache and keys short and safe
+        self.email = hashlib.sha256(email.encode()).hexdigest()[:32] if email else ''
+        self.ip_limit = SlidingWindowLimit('login-ip', config['IP_RATE'], store)
+        self.email_limit = SlidingWindowLimit('login-email', config['EMAIL_RATE'], store)
+
+    def check(self):
+        """
+        Count the attempt against the IP
+
+        Returns:
+            Seconds to wait when the IP or the email is over its limit, else 0
+        """
+        wait = max(self.ip_limit.wait(self.ip), self.email_limit.wait(self.email) if self.email else 0)
+        if not wait:
+            self.ip_limit.hit(self.ip)
+        return wait
+
+    def failed(self):
+        if self.email:
+            self.email_limit.hit(self.email)
@@ -14,6 +14,7 @@ urlpatterns = [
     path('auth/register/', views.UserRegistrationView.as_view(), name='user-register'),
     path('auth/login/', views.UserLoginView.as_view(), name='user-login'),
     path('auth/logout/', views.UserLogoutView.as_view(), name='user-logout'),
+    path('auth/logout-all/', views.UserLogoutAllView.as_view(), name='user-logout-all'),
     path('auth/profile/', views.UserProfileView.as_view(), name='user-profile'),
     path('auth/change-password/', views.UserPasswordChangeView.as_view(), name='user-change-password'),
 ]
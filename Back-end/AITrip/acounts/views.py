@@ -1,11 +1,20 @@
+from itertools import islice
+
+from django.conf import settings
 from rest_framework import viewsets, status, permissions
+from rest_framework.decorators import action
 from rest_framework.views import APIView
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import logout
 
 import logging
 
+from .hashing import HashPoolFull, get_pool
 from .models import User
+from .provisioning import FORMATS, UserImporter, read_upload
+from .revocation import revoke_token, revoke_user
+from .throttling import LoginThrottle
 from .serializers import (
     UserRegistrationSerializer,
     UserLoginSerializer,
@@ -13,7 +22,8 @@ from .serializers import (
     UserPasswordChangeSerializer,
     UserListSerializer
 )
-from utils.response import ResponseHandler
+from utils.queryBudget import QueryBudgetMixin
+from utils.response import ResponseHandler, CustomModelViewSet
 
 logger = logging.getLogger(__name__)
 
@@ -37,8 +47,8 @@ class UserViewSet(CustomModelViewSet,viewsets.ModelViewSet):
         if self.action == 'create':
             # Allow anyone to register
             permission_classes = [permissions.AllowAny]
-        elif self.action in ['list']:
-            # Only staff can list all users
+        elif self.action in ['list', 'bulk_import']:
+            # Only staff can list all users or import them
             permission_classes = [permissions.IsAdminUser]
         else:
             # Users can only access their own data
@@ -52,12 +62,64 @@ class UserViewSet(CustomModelViewSet,viewsets.ModelViewSet):
             return User.objects.all()
         return User.objects.filter(id=self.request.user.id)
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Create users from an uploaded CSV/NDJSON ``file`` (format from
+        ``format`` or the file name) or a JSON body ``{"users": [...]}``
+
+        Passwords are hashed on the login hashing pool (see hashing.py). The
+        request must finish within the worker timeout, so it takes at most
+        USER_IMPORT['MAX_ROWS'] rows, and only as many passwords as the pool
+        can hash in USER_IMPORT['HASH_SECONDS']; larger imports go through
+        manage.py import_users.
+        """
+        config = settings.USER_IMPORT
+        upload = request.FILES.get('file')
+        if upload is not None:
+            format = request.data.get('format')
+            if format and format not in FORMATS:
+                return ResponseHandler.error(msg=f"Unknown format '{format}'")
+            rows = read_upload(upload, format)
+        elif isinstance(request.data.get('users'), list):
+            rows = enumerate(request.data['users'], 1)
+        else:
+            return ResponseHandler.error(msg='Upload a file or send a "users" list')
+
+        rows = list(islice(rows, config['MAX_ROWS'] + 1))
+        if len(rows) > config['MAX_ROWS']:
+            return ResponseHandler.error(
+                msg=f"At most {config['MAX_ROWS']} users per request, use manage.py import_users for more"
+            )
 
-class UserRegistrationView(APIView):
+        pool = get_pool()
+        passwords = sum(1 for _, row in rows if isinstance(row, dict) and row.get('password'))
+        if passwords:
+            max_passwords = int(config['HASH_SECONDS'] * pool.bulk_concurrency / pool.hash_seconds())
+            if passwords > max_passwords:
+                return ResponseHandler.error(
+                    msg=f"At most {max_passwords} users with a password per request, "
+                        f"use manage.py import_users for more"
+                )
+
+        report = UserImporter(
+            batch_size=config['BATCH_SIZE'], executor=pool, workers=pool.bulk_concurrency
+        ).run(rows)
+        logger.info(f"Users imported by {request.user.email}: {report.created} created, {report.failed} rejected")
+        return ResponseHandler.success(
+            data=report.as_dict(),
+            msg='Import finished',
+            status_code=status.HTTP_201_CREATED if report.created else status.HTTP_200_OK
+        )
+
+
+class UserRegistrationView(QueryBudgetMixin, APIView):
     """
     User registration endpoint
     """
     permission_classes = [permissions.AllowAny]
+    # Email and username uniqueness (field validators and validate()), then the INSERT
+    query_budgets = {'post': 5}
     
     def post(self, request):
         """Register a new user"""
@@ -87,15 +149,28 @@ class UserRegistrationView(APIView):
 
 
 
-class UserLoginView(APIView):
+class UserLoginView(QueryBudgetMixin, APIView):
     """
     User login endpoint
+
+    Attempts are throttled per IP and failures per email (see throttling.py);
+    throttled attempts get 429 and attempts the hashing pool can't take 503,
+    both with Retry-After.
     """
     permission_classes = [permissions.AllowAny]
+    # Only the user lookup; tokens are signed without touching the database
+    query_budgets = {'post': 1}
     
     def post(self, request):
         """Authenticate user and return tokens"""
         try:
+            email = request.data.get('email') if hasattr(request.data, 'get') else None
+            throttle = LoginThrottle(request, email)
+            wait = throttle.check()
+            if wait:
+                return self.retry_later('Too many login attempts, please retry later',
+                                        status.HTTP_429_TOO_MANY_REQUESTS, wait)
+
             serializer = UserLoginSerializer(
                 data=request.data,
                 context={'request': request}
@@ -120,10 +195,14 @@ class UserLoginView(APIView):
                     msg='Login successful'
                 )
             
+            throttle.failed()
             return ResponseHandler.error(
                 msg='Login failed',
                 data=serializer.errors
             )
+
+        except HashPoolFull as e:
+            return self.retry_later(str(e), status.HTTP_503_SERVICE_UNAVAILABLE, 1)
             
         except Exception as e:
             return ResponseHandler.error(
@@ -131,6 +210,11 @@ class UserLoginView(APIView):
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def retry_later(self, msg, status_code, wait):
+        response = ResponseHandler.error(msg=msg, status_code=status_code)
+        response['Retry-After'] = str(wait)
+        return response
+
 
 class UserLogoutView(APIView):
     """
@@ -139,15 +223,23 @@ class UserLogoutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def post(self, request):
-        """Logout user by blacklisting refresh token"""
+        """Logout user by revoking the access token and the given refresh token"""
         try:
             refresh_token = request.data.get('refresh_token')
             if refresh_token:
                 token = RefreshToken(refresh_token)
-                token.blacklist()
+                if str(token[api_settings.USER_ID_CLAIM]) != str(request.user.pk):
+                    return ResponseHandler.error(
+                        msg='Refresh token belongs to another user',
+                        status_code=status.HTTP_400_BAD_REQUEST
+                    )
+                revoke_token(token)
+            if request.auth is not None:
+                revoke_token(request.auth)
             
+            email = request.user.email
             logout(request)
-            logger.info(f"User logged out: {request.user.email}")
+            logger.info(f"User logged out: {email}")
             
             return ResponseHandler.success(
                 msg='Logout successful'
@@ -160,6 +252,22 @@ class UserLogoutView(APIView):
             )
 
 
+class UserLogoutAllView(APIView):
+    """
+    Log out of every session: revokes all tokens issued to the user so far
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        email = request.user.email
+        revoke_user(request.user)
+        logout(request)
+        logger.info(f"User logged out of all sessions: {email}")
+        return ResponseHandler.success(
+            msg='Logged out of all sessions'
+        )
+
+
 class UserProfileView(APIView):
     """
     User profile management endpoint
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Itinerary, DailySchedule, POI
+from .models import Itinerary, DailySchedule, POI, SchedulePOI
 
 # Register your models here.
 admin.site.register(Itinerary)
 admin.site.register(DailySchedule)
-admin.site.register(POI)
\ No newline at end of file
+admin.site.register(POI)
+admin.site.register(SchedulePOI)
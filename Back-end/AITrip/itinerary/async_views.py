@@ -0,0 +1,129 @@
+"""
+Async list and retrieve endpoints for ASGI deployments
+
+Served under /api/itinerary/async/ with the same query parameters, output
+and errors as the list and retrieve actions of the viewsets. Under ASGI a
+request waiting on the database or the cache doesn't hold a worker thread:
+authentication, the itinerary detail cache, pagination and the compiled
+serializer's queries all go through the async cache and ORM APIs, and
+rendering happens on the event loop.
+
+Django's async ORM still runs each query in a thread, so this pays off for
+reads that mostly wait (cache hits, the shared cache, slow queries), not for
+CPU bound ones. Everything the compiled path doesn't cover falls back to the
+viewset's own code in a thread: serializers that can't be compiled and object
+permissions. Filters run on the event loop, as none of them queries the
+database (see utils.filterPlanner). Conditional requests (ETag / If-None-Match) and query budgets apply
+to the sync endpoints only.
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from acounts.authentication import CachedJWTAuthentication
+from utils.customPagination import KeysetPagination
+from utils.renderers import Envelope, EnvelopeJSONRenderer
+from . import cache as itinerary_cache
+from .views import ItineraryViewSet, DailyScheduleViewSet, POIViewSet
+
+
+class AsyncReadView(View):
+    """
+    Async GET of the list (no pk) or retrieve (pk) action of ``viewset_class``
+
+    The viewset is instantiated for its configuration only (queryset,
+    serializer, filters, pagination, permissions); its handlers never run on
+    the event loop.
+    """
+    viewset_class = None
+    # Serve retrieves through itinerary/cache.py
+    detail_cache = False
+    http_method_names = ['get', 'options']
+
+    async def get(self, request, pk=None):
+        action = 'list' if pk is None else 'retrieve'
+        headers = {}
+        try:
+            viewset = await self.initial(request, action, pk)
+            if pk is None:
+                data = await self.alist(viewset)
+            elif (self.detail_cache and viewset.get_sparse_fieldset() is None
+                  and not viewset.checks_object_permissions()):
+                data, hit = await itinerary_cache.aget_or_build(pk, lambda: self.aretrieve(viewset, pk))
+                headers['X-Cache'] = 'HIT' if hit else 'MISS'
+            else:
+                data = await self.aretrieve(viewset, pk)
+            status_code = 200
+        except (exceptions.APIException, Http404) as exc:
+            data, status_code, headers = self.handle_exception(request, exc)
+        return self.render(data, status_code, headers)
+
+    async def initial(self, request, action, pk):
+        """Authenticate the request and return the viewset configured for it"""
+        authenticator = CachedJWTAuthentication()
+        viewset = self.viewset_class(action=action, format_kwarg=None, args=(),
+                                     kwargs={} if pk is None else {'pk': pk})
+        drf_request = Request(request, authenticators=[authenticator])
+        viewset.request = drf_request
+        viewset.headers = {}
+        result = await authenticator.aauthenticate(request, viewset)
+        if result is None:
+            drf_request._not_authenticated()
+        else:
+            drf_request._authenticator = authenticator
+            drf_request.user, drf_request.auth = result
+        viewset.check_permissions(drf_request)
+        return viewset
+
+    def filter_queryset(self, viewset):
+        return viewset.filter_queryset(viewset.get_queryset())
+
+    async def alist(self, viewset):
+        compiled = viewset.get_compiled_serializer()
+        paginator = viewset.paginator
+        if compiled is None or not isinstance(paginator, KeysetPagination):
+            return (await sync_to_async(viewset.list)(viewset.request)).data
+        queryset = self.filter_queryset(viewset)
+        ordering_field = paginator.get_ordering_field(queryset, viewset)
+        queryset = compiled.values(queryset, *((ordering_field,) if ordering_field else ()))
+        rows = await paginator.apaginate_queryset(queryset, viewset.request, viewset)
+        return paginator.get_paginated_data(await compiled.aserialize(rows))
+
+    async def aretrieve(self, viewset, pk):
+        compiled = viewset.get_compiled_serializer()
+        if compiled is None or viewset.checks_object_permissions():
+            return await sync_to_async(viewset.get_object_data)()
+        queryset = self.filter_queryset(viewset).filter(**{viewset.lookup_field: pk})
+        rows = [row async for row in compiled.values(queryset)[:1].aiterator()]
+        if not rows:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        return (await compiled.aserialize(rows))[0]
+
+    def handle_exception(self, request, exc):
+        """(data, status, headers) of the error response, as APIView would build it"""
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            exc.auth_header = CachedJWTAuthentication().authenticate_header(request)
+        response = api_settings.EXCEPTION_HANDLER(exc, {'view': self, 'request': request})
+        headers = {key: value for key, value in response.items() if key.lower() != 'content-type'}
+        return response.data, response.status_code, headers
+
+    def render(self, data, status_code, headers):
+        body = EnvelopeJSONRenderer().render(Envelope.for_status(data, status_code))
+        return HttpResponse(body, status=status_code, content_type='application/json', headers=headers)
+
+
+class ItineraryAsyncView(AsyncReadView):
+    viewset_class = ItineraryViewSet
+    detail_cache = True
+
+
+class DailyScheduleAsyncView(AsyncReadView):
+    viewset_class = DailyScheduleViewSet
+
+
+class POIAsyncView(AsyncReadView):
+    viewset_class = POIViewSet
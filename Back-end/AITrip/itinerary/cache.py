@@ -0,0 +1,187 @@
+"""
+Read-through cache for serialized itinerary details
+
+Entries live in the Django cache configured by settings.ITINERARY_CACHE and
+are tagged with a per-itinerary version number. Signals bump the version
+whenever the itinerary, one of its days or one of its POIs changes, so a
+rebuild that raced with a write can never be served as fresh.
+
+Only one request rebuilds a missing key: it takes a short-lived lock with
+cache.add() while the others wait for the value to appear. aget_or_build()
+does the same for async views without blocking the event loop.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+
+from utils.cacheVersion import bump_version
+from utils.config import load_config
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'TIMEOUT': 300,             # seconds an entry lives without being invalidated
+    'LOCK_TIMEOUT': 10,         # seconds a rebuild lock is held at most
+    'LOCK_WAIT': 2.0,           # seconds other requests wait for a rebuild
+    'LOCK_POLL': 0.05,
+}
+
+
+def get_config():
+    return load_config('ITINERARY_CACHE', DEFAULTS)
+
+
+def get_cache():
+    return caches[get_config()['ALIAS']]
+
+
+def detail_key(itinerary_id):
+    return f"itinerary:detail:{itinerary_id}"
+
+
+def version_key(itinerary_id):
+    return f"itinerary:version:{itinerary_id}"
+
+
+def lock_key(itinerary_id):
+    return f"itinerary:lock:{itinerary_id}"
+
+
+class CacheMetrics:
+    """
+    Thread-safe hit/miss counters for this process
+    """
+    FIELDS = ('hits', 'misses', 'rebuilds', 'waits', 'wait_timeouts', 'invalidations')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {name: 0 for name in self.FIELDS}
+
+    def incr(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts = {name: 0 for name in self.FIELDS}
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_ratio'] = round(counts['hits'] / lookups, 4) if lookups else 0.0
+        return counts
+
+
+metrics = CacheMetrics()
+
+
+def _read(cache, itinerary_id):
+    """Return (data, current_version); data is None unless the entry is current"""
+    values = cache.get_many([detail_key(itinerary_id), version_key(itinerary_id)])
+    version = values.get(version_key(itinerary_id), 0)
+    entry = values.get(detail_key(itinerary_id))
+    if entry is not None and entry[0] == version:
+        return entry[1], version
+    return None, version
+
+
+def get_or_build(itinerary_id, build):
+    """
+    Return the cached detail of an itinerary, building it on a miss
+
+    Args:
+        itinerary_id: Itinerary primary key
+        build: Callable returning the serialized itinerary
+
+    Returns:
+        Tuple (data, hit) where hit tells whether the value came from the cache
+    """
+    config = get_config()
+    cache = get_cache()
+
+    data, version = _read(cache, itinerary_id)
+    if data is not None:
+        metrics.incr('hits')
+        return data, True
+    metrics.incr('misses')
+
+    token = uuid.uuid4().hex
+    if not cache.add(lock_key(itinerary_id), token, config['LOCK_TIMEOUT']):
+        # Someone else is rebuilding this key; wait for their result
+        metrics.incr('waits')
+        deadline = time.monotonic() + config['LOCK_WAIT']
+        while time.monotonic() < deadline:
+            time.sleep(config['LOCK_POLL'])
+            data, version = _read(cache, itinerary_id)
+            if data is not None:
+                return data, True
+        metrics.incr('wait_timeouts')
+        return build(), False
+
+    try:
+        metrics.incr('rebuilds')
+        data = build()
+        cache.set(detail_key(itinerary_id), (version, data), config['TIMEOUT'])
+    finally:
+        if cache.get(lock_key(itinerary_id)) == token:
+            cache.delete(lock_key(itinerary_id))
+    return data, False
+
+
+async def _aread(cache, itinerary_id):
+    values = await cache.aget_many([detail_key(itinerary_id), version_key(itinerary_id)])
+    version = values.get(version_key(itinerary_id), 0)
+    entry = values.get(detail_key(itinerary_id))
+    if entry is not None and entry[0] == version:
+        return entry[1], version
+    return None, version
+
+
+async def aget_or_build(itinerary_id, abuild):
+    """
+    get_or_build() for async views; abuild is a coroutine function
+    """
+    config = get_config()
+    cache = get_cache()
+
+    data, version = await _aread(cache, itinerary_id)
+    if data is not None:
+        metrics.incr('hits')
+        return data, True
+    metrics.incr('misses')
+
+    token = uuid.uuid4().hex
+    if not await cache.aadd(lock_key(itinerary_id), token, config['LOCK_TIMEOUT']):
+        metrics.incr('waits')
+        deadline = time.monotonic() + config['LOCK_WAIT']
+        while time.monotonic() < deadline:
+            await asyncio.sleep(config['LOCK_POLL'])
+            data, version = await _aread(cache, itinerary_id)
+            if data is not None:
+                return data, True
+        metrics.incr('wait_timeouts')
+        return await abuild(), False
+
+    try:
+        metrics.incr('rebuilds')
+        data = await abuild()
+        await cache.aset(detail_key(itinerary_id), (version, data), config['TIMEOUT'])
+    finally:
+        if await cache.aget(lock_key(itinerary_id)) == token:
+            await cache.adelete(lock_key(itinerary_id))
+    return data, False
+
+
+def invalidate(itinerary_ids):
+    """
+    Bump the version of the given itineraries so their cached details are ignored
+    """
+    cache = get_cache()
+    for itinerary_id in set(itinerary_ids):
+        bump_version(cache, version_key(itinerary_id))
+        cache.delete(detail_key(itinerary_id))
+        metrics.incr('invalidations')
@@ -0,0 +1,164 @@
+"""
+POI catalog helpers
+Attractions are stored once in the POI table, keyed by the normalized name and
+location, and attached to daily schedules through ordered SchedulePOI rows
+"""
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from utils.config import load_config
+
+from . import routing
+from .models import POI, SchedulePOI, make_catalog_key
+from .search import index_pois
+from .signals import schedules_changed
+
+
+def get_or_create_catalog_pois(pois_data, batch_size=500):
+    """
+    Resolve POI payloads to catalog entries, inserting the missing ones in bulk
+
+    Entries that already exist are reused as they are; duplicates inside
+    ``pois_data`` resolve to the same entry. Runs at most three queries plus the search index update of new entries.
+
+    Args:
+        pois_data: List of dicts of POI field values
+        batch_size: Rows per INSERT statement
+
+    Returns:
+        List of POI instances, one per item of pois_data
+    """
+    keys = [make_catalog_key(data.get('name'), data.get('location')) for data in pois_data]
+    if not keys:
+        return []
+
+    catalog = {poi.catalog_key: poi for poi in POI.objects.filter(catalog_key__in=set(keys))}
+    missing = {}
+    for key, data in zip(keys, pois_data):
+        if key not in catalog and key not in missing:
+            poi = POI(**data)
+            poi.set_derived_fields()
+            missing[key] = poi
+
+    if missing:
+        # Conflicts mean another request created the entry meanwhile; either way
+        # the ids are read back afterwards (MySQL does not return them)
+        POI.objects.bulk_create(missing.values(), batch_size=batch_size, ignore_conflicts=True)
+        created = list(POI.objects.filter(catalog_key__in=missing.keys()))
+        catalog.update((poi.catalog_key, poi) for poi in created)
+        # Bulk inserts send no post_save, so index the new entries here
+        index_pois(created, created=True)
+    return [catalog[key] for key in keys]
+
+
+def link_pois(schedule_pois, batch_size=500):
+    """
+    Attach catalog POIs to schedules in the given order with one bulk INSERT
+
+    Args:
+        schedule_pois: Iterable of (schedule_id, [POI, ...]) pairs
+
+    Returns:
+        List of the SchedulePOI instances that were inserted
+    """
+    links = [
+        SchedulePOI(schedule_id=schedule_id, poi_id=poi.pk, order=order)
+        for schedule_id, pois in schedule_pois
+        for order, poi in enumerate(pois)
+    ]
+    # A POI listed twice for the same day keeps its first position
+    SchedulePOI.objects.bulk_create(links, batch_size=batch_size, ignore_conflicts=True)
+    return links
+
+
+def append_poi(schedule, poi):
+    """
+    Add a catalog POI at the end of a schedule unless it is already part of it
+    """
+    next_order = SchedulePOI.objects.filter(schedule=schedule).aggregate(
+        last=Max('order')
+    )['last']
+    link, _ = SchedulePOI.objects.get_or_create(
+        schedule=schedule,
+        poi=poi,
+        defaults={'order': 0 if next_order is None else next_order + 1},
+    )
+    return link
+
+
+ROUTING_DEFAULTS = {
+    'WORKERS': 0,               # routing processes; 0 optimizes in the request
+    'PARALLEL_MIN_DAYS': 4,     # fewer days are optimized in the request
+    'SPEED_KMH': 30,            # converts meters to travel minutes
+}
+
+
+def get_routing_config():
+    return load_config('ITINERARY_ROUTING', ROUTING_DEFAULTS)
+
+
+def optimize_schedule_routes(schedule_ids, fixed_start=False):
+    """
+    Reorder the POIs of the given schedules to minimise travel between stops
+
+    Links are read with one query and rewritten with one bulk UPDATE. POIs
+    without coordinates keep their relative order after the routed ones.
+    Several days are spread over the routing process pool.
+
+    Args:
+        schedule_ids: Daily schedule primary keys
+        fixed_start: Keep the current first POI of every day first
+
+    Returns:
+        Dict schedule_id -> {'distance_before', 'distance_after', 'travel_minutes', 'unrouted'}
+    """
+    config = get_routing_config()
+    links_by_schedule = {schedule_id: [] for schedule_id in schedule_ids}
+    links = (
+        SchedulePOI.objects.filter(schedule_id__in=links_by_schedule)
+        .select_related('poi')
+        .only('schedule_id', 'order', 'poi', 'poi__latitude', 'poi__longitude')
+        .order_by('schedule_id', 'order', 'pk')
+    )
+    for link in links:
+        links_by_schedule[link.schedule_id].append(link)
+
+    tasks = []
+    for schedule_id, schedule_links in links_by_schedule.items():
+        coordinates = [
+            (link.poi.latitude, link.poi.longitude) for link in schedule_links
+            if link.poi.latitude is not None
+        ]
+        routed_first = bool(schedule_links) and schedule_links[0].poi.latitude is not None
+        tasks.append((schedule_id, coordinates, fixed_start and routed_first))
+
+    workers = config['WORKERS'] if len(tasks) >= config['PARALLEL_MIN_DAYS'] else 0
+    results = routing.optimize_routes_parallel(tasks, workers)
+
+    now = timezone.now()
+    changed_links, changed_schedules, summary = [], set(), {}
+    meters_per_minute = config['SPEED_KMH'] * 1000 / 60
+    for schedule_id, order, before, after in results:
+        schedule_links = links_by_schedule[schedule_id]
+        routed = [link for link in schedule_links if link.poi.latitude is not None]
+        unrouted = [link for link in schedule_links if link.poi.latitude is None]
+        for position, link in enumerate([routed[index] for index in order] + unrouted):
+            if link.order != position:
+                link.order = position
+                link.update_time = now
+                changed_links.append(link)
+                changed_schedules.add(schedule_id)
+        summary[schedule_id] = {
+            'distance_before': round(before, 1),
+            'distance_after': round(after, 1),
+            'travel_minutes': round(after / meters_per_minute, 1),
+            'unrouted': len(unrouted),
+        }
+
+    if changed_links:
+        with transaction.atomic():
+            SchedulePOI.objects.bulk_update(changed_links, ['order', 'update_time'], batch_size=500)
+            schedules_changed(changed_schedules)
+    return summary
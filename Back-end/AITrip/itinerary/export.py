@@ -0,0 +1,75 @@
+"""
+Streaming export of itinerary trees
+Rows are read in fixed-size chunks with the nested relations prefetched per
+chunk, so memory stays flat no matter how many itineraries a user owns
+"""
+
+import csv
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import ItinerarySerializer
+
+EXPORT_CHUNK_SIZE = 200
+
+CSV_COLUMNS = (
+    'itinerary_id', 'title', 'itinerary_create_time', 'itinerary_update_time',
+    'schedule_id', 'day_number', 'start_time', 'end_time', 'summary',
+    'poi_id', 'name', 'category', 'location', 'avg_duration', 'opening_hours',
+    'ticket_price', 'rating', 'booking_link',
+)
+
+
+class _Echo:
+    """File-like object whose write() hands the row straight back to the generator"""
+
+    def write(self, value):
+        return value
+
+
+def iter_itineraries(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Iterate serialized itineraries, prefetching the tree one chunk at a time
+    """
+    queryset = ItinerarySerializer.setup_eager_loading(queryset).order_by('pk')
+    for itinerary in queryset.iterator(chunk_size=chunk_size):
+        yield ItinerarySerializer(itinerary).data
+
+
+def stream_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield one JSON document per line for every itinerary
+    """
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for data in iter_itineraries(queryset, chunk_size):
+        yield encoder.encode(data) + '\n'
+
+
+def stream_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield CSV lines with one row per POI (days and itineraries without POIs still get a row)
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for data in iter_itineraries(queryset, chunk_size):
+        itinerary = (
+            data['itinerary_id'], data['title'], data['create_time'], data['update_time'],
+        )
+        schedules = data['daily_schedules'] or [None]
+        for schedule in schedules:
+            if schedule is None:
+                yield writer.writerow(itinerary + ('',) * (len(CSV_COLUMNS) - len(itinerary)))
+                continue
+            day = (
+                schedule['schedule_id'], schedule['day_number'], schedule['start_time'],
+                schedule['end_time'], schedule['summary'],
+            )
+            for poi in schedule['pois'] or [None]:
+                if poi is None:
+                    yield writer.writerow(itinerary + day + ('',) * 9)
+                    continue
+                yield writer.writerow(itinerary + day + (
+                    poi['poi_id'], poi['name'], poi['category'], poi['location'],
+                    poi['avg_duration'], poi['opening_hours'], poi['ticket_price'],
+                    poi['rating'], poi['booking_link'],
+                ))
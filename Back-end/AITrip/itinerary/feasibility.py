@@ -0,0 +1,199 @@
+"""
+Feasibility check of itinerary days
+
+Every day is walked in visiting order: the traveller leaves at the day's
+start_time, moves between stops with coordinates at the routing speed and
+stays avg_duration minutes at every stop. Opening hours come from the
+intervals precompiled on save (POI.opening_intervals), looked up with a
+binary search, so no text is parsed here.
+
+Conflicts:
+    closed_at_arrival   The POI is closed when the traveller arrives; if it
+                        opens later that day the traveller waits for it
+    closes_during_visit The POI closes before the visit ends
+    day_overrun         The last visit ends after the day's end_time
+"""
+
+from bisect import bisect_right
+from datetime import timedelta
+
+from .catalog import get_routing_config
+from .geo import haversine
+from .models import SchedulePOI
+
+DEFAULT_VISIT_MINUTES = 60
+
+ROW_FIELDS = (
+    'schedule__itinerary_id', 'schedule_id', 'schedule__day_number',
+    'schedule__start_time', 'schedule__end_time',
+    'poi_id', 'poi__name', 'poi__avg_duration', 'poi__opening_intervals',
+    'poi__latitude', 'poi__longitude',
+)
+
+
+def format_minutes(minutes):
+    """Minutes since midnight as HH:MM; visits past midnight keep counting hours"""
+    minutes = int(round(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class IntervalIndex:
+    """
+    Opening intervals of one POI, split into sorted starts and ends per weekday
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, intervals):
+        self.starts = [tuple(opens for opens, _ in day) for day in intervals]
+        self.ends = [tuple(closes for _, closes in day) for day in intervals]
+
+    def lookup(self, weekday, minute):
+        """
+        Find the interval containing minute
+
+        Returns:
+            (close, next_open): close of the containing interval or None, and the
+            next opening later that day or None
+        """
+        starts = self.starts[weekday]
+        index = bisect_right(starts, minute) - 1
+        if index >= 0 and minute < self.ends[weekday][index]:
+            return self.ends[weekday][index], None
+        following = index + 1
+        return None, starts[following] if following < len(starts) else None
+
+
+class FeasibilityChecker:
+    """
+    Checks days against opening hours; compiled intervals are kept per POI, so
+    a batch compiles every POI once
+
+    Args:
+        speed_kmh: Travel speed between stops with coordinates
+        default_visit: Minutes spent at POIs without avg_duration
+    """
+
+    def __init__(self, speed_kmh=None, default_visit=DEFAULT_VISIT_MINUTES):
+        if speed_kmh is None:
+            speed_kmh = get_routing_config()['SPEED_KMH']
+        self.meters_per_minute = speed_kmh * 1000 / 60
+        self.default_visit = default_visit
+        self._indexes = {}
+
+    def index_for(self, poi_id, intervals):
+        index = self._indexes.get(poi_id)
+        if index is None and intervals is not None:
+            index = self._indexes[poi_id] = IntervalIndex(intervals)
+        return index
+
+    def check_day(self, weekday, start_time, end_time, stops):
+        """
+        Walk one day and collect its conflicts
+
+        Args:
+            weekday: 0 for Monday
+            start_time, end_time: datetime.time bounds of the day
+            stops: (poi_id, name, avg_duration, opening_intervals, latitude, longitude)
+                tuples in visiting order
+
+        Returns:
+            List of conflict dicts
+        """
+        conflicts = []
+        clock = start_time.hour * 60 + start_time.minute
+        previous = None
+        for poi_id, name, duration, intervals, latitude, longitude in stops:
+            if previous is not None and latitude is not None:
+                clock += haversine(previous[0], previous[1], latitude, longitude) / self.meters_per_minute
+            if latitude is not None:
+                previous = (latitude, longitude)
+
+            arrival = clock
+            stay = duration if duration is not None else self.default_visit
+            index = self.index_for(poi_id, intervals)
+            if index is not None:
+                close, next_open = index.lookup(weekday, arrival)
+                if close is None:
+                    conflict = {
+                        'type': 'closed_at_arrival', 'poi_id': poi_id, 'poi_name': name,
+                        'arrival': format_minutes(arrival),
+                        'opens_at': format_minutes(next_open) if next_open is not None else None,
+                    }
+                    conflicts.append(conflict)
+                    if next_open is not None:
+                        arrival = next_open
+                        close, _ = index.lookup(weekday, arrival)
+                if close is not None and arrival + stay > close:
+                    conflicts.append({
+                        'type': 'closes_during_visit', 'poi_id': poi_id, 'poi_name': name,
+                        'arrival': format_minutes(arrival), 'closes_at': format_minutes(close),
+                    })
+            clock = arrival + stay
+
+        day_end = end_time.hour * 60 + end_time.minute
+        if stops and clock > day_end:
+            conflicts.append({
+                'type': 'day_overrun',
+                'ends_at': format_minutes(clock),
+                'overrun_minutes': int(round(clock - day_end)),
+            })
+        return conflicts
+
+    def check_rows(self, rows, start_date):
+        """
+        Check itineraries from rows of ROW_FIELDS ordered by itinerary, day and visit order
+
+        Args:
+            rows: Iterable of value tuples
+            start_date: Date of day 1 of every itinerary
+
+        Returns:
+            Dict itinerary_id -> list of conflicts (each with day_number and schedule_id)
+        """
+        results = {}
+        day_key = None
+        stops = []
+
+        def flush():
+            itinerary_id, schedule_id, day_number, start_time, end_time = day_key
+            weekday = (start_date + timedelta(days=day_number - 1)).weekday()
+            for conflict in self.check_day(weekday, start_time, end_time, stops):
+                conflict.update(day_number=day_number, schedule_id=schedule_id)
+                results[itinerary_id].append(conflict)
+
+        for row in rows:
+            key = row[:5]
+            if key != day_key:
+                if day_key is not None:
+                    flush()
+                day_key = key
+                stops = []
+                results.setdefault(key[0], [])
+            stops.append(row[5:])
+        if day_key is not None:
+            flush()
+        return results
+
+
+def check_itineraries(itinerary_ids, start_date, checker=None):
+    """
+    Check the given itineraries with a single query
+
+    Returns:
+        List of {'itinerary_id', 'feasible', 'conflicts'} in the order of itinerary_ids
+    """
+    checker = checker or FeasibilityChecker()
+    rows = (
+        SchedulePOI.objects.filter(schedule__itinerary_id__in=itinerary_ids)
+        .order_by('schedule__itinerary_id', 'schedule__day_number', 'schedule_id', 'order', 'pk')
+        .values_list(*ROW_FIELDS)
+    )
+    conflicts = checker.check_rows(rows.iterator(chunk_size=2000), start_date)
+    return [
+        {
+            'itinerary_id': itinerary_id,
+            'feasible': not conflicts.get(itinerary_id),
+            'conflicts': conflicts.get(itinerary_id, []),
+        }
+        for itinerary_id in itinerary_ids
+    ]
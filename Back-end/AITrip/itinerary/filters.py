@@ -0,0 +1,50 @@
+"""
+Filters accepted by the itinerary viewsets
+
+Only index-backed fields and lookups are listed (see utils.filterPlanner);
+the README documents the resulting matrix.
+"""
+
+from utils.filterPlanner import IdFilter, IndexedFilterSet
+from .models import Itinerary, DailySchedule, POI
+
+RANGE_LOOKUPS = ['exact', 'gte', 'lte']
+
+
+class ItineraryFilter(IndexedFilterSet):
+    class Meta:
+        model = Itinerary
+        fields = {
+            'itinerary_id': ['exact', 'in'],
+            'user': ['exact'],
+            'title': ['exact'],
+            'create_time': RANGE_LOOKUPS,
+            'update_time': RANGE_LOOKUPS,
+        }
+
+
+class DailyScheduleFilter(IndexedFilterSet):
+    class Meta:
+        model = DailySchedule
+        fields = {
+            'schedule_id': ['exact', 'in'],
+            'itinerary': ['exact', 'in'],
+            'day_number': RANGE_LOOKUPS,
+            'create_time': RANGE_LOOKUPS,
+            'update_time': RANGE_LOOKUPS,
+        }
+
+
+class POIFilter(IndexedFilterSet):
+    # POIs visited on a day; POI.schedule is the pre-catalog link
+    schedule = IdFilter(field_name='schedule_links__schedule')
+
+    class Meta:
+        model = POI
+        fields = {
+            'poi_id': ['exact', 'in'],
+            'name': ['exact'],
+            'category': ['exact', 'in'],
+            'create_time': RANGE_LOOKUPS,
+            'update_time': RANGE_LOOKUPS,
+        }
@@ -0,0 +1,186 @@
+"""
+Geospatial helpers for POI coordinates
+
+POIs store a geohash of their coordinates in an ordinary indexed column, so a
+radius search becomes a handful of B-tree range scans (one per geohash cell
+around the centre) on MySQL and SQLite alike. The candidates are then refined
+with the exact haversine distance.
+"""
+
+import heapq
+import math
+
+from django.db.models import Q
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Encode coordinates as a geohash string
+
+    Args:
+        latitude: Latitude in degrees (-90..90)
+        longitude: Longitude in degrees (-180..180)
+        precision: Number of characters
+
+    Returns:
+        Geohash of the given length
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            middle = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= middle:
+                value = (value << 1) | 1
+                lng_range[0] = middle
+            else:
+                value <<= 1
+                lng_range[1] = middle
+        else:
+            middle = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= middle:
+                value = (value << 1) | 1
+                lat_range[0] = middle
+            else:
+                value <<= 1
+                lat_range[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """
+    Return the (latitude, longitude) size in degrees of a geohash cell
+    """
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance in meters between two points
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def search_precision(latitude, radius_m):
+    """
+    Longest geohash length whose cells are at least radius_m tall and wide at this latitude,
+    so the 3x3 block of cells around the centre covers the whole circle
+    """
+    # Cells are narrowest on the poleward edge of the circle
+    edge = min(abs(latitude) + radius_m / METERS_PER_DEGREE, 90.0)
+    cos_lat = math.cos(math.radians(edge))
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        lat_size, lng_size = cell_size(candidate)
+        if lat_size * METERS_PER_DEGREE < radius_m or lng_size * METERS_PER_DEGREE * cos_lat < radius_m:
+            break
+        precision = candidate
+    return precision
+
+
+def covering_cells(latitude, longitude, radius_m):
+    """
+    Geohash prefixes whose cells together cover the circle around a point
+
+    Returns:
+        Sorted list of prefixes; an empty list means the radius is too large to
+        narrow the search and every row is a candidate
+    """
+    precision = search_precision(latitude, radius_m)
+    if precision == 0:
+        return []
+
+    lat_size, lng_size = cell_size(precision)
+    # Centre of the cell containing the point
+    lat_center = (math.floor((latitude + 90.0) / lat_size) + 0.5) * lat_size - 90.0
+    lng_center = (math.floor((longitude + 180.0) / lng_size) + 0.5) * lng_size - 180.0
+
+    cells = set()
+    for d_lat in (-1, 0, 1):
+        lat = lat_center + d_lat * lat_size
+        if not -90.0 <= lat <= 90.0:
+            continue
+        for d_lng in (-1, 0, 1):
+            lng = (lng_center + d_lng * lng_size + 180.0) % 360.0 - 180.0
+            cells.add(encode_geohash(lat, lng, precision))
+    return sorted(cells)
+
+
+def cell_range(prefix):
+    """
+    Inclusive lower and exclusive upper bound of the geohashes starting with prefix,
+    for an index range scan that does not depend on LIKE semantics
+
+    The upper bound is the next prefix of the same length in the geohash
+    alphabet (None after 'zz..z'). Both bounds only contain digits and
+    lowercase letters, which sort the same under binary collations and
+    MySQL's default case/accent-insensitive ones; a sentinel such as '{'
+    would sort before the digits in the latter.
+    """
+    chars = list(prefix)
+    while chars:
+        index = GEOHASH_ALPHABET.index(chars[-1])
+        if index + 1 < len(GEOHASH_ALPHABET):
+            chars[-1] = GEOHASH_ALPHABET[index + 1]
+            return prefix, ''.join(chars)
+        chars.pop()
+    return prefix, None
+
+
+def nearby(queryset, latitude, longitude, radius_m, limit=50):
+    """
+    Rows of queryset within radius_m of a point, nearest first
+
+    Candidates come from index range scans on the geohash cells covering the
+    circle and only their ids and coordinates are read; the exact distance
+    is computed here.
+
+    Args:
+        queryset: Queryset of a model with latitude, longitude and geohash fields
+        latitude: Latitude of the centre in degrees
+        longitude: Longitude of the centre in degrees
+        radius_m: Search radius in meters
+        limit: Maximum number of results
+
+    Returns:
+        List of (pk, distance in meters) pairs
+    """
+    cells = covering_cells(latitude, longitude, radius_m)
+    queryset = queryset.filter(geohash__isnull=False)
+    if cells:
+        condition = Q()
+        for prefix in cells:
+            low, high = cell_range(prefix)
+            if high is None:
+                condition |= Q(geohash__gte=low)
+            else:
+                condition |= Q(geohash__gte=low, geohash__lt=high)
+        queryset = queryset.filter(condition)
+
+    matches = []
+    for pk, lat, lng in queryset.order_by().values_list('pk', 'latitude', 'longitude').iterator():
+        distance = haversine(latitude, longitude, lat, lng)
+        if distance <= radius_m:
+            matches.append((pk, distance))
+    return heapq.nsmallest(limit, matches, key=lambda match: (match[1], match[0]))
@@ -0,0 +1,318 @@
+"""
+Run the AITrip microbenchmark suite
+
+The suite runs in a throwaway test database (in memory with SQLite, e.g.
+DB_ENGINE=sqlite) seeded with seed_scale, so it never touches real data and
+every run sees the same rows. It times
+
+    serializer.*   ItinerarySerializer nested serialization of prefetched trees,
+                   and CompiledSerializer rendering the same trees from values() rows
+    pagination.*   KeysetPagination and CustomPagination at several page depths;
+                   depths beyond the last page of the seeded POIs are skipped
+    envelope.*     CustomModelViewSet.finalize_response wrapping and rendering with
+                   EnvelopeJSONRenderer, and the stdlib JSONRenderer for comparison
+    endpoint.*     full requests through the middleware, including login and
+                   registration, each checked against its query budget
+
+Results are appended to the history file and compared with the baseline
+(settings.BENCHMARKS, see utils.benchmark.get_config).
+
+Usage:
+    DB_ENGINE=sqlite python manage.py benchmark [--rounds 10] [--only pagination]
+        [--label "before index"] [--save-baseline] [--fail-on-regression]
+"""
+
+import io
+from itertools import count
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+
+from acounts.models import User
+from acounts.views import UserLoginView, UserRegistrationView
+from itinerary import cache as itinerary_cache
+from itinerary.models import POI, Itinerary
+from itinerary.serializers import ItinerarySerializer
+from itinerary.views import DailyScheduleViewSet, ItineraryViewSet, POIViewSet
+from review.views import ReviewViewSet
+from utils import benchmark
+from utils.compiledSerializer import compile_serializer
+from utils.customPagination import CustomPagination, KeysetPagination
+from utils.queryBudget import get_query_budget
+
+from .seed_scale import SEED_PASSWORD
+
+PAGE_SIZE = 20
+
+
+def serializer_benchmarks(sizes=(1, 20, 100)):
+    compiled = compile_serializer(ItinerarySerializer)
+
+    def setup(size):
+        return lambda: list(ItinerarySerializer.setup_eager_loading(Itinerary.objects.order_by('pk'))[:size])
+
+    def compiled_setup(size):
+        def setup():
+            rows = list(compiled.values(Itinerary.objects.order_by('pk'))[:size])
+            return rows, compiled.fetch(rows)
+        return setup
+
+    benchmarks = []
+    for size in sizes:
+        benchmarks.append(benchmark.Benchmark(
+            f'serializer.itinerary_nested.{size}',
+            lambda itineraries: ItinerarySerializer(itineraries, many=True).data,
+            setup=setup(size),
+            max_queries=0,
+        ))
+        # Like the nested case, the rows of every level are fetched in setup
+        benchmarks.append(benchmark.Benchmark(
+            f'serializer.itinerary_compiled.{size}',
+            lambda fetched: compiled.render(*fetched),
+            setup=compiled_setup(size),
+            max_queries=0,
+        ))
+    return benchmarks
+
+
+def pagination_benchmarks(depths=(1, 10, 100)):
+    factory = APIRequestFactory()
+    queryset = POI.objects.order_by('pk')
+    pages = -(-queryset.count() // PAGE_SIZE)
+    depths = [depth for depth in depths if depth <= pages]
+
+    def keyset_setup(depth):
+        def setup():
+            params = {'page_size': PAGE_SIZE}
+            for _ in range(depth - 1):
+                paginator = KeysetPagination()
+                paginator.paginate_queryset(queryset, Request(factory.get('/', params)))
+                params = {key: values[0] for key, values in parse_qs(urlparse(paginator.get_next_link()).query).items()}
+            return Request(factory.get('/', params))
+        return setup
+
+    def keyset(request):
+        return KeysetPagination().paginate_queryset(queryset, request)
+
+    def page_number(request):
+        return list(CustomPagination().paginate_queryset(queryset, request))
+
+    benchmarks = []
+    for depth in depths:
+        benchmarks.append(benchmark.Benchmark(
+            f'pagination.keyset.depth_{depth}', keyset, setup=keyset_setup(depth), max_queries=1,
+        ))
+        benchmarks.append(benchmark.Benchmark(
+            f'pagination.page_number.depth_{depth}', page_number,
+            setup=lambda depth=depth: Request(factory.get('/', {'page': depth, 'page_size': PAGE_SIZE})),
+            max_queries=2,
+        ))
+    return benchmarks
+
+
+def envelope_benchmarks():
+    def setup():
+        itineraries = ItinerarySerializer.setup_eager_loading(Itinerary.objects.order_by('pk'))[:PAGE_SIZE]
+        payload = {'next': None, 'previous': None, 'results': ItinerarySerializer(itineraries, many=True).data}
+        view = ItineraryViewSet(action_map={'get': 'list'}, action='list', args=(), kwargs={}, format_kwarg=None)
+        request = view.initialize_request(APIRequestFactory().get('/api/itinerary/itineraries/'))
+        request.accepted_renderer, request.accepted_media_type = view.perform_content_negotiation(request)
+        view.request, view.headers, view.validator = request, {}, None
+        return view, request, payload
+
+    def with_envelope(state):
+        view, request, payload = state
+        return view.finalize_response(request, Response(payload)).render()
+
+    def without_envelope(state):
+        view, request, payload = state
+        response = Response({'success': 1, 'msg': 'Operation successful', 'data': payload})
+        return view.finalize_response(request, response).render()
+
+    def stdlib(state):
+        view, request, payload = state
+        return JSONRenderer().render({'success': 1, 'msg': 'Operation successful', 'data': payload})
+
+    return [
+        benchmark.Benchmark('envelope.wrap_and_render', with_envelope, setup=setup, max_queries=0),
+        benchmark.Benchmark('envelope.render_only', without_envelope, setup=setup, max_queries=0),
+        # DRF's stdlib JSONRenderer on the same body, for comparison with EnvelopeJSONRenderer
+        benchmark.Benchmark('envelope.render_stdlib', stdlib, setup=setup, max_queries=0),
+    ]
+
+
+def endpoint_benchmarks(user, auth_rounds=5):
+    client = APIClient()
+    client.force_authenticate(user)
+    itinerary = Itinerary.objects.filter(user=user).order_by('pk').first()
+    poi = POI.objects.exclude(latitude=None).order_by('pk').first()
+
+    def get(url, params=None):
+        def func(_):
+            response = client.get(url, params)
+            assert response.status_code == 200, (url, response.status_code)
+        return func
+
+    endpoints = [
+        ('itinerary_list', ItineraryViewSet, 'list', '/api/itinerary/itineraries/', {'page_size': PAGE_SIZE}),
+        ('itinerary_retrieve', ItineraryViewSet, 'retrieve', f'/api/itinerary/itineraries/{itinerary.pk}/', None),
+        ('daily_schedule_list', DailyScheduleViewSet, 'list', '/api/itinerary/daily-schedules/', {'page_size': PAGE_SIZE}),
+        ('poi_list', POIViewSet, 'list', '/api/itinerary/pois/', {'page_size': PAGE_SIZE}),
+        ('poi_nearby', POIViewSet, 'nearby', '/api/itinerary/pois/nearby/',
+         {'lat': poi.latitude, 'lng': poi.longitude, 'radius': 2000}),
+        ('poi_search', POIViewSet, 'search', '/api/itinerary/pois/search/', {'q': poi.name.split()[0]}),
+        ('review_list', ReviewViewSet, 'list', '/api/review/reviews/', {'page_size': PAGE_SIZE}),
+    ]
+    benchmarks = [
+        benchmark.Benchmark(
+            f'endpoint.{name}', get(url, params), max_queries=get_query_budget(viewset(), action),
+        )
+        for name, viewset, action, url, params in endpoints
+    ]
+
+    anonymous = APIClient()
+
+    def login(_):
+        response = anonymous.post('/auth/login/', {'email': user.email, 'password': SEED_PASSWORD}, format='json')
+        assert response.status_code == 200, response.status_code
+
+    registrations = count()
+
+    def register(_):
+        number = next(registrations)
+        response = anonymous.post('/auth/register/', {
+            'email': f'benchmark_{number}@example.com',
+            'username': f'benchmark_{number}',
+            'first_name': 'Bench',
+            'last_name': 'Mark',
+            'password': SEED_PASSWORD,
+        }, format='json')
+        assert response.status_code == 201, response.status_code
+
+    # Password hashing dominates both, so they get fewer rounds
+    benchmarks.append(benchmark.Benchmark(
+        'endpoint.login', login, rounds=auth_rounds,
+        max_queries=get_query_budget(UserLoginView(), 'post'),
+    ))
+    benchmarks.append(benchmark.Benchmark(
+        'endpoint.register', register, rounds=auth_rounds,
+        max_queries=get_query_budget(UserRegistrationView(), 'post'),
+    ))
+    return benchmarks
+
+
+def build_suite(depths=(1, 10, 100), sizes=(1, 20, 100), auth_rounds=5):
+    """
+    All benchmarks over the data currently in the database
+
+    Benchmarks requests as the seeded user owning the most itineraries.
+    """
+    user = (
+        User.objects.annotate(itinerary_count=Count('itineraries'))
+        .order_by('-itinerary_count', 'pk').first()
+    )
+    if user is None or not Itinerary.objects.exists() or not POI.objects.exists():
+        raise CommandError('The benchmark suite needs seeded users, itineraries and POIs')
+    return [
+        *serializer_benchmarks(sizes),
+        *pagination_benchmarks(depths),
+        *envelope_benchmarks(),
+        *endpoint_benchmarks(user, auth_rounds),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Run the microbenchmark suite against a seeded test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=10, help='Timed rounds per benchmark')
+        parser.add_argument('--only', help='Run the benchmarks whose name contains this text')
+        parser.add_argument('--label', help='Description stored with the run')
+        parser.add_argument('--users', type=int, default=200, help='Seeded users')
+        parser.add_argument('--pois', type=int, default=20000, help='Seeded POIs')
+        parser.add_argument('--itineraries', type=int, default=2000, help='Seeded itineraries')
+        parser.add_argument('--reviews', type=int, default=5000, help='Seeded reviews')
+        parser.add_argument('--seed', type=int, default=42, help='Seed of the generated data')
+        parser.add_argument('--history', help='History file (default settings.BENCHMARKS["HISTORY"])')
+        parser.add_argument('--baseline', help='Baseline file (default settings.BENCHMARKS["BASELINE"])')
+        parser.add_argument('--save-baseline', action='store_true', help='Make this run the baseline')
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Exit with an error when a benchmark regressed against the baseline'
+        )
+
+    def handle(self, *args, **options):
+        config = benchmark.get_config()
+        history = options['history'] or config['HISTORY']
+        baseline_path = options['baseline'] or config['BASELINE']
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(INSTRUMENTATION={'ENABLED': False}):
+                self.stdout.write(f"Seeding {connection.vendor} test database...")
+                call_command(
+                    'seed_scale', users=options['users'], pois=options['pois'],
+                    itineraries=options['itineraries'], reviews=options['reviews'],
+                    seed=options['seed'], stdout=io.StringIO(),
+                )
+                itinerary_cache.get_cache().clear()
+                run = benchmark.run_benchmarks(
+                    build_suite(), rounds=options['rounds'], label=options['label'],
+                    only=options['only'], report=self.report,
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        run['dataset'] = {key: options[key] for key in ('users', 'pois', 'itineraries', 'reviews', 'seed')}
+        benchmark.append_history(run, history)
+        self.stdout.write(f"Appended the run to {history}")
+
+        baseline = benchmark.load_baseline(baseline_path)
+        comparison = benchmark.compare(run, baseline, config['TOLERANCE'])
+        if baseline is not None:
+            self.write_comparison(comparison, baseline)
+        if options['save_baseline']:
+            benchmark.save_baseline(run, baseline_path)
+            self.stdout.write(f"Saved the run as the baseline in {baseline_path}")
+
+        violations = benchmark.budget_violations(run)
+        if violations:
+            raise CommandError(f"Query budget exceeded: {', '.join(violations)}")
+        regressions = [row['name'] for row in comparison if row['status'] == 'regression']
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"Regressed against the baseline: {', '.join(regressions)}")
+
+    def report(self, name, result):
+        budget = result['max_queries']
+        queries = f"{result['queries']}/{budget}" if budget is not None else str(result['queries'])
+        line = (
+            f"{name:<42} median {result['median_ms']:>10.3f} ms  p95 {result['p95_ms']:>10.3f} ms  "
+            f"{result['ops_per_s'] or 0:>10.1f} ops/s  queries {queries}"
+        )
+        if budget is not None and result['queries'] > budget:
+            line = self.style.ERROR(line)
+        self.stdout.write(line)
+
+    def write_comparison(self, comparison, baseline):
+        self.stdout.write(f"\nCompared with the baseline of {baseline['timestamp']} ({baseline.get('commit')}):")
+        styles = {'regression': self.style.ERROR, 'improvement': self.style.SUCCESS}
+        for row in comparison:
+            if row['status'] == 'new':
+                self.stdout.write(f"{row['name']:<42} new")
+                continue
+            change = f"{row['change']:+.1%}" if row['change'] is not None else 'n/a'
+            line = (
+                f"{row['name']:<42} {row['baseline_ms']:>10.3f} -> {row['current_ms']:>10.3f} ms "
+                f"({change}), queries {row['baseline_queries']} -> {row['queries']}  {row['status']}"
+            )
+            self.stdout.write(styles.get(row['status'], str)(line))
@@ -0,0 +1,146 @@
+"""
+Move pre-catalog POI rows into the shared catalog
+
+Before the catalog every POI row belonged to exactly one daily schedule
+through POI.schedule. This command walks those rows in primary key batches,
+keeps the first row of every (name, location) as the catalog entry, links
+each schedule to its catalog entry through SchedulePOI, points foreign keys
+such as Review.poi at the catalog entry and deletes the duplicates.
+
+Usage:
+    python manage.py dedup_pois [--batch-size 1000] [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+
+from itinerary.models import POI, SchedulePOI, make_catalog_key
+
+
+class Command(BaseCommand):
+    help = 'Deduplicate legacy POI rows into the shared POI catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of legacy POI rows handled per transaction'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would change without writing'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        totals = {'rows': 0, 'catalog': 0, 'duplicates': 0, 'links': 0}
+        dry_run_catalog = {}
+
+        last_pk = 0
+        while True:
+            batch = list(
+                POI.objects.filter(schedule__isnull=False, pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', 'name', 'location', 'schedule_id', 'catalog_key')[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            if dry_run:
+                stats = self.plan_batch(batch, dry_run_catalog)[-1]
+            else:
+                with transaction.atomic():
+                    stats = self.migrate_batch(batch)
+            for key, value in stats.items():
+                totals[key] += value
+            self.stdout.write(
+                f"Processed {totals['rows']} rows "
+                f"({totals['catalog']} catalog entries, {totals['duplicates']} duplicates)"
+            )
+
+        prefix = '[dry run] ' if dry_run else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{totals['rows']} legacy rows -> {totals['catalog']} new catalog entries, "
+            f"{totals['duplicates']} duplicates removed, {totals['links']} schedule links"
+        ))
+
+    def plan_batch(self, batch, known=None):
+        """
+        Decide the catalog entry of every row in the batch
+
+        Returns:
+            (canonical, duplicates, links, stats) where canonical are the rows
+            that become catalog entries, duplicates maps duplicate pk -> catalog
+            pk and links are (schedule_id, catalog_pk, order) tuples
+        """
+        keys = {poi.pk: make_catalog_key(poi.name, poi.location) for poi in batch}
+        catalog = dict(
+            POI.objects.filter(catalog_key__in=set(keys.values()), schedule__isnull=True)
+            .values_list('catalog_key', 'pk')
+        )
+        if known is not None:
+            catalog.update(known)
+
+        canonical, duplicates, links = [], {}, []
+        for poi in batch:
+            key = keys[poi.pk]
+            target = catalog.get(key)
+            if target is None or target == poi.pk:
+                poi.catalog_key = key
+                canonical.append(poi)
+                catalog[key] = target = poi.pk
+            else:
+                duplicates[poi.pk] = target
+            # Legacy rows had no explicit order; their ids preserve creation order
+            links.append((poi.schedule_id, target, poi.pk))
+
+        if known is not None:
+            known.update(catalog)
+        stats = {
+            'rows': len(batch),
+            'catalog': len(canonical),
+            'duplicates': len(duplicates),
+            'links': len(links),
+        }
+        return canonical, duplicates, links, stats
+
+    def migrate_batch(self, batch):
+        canonical, duplicates, links, stats = self.plan_batch(batch)
+
+        # Free the unique keys held by duplicates before claiming them
+        if duplicates:
+            POI.objects.filter(pk__in=duplicates).update(catalog_key=None)
+        for poi in canonical:
+            poi.schedule = None
+        POI.objects.bulk_update(canonical, ['catalog_key', 'schedule'], batch_size=500)
+
+        SchedulePOI.objects.bulk_create(
+            [SchedulePOI(schedule_id=schedule_id, poi_id=poi_id, order=order)
+             for schedule_id, poi_id, order in links],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+        if duplicates:
+            self.repoint_references(duplicates)
+            POI.objects.filter(pk__in=duplicates).delete()
+        return stats
+
+    @staticmethod
+    def repoint_references(duplicates):
+        """
+        Point every foreign key to a duplicate (e.g. Review.poi) at its catalog entry
+        """
+        by_target = {}
+        for duplicate, target in duplicates.items():
+            by_target.setdefault(target, []).append(duplicate)
+
+        for relation in POI._meta.related_objects:
+            if not relation.one_to_many or relation.related_model is SchedulePOI:
+                continue
+            manager = relation.related_model._base_manager
+            for target, sources in by_target.items():
+                manager.filter(**{f'{relation.field.name}__in': sources}).update(
+                    **{relation.field.name: target}
+                )
@@ -0,0 +1,49 @@
+"""
+Parse POI.opening_hours into POI.opening_intervals again
+
+Needed after POIs were written without save() (raw SQL, bulk loads,
+QuerySet.update()) and after itinerary/hours.py learns new forms; migration
+0004 parsed the POIs that existed before it with the parser of that time.
+
+Usage:
+    python manage.py rebuild_opening_hours [--batch-size 1000] [--missing-only]
+"""
+
+from django.core.management.base import BaseCommand
+
+from itinerary.hours import parse_opening_hours
+from itinerary.models import POI
+
+
+class Command(BaseCommand):
+    help = 'Parse the opening hours of every POI into opening intervals'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of POIs updated per query'
+        )
+        parser.add_argument(
+            '--missing-only', action='store_true',
+            help='Only POIs with opening hours but no intervals yet'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = POI.objects.exclude(opening_hours='')
+        if options['missing_only']:
+            queryset = queryset.filter(opening_intervals__isnull=True)
+
+        count = 0
+        batch = []
+        for poi in queryset.only('pk', 'opening_hours').iterator(chunk_size=batch_size):
+            poi.opening_intervals = parse_opening_hours(poi.opening_hours)
+            batch.append(poi)
+            if len(batch) == batch_size:
+                POI.objects.bulk_update(batch, ['opening_intervals'])
+                count += len(batch)
+                batch = []
+        if batch:
+            POI.objects.bulk_update(batch, ['opening_intervals'])
+            count += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Parsed the opening hours of {count} POIs"))
@@ -0,0 +1,28 @@
+"""
+Rebuild the POI search token index from scratch
+
+Needed after POIs were written without signals (raw SQL, bulk loads). On
+MySQL only the words its FULLTEXT index leaves out are stored, and the index
+itself is maintained by the database.
+
+Usage:
+    python manage.py rebuild_search_index [--batch-size 1000]
+"""
+
+from django.core.management.base import BaseCommand
+
+from itinerary.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the POI search token index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of POIs indexed per batch'
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} POIs"))
@@ -0,0 +1,443 @@
+"""
+Fill the database with synthetic users, POIs, itineraries and reviews
+
+Data is generated in chunks; every chunk draws from its own random generator
+seeded with (seed, table, chunk number), so the same options produce the same
+data whatever the number of workers. Primary keys are assigned up front from
+the current maximum of every table, which lets chunks reference each other
+without reading ids back (MySQL does not return them from bulk inserts).
+
+Chunks are turned into rows of database-ready values (including the derived
+POI columns and search tokens) and inserted with executemany, one transaction
+per chunk. With --workers > 1 the rows are generated in forked worker
+processes while the main process inserts them; inserts stay on a single
+connection so SQLite, which allows one writer, works as well as MySQL.
+
+Distributions:
+    POIs        spread over CITIES by weight, coordinates scattered around
+                the city centre, realistic opening hours, ratings and prices
+    itineraries owners and POIs drawn with a popularity skew (--skew), all
+                stops of an itinerary in one city
+    reviews     categories by REVIEW_CATEGORY_WEIGHTS
+
+Usage:
+    python manage.py seed_scale --users 10000 --pois 1000000 --itineraries 50000 \\
+        --reviews 200000 [--seed 42] [--workers 4] [--batch-size 5000] [--no-search-index]
+    DB_ENGINE=sqlite python manage.py seed_scale ...
+"""
+
+import hashlib
+import multiprocessing
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import time as dt_time
+from decimal import Decimal
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import Max
+
+from itinerary.models import POI, DailySchedule, Itinerary, POISearchToken, SchedulePOI
+from itinerary.search import build_tokens
+from review.models import Review
+
+# name, latitude, longitude, weight
+CITIES = [
+    ('Paris', 48.8566, 2.3522, 10),
+    ('Tokyo', 35.6762, 139.6503, 9),
+    ('New York', 40.7128, -74.0060, 9),
+    ('London', 51.5074, -0.1278, 8),
+    ('Rome', 41.9028, 12.4964, 7),
+    ('Barcelona', 41.3874, 2.1686, 6),
+    ('Beijing', 39.9042, 116.4074, 6),
+    ('Bangkok', 13.7563, 100.5018, 5),
+    ('Kyoto', 35.0116, 135.7681, 4),
+    ('Sydney', -33.8688, 151.2093, 4),
+]
+
+# category: (place nouns, visit durations in minutes, ticket prices)
+CATEGORIES = {
+    'Museum': (['Museum', 'History Museum', 'Science Center'], [90, 120, 180], ['$12', '$18', '$25', 'Free']),
+    'Park': (['Park', 'Gardens', 'Botanical Garden'], [45, 60, 90], ['Free']),
+    'Restaurant': (['Bistro', 'Kitchen', 'Noodle House', 'Grill'], [60, 90], ['$$', '$$$']),
+    'Landmark': (['Tower', 'Bridge', 'Palace', 'Square'], [30, 45, 60], ['Free', '$15', '$20']),
+    'Gallery': (['Gallery', 'Art Space'], [60, 90], ['$10', 'Free']),
+    'Market': (['Market', 'Bazaar', 'Food Hall'], [45, 60, 90], ['Free']),
+    'Temple': (['Temple', 'Shrine', 'Cathedral'], [30, 45, 60], ['Free', '$5']),
+    'Viewpoint': (['Lookout', 'Observation Deck', 'Hill'], [30, 45], ['Free', '$22']),
+    'Theatre': (['Theatre', 'Opera House', 'Concert Hall'], [120, 150], ['$40', '$65', '$90']),
+}
+CATEGORY_WEIGHTS = [14, 12, 20, 14, 6, 8, 8, 6, 4]
+
+ADJECTIVES = [
+    'Old', 'Royal', 'Grand', 'Hidden', 'Golden', 'Riverside', 'Central', 'Harbour',
+    'Silent', 'Imperial', 'Little', 'Modern', 'Ancient', 'Sunset', 'Northern', 'Jade',
+]
+STREETS = ['Market', 'Station', 'River', 'Garden', 'Church', 'Castle', 'King', 'Park', 'Mill', 'Bridge']
+DESCRIPTION_WORDS = [
+    'historic', 'quiet', 'busy', 'local', 'famous', 'views', 'architecture', 'collection',
+    'family', 'friendly', 'street', 'food', 'evening', 'lights', 'walk', 'tour', 'art',
+    'culture', 'garden', 'river', 'crowded', 'weekend', 'photography', 'traditional',
+]
+
+# Opening hours as people write them; None leaves the POI without hours
+OPENING_HOURS = [
+    ('Mon-Sun 09:00-17:00', 10), ('Tue-Sun 10:00-18:00; Mon closed', 6), ('24/7', 4),
+    ('Mon-Fri 09:00-17:00; Sat-Sun 10:00-16:00', 6), ('11:00-14:30, 17:30-22:00', 6),
+    ('Mon-Sat 10:00-20:00; Sun closed', 4), ('9am-6pm', 4), ('18:00-02:00', 2),
+    ('Wed-Mon 10:00-17:00; Tue closed', 3), (None, 5),
+]
+
+FIRST_NAMES = ['Alex', 'Sam', 'Jordan', 'Taylor', 'Li', 'Wei', 'Yuki', 'Maria', 'Omar', 'Priya', 'Noah', 'Emma']
+LAST_NAMES = ['Smith', 'Chen', 'Garcia', 'Sato', 'Muller', 'Rossi', 'Kim', 'Ng', 'Silva', 'Novak']
+
+REVIEW_CATEGORY_WEIGHTS = {'poi': 50, 'itinerary': 40, 'daily_schedule': 10}
+REVIEW_TEXTS = [
+    'Loved it, would come back.', 'Too crowded in the afternoon.', 'Great value for the price.',
+    'The schedule was a bit tight.', 'Perfect pace for a family trip.', 'Skip it if it rains.',
+    'Hidden gem, go early.', 'Staff were very friendly.', 'Overrated but worth a look.',
+]
+
+SEED_PASSWORD = 'seed-password-123'
+
+
+def chunk_rng(seed, table, chunk):
+    """Random generator of one chunk; independent of the chunks around it"""
+    return random.Random(f'{seed}:{table}:{chunk}')
+
+
+def skewed_index(rng, count, skew):
+    """Index in [0, count) where low indexes are drawn more often the higher skew is"""
+    return min(int(count * rng.random() ** skew), count - 1)
+
+
+def city_blocks(poi_count):
+    """
+    Split POI indexes into one contiguous block per city, sized by weight
+
+    Returns:
+        List of (start, stop) index ranges, one per entry of CITIES
+    """
+    total_weight = sum(city[3] for city in CITIES)
+    blocks, start = [], 0
+    for position, city in enumerate(CITIES):
+        if position == len(CITIES) - 1:
+            stop = poi_count
+        else:
+            stop = start + poi_count * city[3] // total_weight
+        blocks.append((start, stop))
+        start = stop
+    return blocks
+
+
+def itinerary_days(seed, chunk, count, days_range):
+    """
+    Days of every itinerary of a chunk; drawn apart from the rest of the chunk
+    so the main process can number the daily schedules before generating them
+    """
+    rng = chunk_rng(seed, 'days', chunk)
+    return [rng.randint(*days_range) for _ in range(count)]
+
+
+def insert_fields(model, names=None):
+    """Fields written by the INSERT of a model: the named ones or every non-pk column"""
+    if names is not None:
+        return [model._meta.get_field(name) for name in names]
+    return [field for field in model._meta.concrete_fields if not field.primary_key]
+
+
+def table(model, instances, names=None):
+    """
+    Convert instances into (model, field names, rows) with database-ready values
+
+    Does what bulk_create does per row (auto_now stamps, value adaptation), so
+    the main process only has to send the rows.
+    """
+    fields = insert_fields(model, names)
+    # The connection proxy costs a thread-local lookup per access; resolve it once
+    database = connections[DEFAULT_DB_ALIAS]
+    rows = [
+        tuple(field.get_db_prep_save(field.pre_save(instance, True), database) for field in fields)
+        for instance in instances
+    ]
+    return model, [field.name for field in fields], rows
+
+
+def generate_users(task):
+    seed, chunk, first_pk, count, password = task
+    rng = chunk_rng(seed, 'users', chunk)
+    User = get_user_model()
+    users = []
+    for pk in range(first_pk, first_pk + count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        users.append(User(
+            pk=pk,
+            username=f'seed_{pk}',
+            email=f'seed_{pk}@example.com',
+            first_name=first_name,
+            last_name=last_name,
+            password=password,
+        ))
+    return [table(User, users, ['id', *(field.name for field in insert_fields(User))])]
+
+
+def generate_pois(task):
+    seed, chunk, first_pk, first_index, count, blocks, with_tokens = task
+    rng = chunk_rng(seed, 'pois', chunk)
+    categories = list(CATEGORIES)
+    hours, hour_weights = zip(*OPENING_HOURS)
+    pois, tokens = [], []
+    city_position = 0
+    for offset in range(count):
+        index = first_index + offset
+        while index >= blocks[city_position][1]:
+            city_position += 1
+        city, center_lat, center_lng, _ = CITIES[city_position]
+        category = rng.choices(categories, CATEGORY_WEIGHTS)[0]
+        nouns, durations, prices = CATEGORIES[category]
+        pk = first_pk + offset
+        poi = POI(
+            pk=pk,
+            name=f'{rng.choice(ADJECTIVES)} {rng.choice(STREETS)} {rng.choice(nouns)}',
+            category=category,
+            description=' '.join(rng.sample(DESCRIPTION_WORDS, rng.randint(4, 10))).capitalize() + '.',
+            # The house number keeps (name, location), and so catalog_key, unique
+            location=f'{pk} {rng.choice(STREETS)} Street, {city}',
+            latitude=round(center_lat + rng.gauss(0, 0.04), 6),
+            longitude=round(center_lng + rng.gauss(0, 0.05), 6),
+            target_audience=rng.choice(['Everyone', 'Families', 'Couples', 'Students', 'Seniors']),
+            avg_duration=rng.choice(durations),
+            opening_hours=rng.choices(hours, hour_weights)[0] or '',
+            ticket_price=rng.choice(prices),
+            review_summary=' '.join(rng.sample(DESCRIPTION_WORDS, 3)),
+            review_source=rng.choice(['Google', 'TripAdvisor', 'Yelp']),
+            rating=Decimal(f'{rng.triangular(2.5, 5.0, 4.3):.1f}'),
+        )
+        poi.set_derived_fields()
+        pois.append(poi)
+        if with_tokens:
+            tokens.extend((token, pk, weight) for token, weight in build_tokens(poi).items())
+    tables = [table(POI, pois, ['poi_id', *(field.name for field in insert_fields(POI))])]
+    if with_tokens:
+        tables.append((POISearchToken, ['token', 'poi', 'weight'], tokens))
+    return tables
+
+
+def generate_itineraries(task):
+    (seed, chunk, first_pk, count, schedule_first_pk, user_first_pk, user_count, poi_first_pk,
+     blocks, days_range, stops_range, skew) = task
+    rng = chunk_rng(seed, 'itineraries', chunk)
+    city_weights = [city[3] for city in CITIES]
+    itineraries, schedules, links = [], [], []
+    schedule_pk = schedule_first_pk
+    for pk, days in zip(range(first_pk, first_pk + count), itinerary_days(seed, chunk, count, days_range)):
+        city_position = rng.choices(range(len(CITIES)), city_weights)[0]
+        city = CITIES[city_position][0]
+        start, stop = blocks[city_position]
+        itineraries.append(Itinerary(
+            pk=pk,
+            user_id=user_first_pk + skewed_index(rng, user_count, skew),
+            title=f'{days}-day trip to {city}',
+        ))
+        for day in range(1, days + 1):
+            schedules.append(DailySchedule(
+                pk=schedule_pk,
+                itinerary_id=pk,
+                day_number=day,
+                start_time=dt_time(rng.randint(8, 10), rng.choice([0, 30])),
+                end_time=dt_time(rng.randint(17, 21), rng.choice([0, 30])),
+                summary=f'Day {day} in {city}',
+            ))
+            stops = {}
+            wanted = min(rng.randint(*stops_range), stop - start)
+            while len(stops) < wanted:
+                stops.setdefault(poi_first_pk + start + skewed_index(rng, stop - start, skew), len(stops))
+            links.extend(
+                SchedulePOI(schedule_id=schedule_pk, poi_id=poi_id, order=order)
+                for poi_id, order in stops.items()
+            )
+            schedule_pk += 1
+    return [
+        table(Itinerary, itineraries, ['itinerary_id', *(field.name for field in insert_fields(Itinerary))]),
+        table(DailySchedule, schedules, ['schedule_id', *(field.name for field in insert_fields(DailySchedule))]),
+        table(SchedulePOI, links),
+    ]
+
+
+def generate_reviews(task):
+    (seed, chunk, count, user_first_pk, user_count, itinerary_first_pk, itinerary_count,
+     poi_first_pk, poi_count, skew) = task
+    rng = chunk_rng(seed, 'reviews', chunk)
+    categories, weights = zip(*REVIEW_CATEGORY_WEIGHTS.items())
+    reviews = []
+    for _ in range(count):
+        category = rng.choices(categories, weights)[0]
+        if category == 'poi' and poi_count:
+            targets = {'poi_id': poi_first_pk + skewed_index(rng, poi_count, skew)}
+        elif itinerary_count:
+            targets = {'itinerary_id': itinerary_first_pk + skewed_index(rng, itinerary_count, skew)}
+        else:
+            continue
+        reviews.append(Review(
+            user_id=user_first_pk + rng.randrange(user_count),
+            category=category,
+            feedback_text=rng.choice(REVIEW_TEXTS),
+            **targets,
+        ))
+    return [table(Review, reviews)]
+
+
+def run_tasks(function, tasks, workers):
+    """
+    Yield function(task) for every task, in order
+
+    With more than one worker the tasks run in forked processes, at most two
+    per worker ahead of the consumer so memory stays bounded. Workers inherit
+    the configured Django apps and never touch the database.
+    """
+    if workers <= 1:
+        yield from map(function, tasks)
+        return
+    tasks = iter(tasks)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        pending = deque(pool.submit(function, task) for task in islice(tasks, workers * 2))
+        while pending:
+            result = pending.popleft().result()
+            pending.extend(pool.submit(function, task) for task in islice(tasks, 1))
+            yield result
+
+
+def next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def parse_range(value):
+    low, _, high = value.partition(':')
+    try:
+        low, high = int(low), int(high or low)
+    except ValueError:
+        raise CommandError(f"Expected MIN:MAX, got '{value}'")
+    if low < 1 or high < low:
+        raise CommandError(f"Invalid range '{value}'")
+    return low, high
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, POIs, itineraries and reviews at scale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Users to create')
+        parser.add_argument('--pois', type=int, default=10000, help='POIs to create')
+        parser.add_argument('--itineraries', type=int, default=2000, help='Itineraries to create')
+        parser.add_argument('--reviews', type=int, default=5000, help='Reviews to create')
+        parser.add_argument('--days', default='1:7', help='Days per itinerary, MIN:MAX')
+        parser.add_argument('--stops', default='2:6', help='POIs per day, MIN:MAX')
+        parser.add_argument(
+            '--skew', type=float, default=2.0,
+            help='Popularity skew of POIs and itinerary owners; 1 is uniform'
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows generated per task')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per executemany call')
+        parser.add_argument('--workers', type=int, default=1, help='Processes generating rows')
+        parser.add_argument(
+            '--no-search-index', action='store_true',
+            help='Skip POI search tokens (run rebuild_search_index later)'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.workers = options['workers']
+        seed, chunk_size, skew = options['seed'], options['chunk_size'], options['skew']
+        days_range, stops_range = parse_range(options['days']), parse_range(options['stops'])
+        if options['itineraries'] and not (options['users'] and options['pois']):
+            raise CommandError('Itineraries need at least one user and one POI')
+        if options['reviews'] and not options['users']:
+            raise CommandError('Reviews need at least one user')
+        if chunk_size < 1 or skew < 1:
+            raise CommandError('--chunk-size and --skew must be at least 1')
+
+        User = get_user_model()
+        user_first_pk, poi_first_pk = next_pk(User), next_pk(POI)
+        itinerary_first_pk, schedule_first_pk = next_pk(Itinerary), next_pk(DailySchedule)
+        blocks = city_blocks(options['pois'])
+
+        def chunks(total):
+            return [(chunk, chunk * chunk_size, min(chunk_size, total - chunk * chunk_size))
+                    for chunk in range((total + chunk_size - 1) // chunk_size)]
+
+        # One hash for every seeded user: hashing a million passwords would take hours.
+        # The salt is long enough that logging in does not rehash the password.
+        password = make_password(SEED_PASSWORD, salt=hashlib.sha256(f'seed{seed}'.encode()).hexdigest()[:24])
+        self.load('users', generate_users, [
+            (seed, chunk, user_first_pk + start, count, password)
+            for chunk, start, count in chunks(options['users'])
+        ])
+
+        with_tokens = not options['no_search_index']
+        self.load('POIs', generate_pois, [
+            (seed, chunk, poi_first_pk + start, start, count, blocks, with_tokens)
+            for chunk, start, count in chunks(options['pois'])
+        ])
+
+        itinerary_tasks = []
+        for chunk, start, count in chunks(options['itineraries']):
+            itinerary_tasks.append((
+                seed, chunk, itinerary_first_pk + start, count, schedule_first_pk,
+                user_first_pk, options['users'], poi_first_pk, blocks, days_range, stops_range, skew,
+            ))
+            schedule_first_pk += sum(itinerary_days(seed, chunk, count, days_range))
+        self.load('itineraries', generate_itineraries, itinerary_tasks)
+
+        self.load('reviews', generate_reviews, [
+            (seed, chunk, count, user_first_pk, options['users'], itinerary_first_pk,
+             options['itineraries'], poi_first_pk, options['pois'], skew)
+            for chunk, _, count in chunks(options['reviews'])
+        ])
+
+        # Explicit primary keys bypass sequences on PostgreSQL; a no-op elsewhere
+        statements = connection.ops.sequence_reset_sql(no_style(), [User, POI, Itinerary, DailySchedule])
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded with seed {seed}; seeded users log in with password '{SEED_PASSWORD}'"
+        ))
+
+    def load(self, label, generate, tasks):
+        """Generate the chunks of one kind of data and insert them, one transaction per chunk"""
+        started = time.perf_counter()
+        counts = {}
+        for tables in run_tasks(generate, tasks, self.workers):
+            with transaction.atomic():
+                for model, names, rows in tables:
+                    self.insert(model, names, rows)
+                    counts[model._meta.db_table] = counts.get(model._meta.db_table, 0) + len(rows)
+        if tasks:
+            elapsed = time.perf_counter() - started
+            summary = ', '.join(f'{count} {db_table}' for db_table, count in counts.items())
+            self.stdout.write(f"{label}: {summary} in {elapsed:.1f}s")
+
+    def insert(self, model, names, rows):
+        """
+        INSERT prepared rows with executemany; skips the per-object work of
+        bulk_create, which dominates at this scale
+        """
+        quote = connection.ops.quote_name
+        columns = [model._meta.get_field(name).column for name in names]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            quote(model._meta.db_table),
+            ', '.join(quote(column) for column in columns),
+            ', '.join(['%s'] * len(columns)),
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, rows[start:start + self.batch_size])
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 16:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itinerary', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poi',
+            name='catalog_key',
+            field=models.CharField(editable=False, help_text='Hash of the normalized name and location', max_length=40, null=True, unique=True, verbose_name='Catalog Key'),
+        ),
+        migrations.AlterField(
+            model_name='poi',
+            name='schedule',
+            field=models.ForeignKey(blank=True, help_text='Pre-catalog schedule link, cleared by the dedup_pois command', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='legacy_pois', to='itinerary.dailyschedule', verbose_name='Legacy Daily Schedule'),
+        ),
+        migrations.CreateModel(
+            name='SchedulePOI',
+            fields=[
+                ('schedule_poi_id', models.AutoField(primary_key=True, serialize=False)),
+                ('order', models.PositiveIntegerField(default=0, help_text='Visit order within the day', verbose_name='Order')),
+                ('create_time', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Create Time')),
+                ('update_time', models.DateTimeField(auto_now=True, db_index=True, verbose_name='Update Time')),
+                ('poi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule_links', to='itinerary.poi', verbose_name='POI')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='poi_links', to='itinerary.dailyschedule', verbose_name='Daily Schedule')),
+            ],
+            options={
+                'verbose_name': 'Schedule POI',
+                'verbose_name_plural': 'Schedule POIs',
+                'db_table': 'schedule_poi',
+            },
+        ),
+        migrations.AddField(
+            model_name='dailyschedule',
+            name='pois',
+            field=models.ManyToManyField(blank=True, related_name='schedules', through='itinerary.SchedulePOI', to='itinerary.poi', verbose_name='POIs'),
+        ),
+        migrations.AddIndex(
+            model_name='schedulepoi',
+            index=models.Index(fields=['schedule', 'order'], name='schedule_po_schedul_c5eb07_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='schedulepoi',
+            constraint=models.UniqueConstraint(fields=('schedule', 'poi'), name='schedule_poi_unique'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-18 16:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itinerary', '0002_poi_catalog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poi',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, help_text='Geohash of the coordinates, used by the nearby search', max_length=12, null=True, verbose_name='Geohash'),
+        ),
+        migrations.AddField(
+            model_name='poi',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90.0), django.core.validators.MaxValueValidator(90.0)], verbose_name='Latitude'),
+        ),
+        migrations.AddField(
+            model_name='poi',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180.0), django.core.validators.MaxValueValidator(180.0)], verbose_name='Longitude'),
+        ),
+        migrations.AddIndex(
+            model_name='poi',
+            index=models.Index(fields=['geohash', 'latitude', 'longitude'], name='poi_geohash_740323_idx'),
+        ),
+    ]
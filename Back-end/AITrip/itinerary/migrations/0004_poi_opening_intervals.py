@@ -0,0 +1,171 @@
+# Generated by Django 5.2 on 2026-10-18 16:17
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of itinerary/hours.py as of this migration, so later changes to
+# the live parser don't change what it does. rebuild_opening_hours re-parses
+# with the current parser.
+
+MINUTES_PER_DAY = 1440
+
+DAY_NAMES = {
+    'mo': 0, 'mon': 0, 'monday': 0,
+    'tu': 1, 'tue': 1, 'tues': 1, 'tuesday': 1,
+    'we': 2, 'wed': 2, 'wednesday': 2,
+    'th': 3, 'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3,
+    'fr': 4, 'fri': 4, 'friday': 4,
+    'sa': 5, 'sat': 5, 'saturday': 5,
+    'su': 6, 'sun': 6, 'sunday': 6,
+}
+
+_DAY = r'(?:' + '|'.join(sorted(DAY_NAMES, key=len, reverse=True)) + r')\.?'
+_DAY_SPEC = re.compile(
+    rf'^\s*((?:{_DAY})(?:\s*-\s*{_DAY})?(?:\s*[,&/]\s*{_DAY}(?:\s*-\s*{_DAY})?)*)(?![a-z])\s*:?\s*(.*)$'
+)
+_DAY_TOKEN = re.compile(rf'({_DAY})(?:\s*-\s*({_DAY}))?')
+_TIME = r'(\d{1,2})(?:[:.h](\d{2}))?\s*(am|pm)?'
+_RANGE = re.compile(rf'{_TIME}\s*-\s*{_TIME}')
+_ALWAYS_OPEN = re.compile(r'^(24\s*/\s*7|open\s+24\s*(hours|hrs|h)|24\s*(hours|hrs|h))$')
+_CLOSED = re.compile(r'^(closed|off|close)$')
+_EVERY_DAY = re.compile(r'^(daily|every\s*day|everyday|all\s*week)\s*:?\s*')
+
+
+def _day_number(token):
+    return DAY_NAMES[token.rstrip('.')]
+
+
+def _parse_days(spec):
+    days = set()
+    for start, end in _DAY_TOKEN.findall(spec):
+        first = _day_number(start)
+        last = _day_number(end) if end else first
+        day = first
+        days.add(day)
+        while day != last:
+            day = (day + 1) % 7
+            days.add(day)
+    return days
+
+
+def _minutes(hour, minute, meridiem):
+    hour = int(hour)
+    minute = int(minute or 0)
+    if meridiem == 'pm' and hour < 12:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    if hour > 24 or minute > 59:
+        raise ValueError('time out of range')
+    return hour * 60 + minute
+
+
+def _parse_ranges(text):
+    """Return [open, close] pairs of a rule's time part, or None if it can't be read"""
+    ranges = []
+    remainder = text
+    for match in _RANGE.finditer(text):
+        start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = match.groups()
+        if start_meridiem is None and end_meridiem is not None and int(start_hour) <= 12:
+            # "1-5pm" is 1pm-5pm, "9-5pm" is 9am-5pm
+            same_half = int(start_hour) % 12 <= int(end_hour) % 12
+            start_meridiem = end_meridiem if same_half else ('am' if end_meridiem == 'pm' else 'pm')
+        opens = _minutes(start_hour, start_minute, start_meridiem)
+        closes = _minutes(end_hour, end_minute, end_meridiem)
+        if closes <= opens:
+            closes += MINUTES_PER_DAY
+        ranges.append([opens, closes])
+        remainder = remainder.replace(match.group(0), ' ', 1)
+    if not ranges or re.sub(r'[\s,;&/]|\b(and|open|from)\b', '', remainder):
+        return None
+    return ranges
+
+
+def _merge(intervals):
+    merged = []
+    for opens, closes in sorted(intervals):
+        if merged and opens <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], closes)
+        else:
+            merged.append([opens, closes])
+    return merged
+
+
+def parse_opening_hours(text):
+    """
+    Parse opening hours text into per-weekday intervals
+
+    Args:
+        text: Free text opening hours
+
+    Returns:
+        List of 7 lists of [open, close] minute pairs (Monday first), or None
+        when the text is empty or not understood
+    """
+    if not text or not text.strip():
+        return None
+    normalized = text.lower().replace('–', '-').replace('—', '-').replace('~', '-')
+    normalized = re.sub(r'\s+to\s+', '-', normalized)
+    normalized = re.sub(r'\b(a\.m\.|p\.m\.)', lambda m: m.group(0).replace('.', ''), normalized)
+
+    week = [None] * 7
+    for rule in filter(None, (part.strip() for part in re.split(r'[;\n|]', normalized))):
+        match = _DAY_SPEC.match(rule)
+        if match:
+            days, times = _parse_days(match.group(1)), match.group(2).strip()
+        else:
+            days, times = set(range(7)), _EVERY_DAY.sub('', rule).strip()
+
+        if _ALWAYS_OPEN.match(times):
+            ranges = [[0, MINUTES_PER_DAY]]
+        elif _CLOSED.match(times):
+            ranges = []
+        else:
+            try:
+                ranges = _parse_ranges(times)
+            except ValueError:
+                ranges = None
+            if ranges is None:
+                return None
+        # Later rules override earlier ones for the days they name
+        for day in days:
+            week[day] = ranges
+
+    if all(day is None for day in week):
+        return None
+
+    intervals = [list(ranges or []) for ranges in week]
+    for day, ranges in enumerate(week):
+        for opens, closes in ranges or []:
+            if closes > MINUTES_PER_DAY:
+                intervals[(day + 1) % 7].append([0, closes - MINUTES_PER_DAY])
+    return [_merge(day) for day in intervals]
+
+
+def parse_existing_hours(apps, schema_editor):
+    POI = apps.get_model('itinerary', 'POI')
+    batch = []
+    for poi in POI.objects.exclude(opening_hours='').only('pk', 'opening_hours').iterator(chunk_size=1000):
+        poi.opening_intervals = parse_opening_hours(poi.opening_hours)
+        batch.append(poi)
+        if len(batch) == 1000:
+            POI.objects.bulk_update(batch, ['opening_intervals'])
+            batch = []
+    POI.objects.bulk_update(batch, ['opening_intervals'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itinerary', '0003_poi_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poi',
+            name='opening_intervals',
+            field=models.JSONField(blank=True, editable=False, help_text='opening_hours parsed into [open, close] minutes per weekday, Monday first', null=True, verbose_name='Opening Intervals'),
+        ),
+        migrations.RunPython(parse_existing_hours, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2 on 2026-10-18 16:20
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+FULLTEXT_INDEX = 'poi_search_fulltext'
+
+# Frozen copy of itinerary.search as of this migration, so later changes to
+# the live module don't change what it does
+SEARCH_FIELDS = {
+    'name': 8,
+    'category': 4,
+    'review_summary': 2,
+    'description': 1,
+}
+MAX_TOKEN_LENGTH = 64
+TOKEN = re.compile(r'\w+', re.UNICODE)
+INNODB_STOPWORDS = frozenset({
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how',
+    'i', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what',
+    'when', 'where', 'who', 'will', 'with', 'und', 'www',
+})
+
+
+def build_tokens(poi, fulltext):
+    """
+    {token: weight} of a POI; with fulltext, only the tokens the MySQL
+    FULLTEXT index leaves out (too short or stopwords)
+    """
+    config = getattr(settings, 'POI_SEARCH', {})
+    min_size = config.get('FULLTEXT_MIN_TOKEN_SIZE', 3)
+    stopwords = config.get('FULLTEXT_STOPWORDS', INNODB_STOPWORDS)
+    weights = {}
+    for field, field_weight in SEARCH_FIELDS.items():
+        for token in TOKEN.findall((getattr(poi, field) or '').casefold()):
+            token = token[:MAX_TOKEN_LENGTH]
+            weights[token] = weights.get(token, 0) + field_weight
+    if fulltext:
+        return {token: weight for token, weight in weights.items()
+                if len(token) < min_size or token in stopwords}
+    return weights
+
+
+def create_search_index(apps, schema_editor):
+    """FULLTEXT index on MySQL, and token rows for the existing POIs"""
+    connection = schema_editor.connection
+    fulltext = connection.vendor == 'mysql'
+    if fulltext:
+        columns = ', '.join(connection.ops.quote_name(field) for field in SEARCH_FIELDS)
+        schema_editor.execute(f"ALTER TABLE poi ADD FULLTEXT INDEX {FULLTEXT_INDEX} ({columns})")
+
+    POI = apps.get_model('itinerary', 'POI')
+    POISearchToken = apps.get_model('itinerary', 'POISearchToken')
+    rows = []
+    for poi in POI.objects.only('pk', *SEARCH_FIELDS).iterator(chunk_size=1000):
+        rows.extend(
+            POISearchToken(token=token, poi_id=poi.pk, weight=weight)
+            for token, weight in build_tokens(poi, fulltext).items()
+        )
+        if len(rows) >= 5000:
+            POISearchToken.objects.bulk_create(rows, batch_size=1000)
+            rows = []
+    POISearchToken.objects.bulk_create(rows, batch_size=1000)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(f"ALTER TABLE poi DROP INDEX {FULLTEXT_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itinerary', '0004_poi_opening_intervals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='POISearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, verbose_name='Token')),
+                ('weight', models.PositiveIntegerField(default=1, help_text='Occurrences of the token weighted by the field they appear in', verbose_name='Weight')),
+                ('poi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='itinerary.poi', verbose_name='POI')),
+            ],
+            options={
+                'verbose_name': 'POI Search Token',
+                'verbose_name_plural': 'POI Search Tokens',
+                'db_table': 'poi_search_tokens',
+                'constraints': [models.UniqueConstraint(fields=('token', 'poi'), name='poi_search_token_unique')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
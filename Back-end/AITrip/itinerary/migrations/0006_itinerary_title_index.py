@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 16:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itinerary', '0005_poi_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['title'], name='itineraries_title_73d7a0_idx'),
+        ),
+    ]
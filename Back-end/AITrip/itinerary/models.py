@@ -1,6 +1,12 @@
+import hashlib
+
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.conf import settings
 
+from .geo import encode_geohash
+from .hours import parse_opening_hours
+
 # Create your models here.
 class Itinerary(models.Model):
     itinerary_id = models.AutoField(primary_key=True)
@@ -33,6 +39,7 @@ class Itinerary(models.Model):
         verbose_name_plural = 'Itineraries'
         indexes = [
             models.Index(fields=['user']),
+            models.Index(fields=['title']),
             models.Index(fields=['create_time']),
             models.Index(fields=['update_time']),
         ]
@@ -64,6 +71,13 @@ class DailySchedule(models.Model):
         blank=True,
         verbose_name='Summary'
     )
+    pois = models.ManyToManyField(
+        'POI',
+        through='SchedulePOI',
+        related_name='schedules',
+        verbose_name='POIs',
+        blank=True
+    )
     create_time = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Create Time',
@@ -90,14 +104,37 @@ class DailySchedule(models.Model):
         return f"Day {self.day_number} of {self.itinerary}"
 
 
+def make_catalog_key(name, location):
+    """
+    Deduplication key of a catalog POI: the normalized name and location
+    """
+    normalized = '|'.join(' '.join(str(part or '').split()).casefold() for part in (name, location))
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
 class POI(models.Model):
+    """
+    Catalog entry for an attraction, stored once and shared by every schedule
+    that visits it through SchedulePOI
+    """
     poi_id = models.AutoField(primary_key=True)
-    schedule = models.ForeignKey(   
+    schedule = models.ForeignKey(
         DailySchedule,
         on_delete=models.CASCADE,
-        related_name='pois',
-        verbose_name='Daily Schedule',
-        db_index=True
+        related_name='legacy_pois',
+        verbose_name='Legacy Daily Schedule',
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='Pre-catalog schedule link, cleared by the dedup_pois command'
+    )
+    catalog_key = models.CharField(
+        max_length=40,
+        unique=True,
+        null=True,
+        editable=False,
+        verbose_name='Catalog Key',
+        help_text='Hash of the normalized name and location'
     )
     name = models.CharField(
         max_length=255,
@@ -117,6 +154,26 @@ class POI(models.Model):
         blank=True,
         verbose_name='Location'
     )
+    latitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-90.0), MaxValueValidator(90.0)],
+        verbose_name='Latitude'
+    )
+    longitude = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(-180.0), MaxValueValidator(180.0)],
+        verbose_name='Longitude'
+    )
+    geohash = models.CharField(
+        max_length=12,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Geohash',
+        help_text='Geohash of the coordinates, used by the nearby search'
+    )
     target_audience = models.CharField(
         max_length=255,
         blank=True,
@@ -137,6 +194,13 @@ class POI(models.Model):
         blank=True,
         verbose_name='Opening Hours'
     )
+    opening_intervals = models.JSONField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Opening Intervals',
+        help_text='opening_hours parsed into [open, close] minutes per weekday, Monday first'
+    )
     ticket_price = models.CharField(
         max_length=100,
         blank=True,
@@ -176,10 +240,125 @@ class POI(models.Model):
         indexes = [
             models.Index(fields=['name']),
             models.Index(fields=['category']),
+            # Covers the nearby search: cell range scan plus coordinates, no row lookups
+            models.Index(fields=['geohash', 'latitude', 'longitude']),
             models.Index(fields=['create_time']),
             models.Index(fields=['update_time']),
         ]
 
+    # Columns computed from other fields: derived field -> source fields
+    DERIVED_FIELDS = {
+        'catalog_key': {'name', 'location'},
+        'geohash': {'latitude', 'longitude'},
+        'opening_intervals': {'opening_hours'},
+    }
+
     def __str__(self):
         return self.name
 
+    def set_derived_fields(self):
+        """
+        Recompute the columns derived from other fields; bulk inserts call this
+        directly since they bypass save()
+        """
+        self.catalog_key = make_catalog_key(self.name, self.location)
+        if self.latitude is None or self.longitude is None:
+            self.geohash = None
+        else:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        self.opening_intervals = parse_opening_hours(self.opening_hours)
+
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            for derived, sources in self.DERIVED_FIELDS.items():
+                if sources & update_fields:
+                    update_fields.add(derived)
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+
+class SchedulePOI(models.Model):
+    """
+    Ordered membership of a catalog POI in a daily schedule
+    """
+    schedule_poi_id = models.AutoField(primary_key=True)
+    schedule = models.ForeignKey(
+        DailySchedule,
+        on_delete=models.CASCADE,
+        related_name='poi_links',
+        verbose_name='Daily Schedule'
+    )
+    poi = models.ForeignKey(
+        POI,
+        on_delete=models.CASCADE,
+        related_name='schedule_links',
+        verbose_name='POI',
+        db_index=True
+    )
+    order = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Order',
+        help_text='Visit order within the day'
+    )
+    create_time = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Create Time',
+        db_index=True
+    )
+    update_time = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Update Time',
+        db_index=True
+    )
+
+    class Meta:
+        db_table = 'schedule_poi'
+        verbose_name = 'Schedule POI'
+        verbose_name_plural = 'Schedule POIs'
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'poi'], name='schedule_poi_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['schedule', 'order']),
+        ]
+
+    def __str__(self):
+        return f"{self.poi_id} in {self.schedule_id} (#{self.order})"
+
+
+
+class POISearchToken(models.Model):
+    """
+    Inverted index of POI text used by the search endpoint; on MySQL it only
+    holds the words left out of the FULLTEXT index. Maintained by
+    itinerary.search
+    """
+    token = models.CharField(
+        max_length=64,
+        verbose_name='Token'
+    )
+    poi = models.ForeignKey(
+        POI,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        verbose_name='POI'
+    )
+    weight = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Weight',
+        help_text='Occurrences of the token weighted by the field they appear in'
+    )
+
+    class Meta:
+        db_table = 'poi_search_tokens'
+        verbose_name = 'POI Search Token'
+        verbose_name_plural = 'POI Search Tokens'
+        constraints = [
+            models.UniqueConstraint(fields=['token', 'poi'], name='poi_search_token_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} -> {self.poi_id}"
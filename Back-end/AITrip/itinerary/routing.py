@@ -0,0 +1,199 @@
+"""
+Route ordering for the POIs of a day
+
+The stops of a day are ordered to minimise the total travel time between
+consecutive stops: the pairwise distance matrix is built with NumPy in one
+vectorized pass, a nearest-neighbour tour from every possible first stop
+gives the starting route and 2-opt moves improve it until no reversal helps.
+
+This module only depends on NumPy so process pool workers can import it
+without setting up Django. The workers are started by a fork server (spawned
+where that isn't available), never forked from the web worker itself: a fork
+of a multithreaded gunicorn/uvicorn process can copy locks held by other
+threads and deadlock.
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def distance_matrix(coordinates):
+    """
+    Pairwise great-circle distances
+
+    Args:
+        coordinates: Sequence of (latitude, longitude) pairs in degrees
+
+    Returns:
+        (n, n) float array of distances in meters
+    """
+    points = np.radians(np.asarray(coordinates, dtype=float).reshape(-1, 2))
+    lat = points[:, 0]
+    lng = points[:, 1]
+    d_lat = lat[:, None] - lat[None, :]
+    d_lng = lng[:, None] - lng[None, :]
+    a = np.sin(d_lat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(d_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def route_length(route, matrix):
+    """Total length of an open route"""
+    route = np.asarray(route)
+    if len(route) < 2:
+        return 0.0
+    return float(matrix[route[:-1], route[1:]].sum())
+
+
+def nearest_neighbour(matrix, start):
+    """
+    Greedy route visiting the closest unvisited stop next
+
+    Returns:
+        List of stop indexes beginning with start
+    """
+    size = len(matrix)
+    visited = np.zeros(size, dtype=bool)
+    route = [start]
+    visited[start] = True
+    for _ in range(size - 1):
+        distances = np.where(visited, np.inf, matrix[route[-1]])
+        nearest = int(np.argmin(distances))
+        route.append(nearest)
+        visited[nearest] = True
+    return route
+
+
+def two_opt(route, matrix, fixed_start=False):
+    """
+    Improve an open route by reversing segments while that shortens it
+
+    Every pass evaluates all reversals that start at a given position at once
+    and applies the best improving one.
+
+    Args:
+        route: Initial list of stop indexes
+        matrix: Distance matrix
+        fixed_start: Keep the first stop in place
+    """
+    route = np.asarray(route)
+    size = len(route)
+    if size < 3:
+        return route.tolist()
+
+    first = 1 if fixed_start else 0
+    improved = True
+    while improved:
+        improved = False
+        for i in range(first, size - 1):
+            # Reversing route[i..j] replaces edges (i-1, i) and (j, j+1)
+            # with (i-1, j) and (i, j+1); missing end edges cost nothing
+            j = np.arange(i + 1, size)
+            before = route[i - 1] if i > 0 else None
+            after = np.append(route[j[:-1] + 1], -1)
+
+            gain = np.zeros(len(j))
+            if before is not None:
+                gain += matrix[before, route[i]] - matrix[before, route[j]]
+            has_after = after >= 0
+            gain[has_after] += (
+                matrix[route[j[has_after]], after[has_after]]
+                - matrix[route[i], after[has_after]]
+            )
+
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-7:
+                end = j[best]
+                route[i:end + 1] = route[i:end + 1][::-1]
+                improved = True
+    return route.tolist()
+
+
+def optimize_route(coordinates, fixed_start=False):
+    """
+    Order stops to minimise the total distance travelled
+
+    Args:
+        coordinates: Sequence of (latitude, longitude) pairs in the current order
+        fixed_start: Keep the current first stop first (e.g. the hotel)
+
+    Returns:
+        Tuple (order, distance_before, distance_after) where order lists the
+        indexes of coordinates in visiting order and distances are in meters
+    """
+    size = len(coordinates)
+    if size == 0:
+        return [], 0.0, 0.0
+    matrix = distance_matrix(coordinates)
+    original = list(range(size))
+    before = route_length(original, matrix)
+    if size < 3:
+        return original, before, before
+
+    starts = [0] if fixed_start else range(size)
+    routes = [nearest_neighbour(matrix, start) for start in starts]
+    route = min(routes, key=lambda candidate: route_length(candidate, matrix))
+    route = two_opt(route, matrix, fixed_start=fixed_start)
+
+    after = route_length(route, matrix)
+    if after >= before:
+        # Never hand back a route that is worse than the one the user made
+        return original, before, before
+    return route, before, after
+
+
+def optimize_routes(tasks):
+    """
+    Optimize several days; the unit of work handed to process pool workers
+
+    Args:
+        tasks: List of (key, coordinates, fixed_start) tuples
+
+    Returns:
+        List of (key, order, distance_before, distance_after) tuples
+    """
+    return [(key, *optimize_route(coordinates, fixed_start)) for key, coordinates, fixed_start in tasks]
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """
+    Return the per-process worker pool, created on first use
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _pool_workers = workers
+        return _pool
+
+
+def optimize_routes_parallel(tasks, workers):
+    """
+    Spread optimize_routes over a process pool, one chunk of days per worker
+
+    Args:
+        tasks: List of (key, coordinates, fixed_start) tuples
+        workers: Number of worker processes; below 2 runs inline
+
+    Returns:
+        Same as optimize_routes, in the order of tasks
+    """
+    if workers < 2 or len(tasks) < 2:
+        return optimize_routes(tasks)
+    chunks = [tasks[index::workers] for index in range(min(workers, len(tasks)))]
+    results = {}
+    for chunk_result in get_pool(workers).map(optimize_routes, chunks):
+        results.update((result[0], result) for result in chunk_result)
+    return [results[key] for key, _, _ in tasks]
@@ -0,0 +1,225 @@
+"""
+Full-text search over POIs
+
+Other databases than MySQL use the POISearchToken table: every POI stores
+one row per distinct token of (name, category, description, review_summary)
+with a weight, and a search is a few index range scans on the token column,
+so its cost depends on the number of matching tokens rather than on the
+number of POIs.
+
+MySQL answers searches with a FULLTEXT index on those fields, created by
+migration 0005. InnoDB leaves words shorter than innodb_ft_min_token_size
+and stopwords out of that index, so on MySQL the token table stores exactly
+those words and terms the index can't match are looked up there instead.
+Keep settings.POI_SEARCH in line with the server's configuration.
+
+Every query term must match. Results are ranked by relevance; the last
+term also matches as a prefix, for autocomplete.
+"""
+
+import re
+
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+from django.db.models.expressions import RawSQL
+
+from utils.config import load_config
+
+from .models import POI, POISearchToken
+
+SEARCH_FIELDS = {
+    'name': 8,
+    'category': 4,
+    'review_summary': 2,
+    'description': 1,
+}
+MAX_TOKEN_LENGTH = 64
+MAX_TERMS = 8
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+# Sorts after every character, so token < prefix + _MAX_CHAR selects all tokens starting with prefix
+_MAX_CHAR = '\U0010ffff'
+# INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD
+INNODB_STOPWORDS = frozenset({
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how',
+    'i', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what',
+    'when', 'where', 'who', 'will', 'with', 'und', 'www',
+})
+
+DEFAULTS = {
+    'FULLTEXT_MIN_TOKEN_SIZE': 3,
+    'FULLTEXT_STOPWORDS': INNODB_STOPWORDS,
+}
+
+
+def get_config():
+    return load_config('POI_SEARCH', DEFAULTS)
+
+
+def tokenize(text):
+    """Lower-cased word tokens of a text, in order"""
+    return [token[:MAX_TOKEN_LENGTH] for token in _TOKEN.findall((text or '').casefold())]
+
+
+def uses_fulltext():
+    """Whether searches go through a native full-text index (MySQL)"""
+    return connection.vendor == 'mysql'
+
+
+def in_fulltext_index(token):
+    """Whether the MySQL FULLTEXT index has the token: long enough and no stopword"""
+    config = get_config()
+    return len(token) >= config['FULLTEXT_MIN_TOKEN_SIZE'] and token not in config['FULLTEXT_STOPWORDS']
+
+
+def build_tokens(poi):
+    """
+    Return {token: weight} of the POISearchToken rows of a POI
+
+    Every token of its searchable fields, or on MySQL only those missing
+    from the FULLTEXT index.
+    """
+    weights = {}
+    for field, field_weight in SEARCH_FIELDS.items():
+        for token in tokenize(getattr(poi, field)):
+            weights[token] = weights.get(token, 0) + field_weight
+    if uses_fulltext():
+        return {token: weight for token, weight in weights.items() if not in_fulltext_index(token)}
+    return weights
+
+
+def index_pois(pois, created=False, batch_size=1000):
+    """
+    Rebuild the token rows of the given POIs
+
+    Args:
+        pois: POI instances with their searchable fields loaded
+        created: The POIs were just inserted, so there are no rows to replace
+    """
+    pois = [poi for poi in pois if poi.pk is not None]
+    if not pois:
+        return
+    rows = [
+        POISearchToken(token=token, poi_id=poi.pk, weight=weight)
+        for poi in pois
+        for token, weight in build_tokens(poi).items()
+    ]
+    if created:
+        POISearchToken.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+        return
+    with transaction.atomic():
+        POISearchToken.objects.filter(poi_id__in=[poi.pk for poi in pois]).delete()
+        POISearchToken.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def _term_condition(term, prefix):
+    if prefix:
+        return Q(token__gte=term, token__lt=term + _MAX_CHAR)
+    return Q(token=term)
+
+
+def _search_tokens(queryset, terms, prefix, limit):
+    conditions = [
+        _term_condition(term, prefix and index == len(terms) - 1)
+        for index, term in enumerate(terms)
+    ]
+    matched = Q()
+    for condition in conditions:
+        matched |= condition
+    # One flag per term; a POI is a result when all of them are set
+    flags = {
+        f'term_{index}': Max(Case(When(condition, then=Value(1)), default=Value(0), output_field=IntegerField()))
+        for index, condition in enumerate(conditions)
+    }
+    tokens = POISearchToken.objects.filter(matched)
+    if queryset.query.where:
+        tokens = tokens.filter(poi__in=queryset.values('pk'))
+    rows = (
+        tokens.values('poi_id')
+        .annotate(score=Sum('weight'), **flags)
+        .filter(**{name: 1 for name in flags})
+        .order_by('-score', 'poi_id')
+        .values_list('poi_id', 'score')[:limit]
+    )
+    return [(poi_id, float(score)) for poi_id, score in rows]
+
+
+def fulltext_queryset(queryset, terms, prefix):
+    """
+    POIs of queryset matching every term, annotated with their FULLTEXT score
+
+    Terms the FULLTEXT index leaves out must have a token row instead. The
+    prefix term also matches longer words through the index: words with a
+    truncation operator are never dropped from a boolean query.
+    """
+    columns = ', '.join(connection.ops.quote_name(field) for field in SEARCH_FIELDS)
+    match = f"MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)"
+    words = []
+    for index, term in enumerate(terms):
+        is_prefix = prefix and index == len(terms) - 1
+        if in_fulltext_index(term):
+            words.append(f"+{term}{'*' if is_prefix else ''}")
+            continue
+        matched = Q(pk__in=POISearchToken.objects.filter(_term_condition(term, is_prefix)).values('poi_id'))
+        if is_prefix:
+            # Optional: ranks the rows it matches without excluding the others
+            words.append(f"{term}*")
+            longer = POI.objects.annotate(prefix_score=RawSQL(match, (f"{term}*",))).filter(prefix_score__gt=0)
+            matched |= Q(pk__in=longer.values('pk'))
+        queryset = queryset.filter(matched)
+    if not words:
+        return queryset.annotate(score=Value(0, output_field=IntegerField()))
+    queryset = queryset.annotate(score=RawSQL(match, (' '.join(words),)))
+    if any(word.startswith('+') for word in words):
+        queryset = queryset.filter(score__gt=0)
+    return queryset
+
+
+def _search_fulltext(queryset, terms, prefix, limit):
+    rows = fulltext_queryset(queryset, terms, prefix).order_by('-score', 'pk').values_list('pk', 'score')[:limit]
+    return [(poi_id, float(score)) for poi_id, score in rows]
+
+
+def search(queryset, query, prefix=True, limit=20):
+    """
+    Rank the POIs of queryset matching every term of query
+
+    Args:
+        queryset: POI queryset to search in (already filtered, e.g. by category)
+        query: Search text
+        prefix: Let the last term match as a prefix
+        limit: Maximum number of results
+
+    Returns:
+        List of (poi_id, score) pairs, best first
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_TERMS]
+    if not terms:
+        return []
+    queryset = queryset.order_by()
+    if uses_fulltext():
+        return _search_fulltext(queryset, terms, prefix, limit)
+    return _search_tokens(queryset, terms, prefix, limit)
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Rebuild the whole token index in primary key batches
+
+    Returns:
+        Number of POIs indexed
+    """
+    POISearchToken.objects.all().delete()
+    count = 0
+    last_pk = 0
+    fields = ['pk', *SEARCH_FIELDS]
+    while True:
+        batch = list(POI.objects.filter(pk__gt=last_pk).order_by('pk').only(*fields)[:batch_size])
+        if not batch:
+            return count
+        POISearchToken.objects.bulk_create(
+            [POISearchToken(token=token, poi_id=poi.pk, weight=weight)
+             for poi in batch for token, weight in build_tokens(poi).items()],
+            batch_size=batch_size,
+        )
+        count += len(batch)
+        last_pk = batch[-1].pk
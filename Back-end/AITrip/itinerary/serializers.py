@@ -1,23 +1,240 @@
+from django.db import models, transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Itinerary, DailySchedule, POI
+from utils.sparseFields import SparseFieldsMixin, load_only
+from .catalog import append_poi, get_or_create_catalog_pois, link_pois
+from .models import Itinerary, DailySchedule, POI, SchedulePOI, make_catalog_key
+
+def poi_links_prefetch(fieldset=None):
+    """
+    Prefetch the ordered POI links of schedules together with their catalog POIs,
+    loading only the POI columns of fieldset when given
+    """
+    links = SchedulePOI.objects.select_related('poi').order_by('order', 'pk')
+    columns = fieldset.column_names(POI) if fieldset is not None else None
+    if columns is not None:
+        links = links.only('schedule', 'order', 'poi', *(f'poi__{column}' for column in columns))
+    return Prefetch('poi_links', queryset=links)
+
+
+class POIIdsField(serializers.Field):
+    """Ordered ids of the catalog POIs of a schedule, read from its links"""
+    id_column = 'poi_id'
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, links):
+        return [getattr(link, self.id_column) for link in links.all()]
+
+
+class ScheduledPOIListSerializer(serializers.ListSerializer):
+    """Renders the ordered SchedulePOI links of a day as their catalog POIs"""
+    item_source = 'poi'
+
+    def to_representation(self, data):
+        links = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return [self.child.to_representation(getattr(link, self.item_source)) for link in links]
+
+class POISerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    schedule = serializers.PrimaryKeyRelatedField(
+        queryset=DailySchedule.objects.all(),
+        write_only=True,
+        required=False,
+        help_text='Daily schedule to add the POI to'
+    )
 
-class POISerializer(serializers.ModelSerializer):
     class Meta:
         model = POI
-        fields = '__all__'
+        exclude = ('catalog_key', 'geohash', 'opening_intervals')
         read_only_fields = ('poi_id', 'create_time', 'update_time')
 
-class DailyScheduleSerializer(serializers.ModelSerializer):
-    pois = POISerializer(many=True, read_only=True)  
+    @staticmethod
+    def setup_eager_loading(queryset, fieldset=None):
+        """POIs only render their own columns"""
+        return load_only(queryset, fieldset)
+
+    def validate(self, attrs):
+        """
+        Coordinates come in pairs, and renaming or moving a POI must not
+        collide with another catalog entry
+        """
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError({
+                'latitude' if latitude is None else 'longitude': 'Latitude and longitude must be set together.'
+            })
+        if self.instance is not None and ('name' in attrs or 'location' in attrs):
+            key = make_catalog_key(
+                attrs.get('name', self.instance.name),
+                attrs.get('location', self.instance.location)
+            )
+            if POI.objects.filter(catalog_key=key).exclude(pk=self.instance.pk).exists():
+                raise serializers.ValidationError({
+                    'name': 'A POI with this name and location already exists in the catalog.'
+                })
+        return attrs
+
+    def create(self, validated_data):
+        """
+        Return the catalog entry for this POI, creating it if needed, and
+        append it to the given schedule
+
+        An existing entry is returned unchanged: the other submitted fields
+        are not applied, since the entry is shared by every itinerary.
+        ``existing`` tells the view which case it got.
+        """
+        schedule = validated_data.pop('schedule', None)
+        key = make_catalog_key(validated_data.get('name'), validated_data.get('location'))
+        with transaction.atomic():
+            poi = POI.objects.filter(catalog_key=key).first()
+            self.existing = poi is not None
+            if poi is None:
+                poi = get_or_create_catalog_pois([validated_data])[0]
+            if schedule is not None:
+                append_poi(schedule, poi)
+        return poi
+
+    def update(self, instance, validated_data):
+        schedule = validated_data.pop('schedule', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if schedule is not None:
+                append_poi(schedule, instance)
+        return instance
+
+class ScheduledPOISerializer(POISerializer):
+    """Catalog POIs of a schedule, read through its ordered links"""
+    class Meta(POISerializer.Meta):
+        list_serializer_class = ScheduledPOIListSerializer
+
+class DailyScheduleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    pois = ScheduledPOISerializer(source='poi_links', many=True, read_only=True)
+    expandable_fields = {'pois': lambda: POIIdsField(source='poi_links')}
+
     class Meta:
         model = DailySchedule
         fields = '__all__'
         read_only_fields = ('schedule_id', 'create_time', 'update_time')
 
-class ItinerarySerializer(serializers.ModelSerializer):
-    daily_schedules = DailyScheduleSerializer(many=True, read_only=True) 
+    @staticmethod
+    def setup_eager_loading(queryset, fieldset=None, required=()):
+        """
+        Fetch the ordered POIs of every schedule of the page in a single query;
+        with a fieldset, only the columns and relations it renders
+        """
+        if fieldset is None:
+            return queryset.prefetch_related(poi_links_prefetch())
+        queryset = load_only(queryset, fieldset, required)
+        if not fieldset.includes('pois'):
+            return queryset
+        if fieldset.expands('pois'):
+            return queryset.prefetch_related(poi_links_prefetch(fieldset.child('pois')))
+        links = SchedulePOI.objects.order_by('order', 'pk').only('schedule', 'poi', 'order')
+        return queryset.prefetch_related(Prefetch('poi_links', queryset=links))
+
+class NestedPOISerializer(POISerializer):
+    """POI written as part of an itinerary tree; the schedule comes from the parent"""
+    schedule = None
+
+    class Meta(POISerializer.Meta):
+        exclude = ('catalog_key', 'geohash', 'opening_intervals', 'schedule')
+        list_serializer_class = ScheduledPOIListSerializer
+
+class NestedDailyScheduleSerializer(DailyScheduleSerializer):
+    """Daily schedule written as part of an itinerary tree; the itinerary comes from the parent"""
+    pois = NestedPOISerializer(source='poi_links', many=True, required=False)
+
+    class Meta(DailyScheduleSerializer.Meta):
+        read_only_fields = DailyScheduleSerializer.Meta.read_only_fields + ('itinerary',)
+
+class ItinerarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    daily_schedules = NestedDailyScheduleSerializer(many=True, required=False)
+    expandable_fields = {
+        'daily_schedules': lambda: serializers.PrimaryKeyRelatedField(many=True, read_only=True),
+    }
 
     class Meta:
         model = Itinerary
         fields = '__all__'
-        read_only_fields = ('itinerary_id', 'create_time', 'update_time')
\ No newline at end of file
+        read_only_fields = ('itinerary_id', 'user', 'create_time', 'update_time')
+
+    @staticmethod
+    def setup_eager_loading(queryset, fieldset=None):
+        """
+        Fetch the whole itinerary tree in one query per level, days ordered by
+        day_number; with a fieldset, only the columns and levels it renders
+        """
+        days = DailySchedule.objects.order_by('day_number')
+        if fieldset is None:
+            return queryset.prefetch_related(
+                Prefetch('daily_schedules', queryset=days.prefetch_related(poi_links_prefetch()))
+            )
+        queryset = load_only(queryset, fieldset)
+        if not fieldset.includes('daily_schedules'):
+            return queryset
+        if fieldset.expands('daily_schedules'):
+            days = NestedDailyScheduleSerializer.setup_eager_loading(
+                days, fieldset.child('daily_schedules'), required=('itinerary',)
+            )
+        else:
+            days = days.only('pk', 'itinerary')
+        return queryset.prefetch_related(Prefetch('daily_schedules', queryset=days))
+
+    def create(self, validated_data):
+        """
+        Create the itinerary with all of its days and POIs in one transaction
+        """
+        schedules_data = validated_data.pop('daily_schedules', [])
+        with transaction.atomic():
+            itinerary = Itinerary.objects.create(**validated_data)
+            self.create_tree(itinerary, schedules_data)
+        return self.setup_eager_loading(Itinerary.objects.filter(pk=itinerary.pk)).get()
+
+    def update(self, instance, validated_data):
+        """
+        Update the itinerary; a submitted daily_schedules list replaces the existing tree
+        """
+        schedules_data = validated_data.pop('daily_schedules', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if schedules_data is not None:
+                instance.daily_schedules.all().delete()
+                self.create_tree(instance, schedules_data)
+        return self.setup_eager_loading(Itinerary.objects.filter(pk=instance.pk)).get()
+
+    @staticmethod
+    def create_tree(itinerary, schedules_data):
+        """
+        Insert the days of an itinerary, resolve their POIs against the catalog
+        and link them, with one bulk INSERT per table
+        """
+        schedules = [
+            DailySchedule(
+                itinerary=itinerary,
+                **{key: value for key, value in data.items() if key != 'poi_links'}
+            )
+            for data in schedules_data
+        ]
+        DailySchedule.objects.bulk_create(schedules)
+
+        if any(schedule.pk is None for schedule in schedules):
+            # MySQL does not return the ids of bulk inserted rows; a single
+            # multi-row INSERT gets consecutive ids in insertion order
+            pks = (
+                DailySchedule.objects.filter(itinerary=itinerary)
+                .order_by('pk')
+                .values_list('pk', flat=True)
+            )
+            for schedule, pk in zip(schedules, pks):
+                schedule.pk = pk
+
+        pois_data = [poi_data for data in schedules_data for poi_data in data.get('poi_links', [])]
+        catalog = iter(get_or_create_catalog_pois(pois_data))
+        link_pois(
+            (schedule.pk, [next(catalog) for _ in data.get('poi_links', [])])
+            for schedule, data in zip(schedules, schedules_data)
+        )
+        return schedules
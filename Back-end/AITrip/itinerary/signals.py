@@ -0,0 +1,98 @@
+"""
+Cache invalidation for itinerary details and POI search index upkeep
+
+Changed itineraries, schedules and catalog POIs are collected per
+transaction and invalidated once it commits, with one query per kind to map
+schedules and POIs to the itineraries that contain them.
+"""
+
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .models import Itinerary, DailySchedule, POI, SchedulePOI
+from .search import SEARCH_FIELDS, index_pois
+
+_pending = threading.local()
+
+
+def _flush():
+    itinerary_ids = _pending.itineraries
+    schedule_ids = _pending.schedules
+    poi_ids = _pending.pois
+    del _pending.itineraries, _pending.schedules, _pending.pois
+
+    if schedule_ids:
+        itinerary_ids |= set(
+            DailySchedule.objects.filter(pk__in=schedule_ids)
+            .values_list('itinerary_id', flat=True)
+        )
+    if poi_ids:
+        itinerary_ids |= set(
+            SchedulePOI.objects.filter(poi_id__in=poi_ids)
+            .values_list('schedule__itinerary_id', flat=True)
+        )
+    invalidate(itinerary_ids)
+
+
+def _queue(itinerary_id=None, schedule_id=None, poi_id=None):
+    connection = transaction.get_connection()
+    # A rolled back savepoint drops its callbacks, so also look for a live one
+    registered = (
+        hasattr(_pending, 'itineraries')
+        and connection.in_atomic_block
+        and any(func is _flush for _, func, _ in connection.run_on_commit)
+    )
+    if not registered:
+        _pending.itineraries = set()
+        _pending.schedules = set()
+        _pending.pois = set()
+    if itinerary_id is not None:
+        _pending.itineraries.add(itinerary_id)
+    if schedule_id is not None:
+        _pending.schedules.add(schedule_id)
+    if poi_id is not None:
+        _pending.pois.add(poi_id)
+    if not registered:
+        # Runs immediately in autocommit mode
+        transaction.on_commit(_flush)
+
+
+@receiver([post_save, post_delete], sender=Itinerary)
+def itinerary_changed(sender, instance, **kwargs):
+    _queue(itinerary_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=DailySchedule)
+def schedule_changed(sender, instance, **kwargs):
+    _queue(itinerary_id=instance.itinerary_id)
+
+
+@receiver([post_save, post_delete], sender=POI)
+def poi_changed(sender, instance, **kwargs):
+    # Catalog entries are shared, so every itinerary visiting the POI is affected;
+    # on delete the links are already gone and were reported by SchedulePOI
+    _queue(schedule_id=instance.schedule_id, poi_id=instance.pk)
+
+
+@receiver(post_save, sender=POI)
+def poi_search_fields_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) & set(SEARCH_FIELDS):
+        index_pois([instance])
+
+
+@receiver([post_save, post_delete], sender=SchedulePOI)
+def poi_link_changed(sender, instance, **kwargs):
+    _queue(schedule_id=instance.schedule_id)
+
+
+def schedules_changed(schedule_ids):
+    """
+    Invalidate the itineraries of schedules whose POI links were changed by a
+    bulk update, which sends no signals
+    """
+    for schedule_id in schedule_ids:
+        _queue(schedule_id=schedule_id)
@@ -1,3 +1,1410 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import os
+import random
+import tempfile
+import time as time_module
+from datetime import date, time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import permissions, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from acounts.models import User
+from review.models import Review
+from utils import benchmark
+from utils.compiledSerializer import compile_serializer
+from utils.renderers import Envelope, EnvelopeJSONRenderer
+from utils.response import CustomModelViewSet
+from utils.instrumentation import fingerprint
+from utils.filterPlanner import IndexedFilterSet, check_filter_indexes, probe_querysets
+from utils.queryBudget import count_queries, get_query_budget
+from utils.testing import AuthenticatedAPITestCase
+from . import cache as itinerary_cache
+from . import geo, routing
+from . import search as poi_search
+from .feasibility import FeasibilityChecker
+from .filters import ItineraryFilter, DailyScheduleFilter, POIFilter
+from .catalog import append_poi
+from .hours import parse_opening_hours
+from .management.commands import benchmark as benchmark_command, seed_scale
+from .models import Itinerary, DailySchedule, POI, POISearchToken, SchedulePOI
+from .serializers import ItinerarySerializer, POISerializer
+from .views import ItineraryViewSet, DailyScheduleViewSet, POIViewSet
+
+
+def build_itineraries(user, itineraries=3, days=3, pois_per_day=2):
+    """Create a small itinerary tree for tests"""
+    for i in range(itineraries):
+        itinerary = Itinerary.objects.create(user=user, title=f"Trip {i}")
+        for day in range(days, 0, -1):
+            schedule = DailySchedule.objects.create(
+                itinerary=itinerary,
+                day_number=day,
+                start_time=time(9, 0),
+                end_time=time(18, 0),
+            )
+            for p in range(pois_per_day):
+                poi = POI.objects.create(name=f"POI {itinerary.pk}-{day}-{p}")
+                SchedulePOI.objects.create(schedule=schedule, poi=poi, order=p)
+
+
+class QueryBudgetTestCase(AuthenticatedAPITestCase):
+    """
+    Requests must stay within the viewset's query budget regardless of data volume
+    """
+
+    username = 'budget'
+    token_auth = True
+
+    def setUp(self):
+        super().setUp()
+        itinerary_cache.get_cache().clear()
+
+    def assertWithinBudget(self, viewset, action, url):
+        with count_queries() as counter:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        budget = get_query_budget(viewset(), action)
+        self.assertLessEqual(
+            counter.count, budget,
+            f"{viewset.__name__}.{action} ran {counter.count} queries (budget {budget})"
+        )
+        return response
+
+    def test_itinerary_list_is_constant(self):
+        build_itineraries(self.user, itineraries=2)
+        self.assertWithinBudget(ItineraryViewSet, 'list', '/api/itinerary/itineraries/')
+        build_itineraries(self.user, itineraries=8, days=5)
+        self.assertWithinBudget(ItineraryViewSet, 'list', '/api/itinerary/itineraries/?page_size=10&count=true')
+
+    def test_itinerary_retrieve_orders_days(self):
+        build_itineraries(self.user, itineraries=1, days=4)
+        itinerary = Itinerary.objects.get()
+        response = self.assertWithinBudget(
+            ItineraryViewSet, 'retrieve', f'/api/itinerary/itineraries/{itinerary.pk}/'
+        )
+        days = [day['day_number'] for day in response.data['data']['daily_schedules']]
+        self.assertEqual(days, [1, 2, 3, 4])
+
+    def test_schedule_and_poi_lists(self):
+        build_itineraries(self.user, itineraries=3, days=4, pois_per_day=3)
+        self.assertWithinBudget(DailyScheduleViewSet, 'list', '/api/itinerary/daily-schedules/')
+        self.assertWithinBudget(POIViewSet, 'list', '/api/itinerary/pois/')
+
+
+class KeysetPaginationTestCase(AuthenticatedAPITestCase):
+    """
+    Cursor pages must cover every row exactly once in both directions
+    """
+
+    username = 'pages'
+
+    def setUp(self):
+        super().setUp()
+        build_itineraries(self.user, itineraries=12, days=1, pois_per_day=0)
+
+    def test_default_page_is_bounded(self):
+        response = self.client.get('/api/itinerary/itineraries/?page_size=5')
+        data = response.data['data']
+        self.assertEqual(response.data['success'], 1)
+        self.assertEqual(len(data['results']), 5)
+        self.assertNotIn('count', data)
+        self.assertIsNone(data['previous'])
+
+    def test_walk_forward_and_back(self):
+        url = '/api/itinerary/itineraries/?page_size=5&count=true'
+        seen, pages = [], []
+        while url:
+            data = self.client.get(url).data['data']
+            self.assertEqual(data['count'], 12)
+            ids = [row['itinerary_id'] for row in data['results']]
+            pages.append(ids)
+            seen.extend(ids)
+            url = data['next']
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sorted(seen), sorted(Itinerary.objects.values_list('pk', flat=True)))
+        self.assertEqual(len(set(seen)), 12)
+
+        previous = self.client.get(self.client.get(
+            '/api/itinerary/itineraries/?page_size=5'
+        ).data['data']['next']).data['data']['previous']
+        ids = [row['itinerary_id'] for row in self.client.get(previous).data['data']['results']]
+        self.assertEqual(ids, pages[0])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/itinerary/itineraries/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['success'], 0)
+
+
+class ExportTestCase(AuthenticatedAPITestCase):
+    """
+    The export streams the user's own itineraries in both formats
+    """
+
+    username = 'export'
+
+    def setUp(self):
+        super().setUp()
+        other = User.objects.create_user(
+            email='other@aitrip.com', username='other', password='other-pass-123'
+        )
+        build_itineraries(self.user, itineraries=5, days=2, pois_per_day=2)
+        build_itineraries(other, itineraries=1)
+
+    def test_ndjson(self):
+        response = self.client.get('/api/itinerary/itineraries/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        first = json.loads(lines[0])
+        self.assertEqual([day['day_number'] for day in first['daily_schedules']], [1, 2])
+
+    def test_csv(self):
+        response = self.client.get('/api/itinerary/itineraries/export/?output=csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][0], 'itinerary_id')
+        self.assertEqual(len(rows), 1 + 5 * 2 * 2)
+
+
+class NestedCreateTestCase(AuthenticatedAPITestCase):
+    """
+    A whole itinerary tree is saved in one request with a bulk insert per level
+    """
+
+    username = 'nested'
+
+    def build_payload(self, days=10, pois_per_day=8):
+        return {
+            'title': 'Sydney in 10 days',
+            'daily_schedules': [
+                {
+                    'day_number': day,
+                    'start_time': '09:00:00',
+                    'end_time': '18:00:00',
+                    'summary': f'Day {day}',
+                    'pois': [
+                        {'name': f'Stop {day}-{p}', 'category': 'Sight', 'rating': '4.5'}
+                        for p in range(pois_per_day)
+                    ],
+                }
+                for day in range(1, days + 1)
+            ],
+        }
+
+    def test_create_tree(self):
+        with count_queries() as counter:
+            response = self.client.post(
+                '/api/itinerary/itineraries/', self.build_payload(), format='json'
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        # One bulk INSERT per table, including the search index
+        self.assertLessEqual(counter.count, 13)
+
+        data = response.data['data']
+        self.assertEqual(data['user'], self.user.pk)
+        self.assertEqual(len(data['daily_schedules']), 10)
+        self.assertEqual(len(data['daily_schedules'][3]['pois']), 8)
+        self.assertEqual(SchedulePOI.objects.filter(schedule__itinerary_id=data['itinerary_id']).count(), 80)
+        self.assertEqual(POI.objects.count(), 80)
+
+    def test_invalid_poi_rolls_back(self):
+        payload = self.build_payload(days=2, pois_per_day=1)
+        payload['daily_schedules'][1]['pois'][0]['name'] = ''
+        response = self.client.post('/api/itinerary/itineraries/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Itinerary.objects.exists())
+
+    def test_update_replaces_tree(self):
+        itinerary_id = self.client.post(
+            '/api/itinerary/itineraries/', self.build_payload(days=3, pois_per_day=2), format='json'
+        ).data['data']['itinerary_id']
+        response = self.client.put(
+            f'/api/itinerary/itineraries/{itinerary_id}/',
+            self.build_payload(days=1, pois_per_day=1), format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(DailySchedule.objects.filter(itinerary_id=itinerary_id).count(), 1)
+        self.assertEqual(SchedulePOI.objects.count(), 1)
+
+    def test_shared_pois_are_stored_once(self):
+        for _ in range(2):
+            response = self.client.post(
+                '/api/itinerary/itineraries/', self.build_payload(days=2, pois_per_day=3), format='json'
+            )
+            self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(POI.objects.count(), 6)
+        self.assertEqual(SchedulePOI.objects.count(), 12)
+        names = [poi['name'] for poi in response.data['data']['daily_schedules'][1]['pois']]
+        self.assertEqual(names, ['Stop 2-0', 'Stop 2-1', 'Stop 2-2'])
+
+
+class POICatalogTestCase(AuthenticatedAPITestCase):
+    """
+    POIs are shared catalog entries; legacy per-day rows are merged by dedup_pois
+    """
+
+    username = 'catalog'
+
+    def setUp(self):
+        super().setUp()
+        self.itinerary = Itinerary.objects.create(user=self.user, title='Catalog')
+        self.schedules = [
+            DailySchedule.objects.create(
+                itinerary=self.itinerary, day_number=day, start_time=time(9, 0), end_time=time(18, 0)
+            )
+            for day in (1, 2)
+        ]
+
+    def test_create_reuses_entry_and_appends(self):
+        first = self.client.post('/api/itinerary/pois/', {
+            'name': 'Bondi Beach', 'location': 'Sydney', 'schedule': self.schedules[0].pk
+        }, format='json')
+        self.assertEqual(first.status_code, 201, first.data)
+        second = self.client.post('/api/itinerary/pois/', {
+            'name': ' bondi  beach', 'location': 'SYDNEY', 'schedule': self.schedules[1].pk,
+            'description': 'Overwritten?',
+        }, format='json')
+        # The existing entry comes back unchanged, with 200 and a message saying so
+        self.assertEqual(second.status_code, 200, second.data)
+        self.assertIn('Existing catalog entry', second.data['msg'])
+        self.assertEqual(second.data['data']['description'], first.data['data']['description'])
+
+        self.assertEqual(first.data['data']['poi_id'], second.data['data']['poi_id'])
+        self.assertEqual(POI.objects.count(), 1)
+        self.assertEqual(SchedulePOI.objects.count(), 2)
+
+    def test_catalog_writes_are_staff_only(self):
+        poi = POI.objects.create(name='Opera House', location='Sydney')
+        append_poi(self.schedules[0], poi)
+        url = f'/api/itinerary/pois/{poi.pk}/'
+        self.assertEqual(self.client.patch(url, {'name': 'Mine'}, format='json').status_code, 403)
+        self.assertEqual(self.client.delete(url).status_code, 403)
+
+        # Users take the POI off their day instead; the catalog entry stays
+        url = f'/api/itinerary/daily-schedules/{self.schedules[0].pk}/pois/{poi.pk}/'
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertTrue(POI.objects.filter(pk=poi.pk).exists())
+        self.assertFalse(SchedulePOI.objects.exists())
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.patch(f'/api/itinerary/pois/{poi.pk}/', {'name': 'Sydney Opera House'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def create_legacy_rows(self):
+        """Rows as they were stored before the catalog: one copy per day, no key"""
+        legacy = []
+        for schedule in self.schedules:
+            for name in ('Opera House', 'Harbour Bridge'):
+                legacy.append(POI(schedule=schedule, name=name, location='Sydney'))
+        POI.objects.bulk_create(legacy)
+        return list(POI.objects.order_by('pk'))
+
+    def test_dedup_pois(self):
+        legacy = self.create_legacy_rows()
+        duplicate = legacy[2]
+        review = Review.objects.create(user=self.user, category='poi', poi=duplicate, feedback_text='Great')
+
+        call_command('dedup_pois', batch_size=3, stdout=io.StringIO())
+
+        self.assertEqual(POI.objects.count(), 2)
+        self.assertFalse(POI.objects.filter(schedule__isnull=False).exists())
+        self.assertFalse(POI.objects.filter(catalog_key__isnull=True).exists())
+        review.refresh_from_db()
+        self.assertEqual(review.poi_id, legacy[0].pk)
+        for schedule in self.schedules:
+            names = list(
+                schedule.poi_links.order_by('order').values_list('poi__name', flat=True)
+            )
+            self.assertEqual(names, ['Opera House', 'Harbour Bridge'])
+
+    def test_dedup_pois_dry_run(self):
+        self.create_legacy_rows()
+        out = io.StringIO()
+        call_command('dedup_pois', dry_run=True, stdout=out)
+        self.assertIn('2 duplicates', out.getvalue())
+        self.assertEqual(POI.objects.count(), 4)
+        self.assertFalse(SchedulePOI.objects.exists())
+
+
+class NearbyPOITestCase(AuthenticatedAPITestCase):
+    """
+    Radius search over the geohash index matches a brute-force distance scan
+    """
+
+    username = 'nearby'
+
+    def test_geohash(self):
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        poi = POI.objects.create(name='Opera House', latitude=-33.8568, longitude=151.2153)
+        self.assertEqual(poi.geohash, geo.encode_geohash(-33.8568, 151.2153))
+        poi.latitude = poi.longitude = None
+        poi.save(update_fields=['latitude', 'longitude'])
+        poi.refresh_from_db()
+        self.assertIsNone(poi.geohash)
+
+    def test_matches_brute_force(self):
+        rng = random.Random(9)
+        centre = (-33.8688, 151.2093)
+        points = [
+            (centre[0] + rng.uniform(-0.1, 0.1), centre[1] + rng.uniform(-0.1, 0.1))
+            for _ in range(300)
+        ]
+        for index, (lat, lng) in enumerate(points):
+            POI.objects.create(name=f'Spot {index}', latitude=lat, longitude=lng)
+        POI.objects.create(name='No coordinates')
+
+        for radius in (300, 2000, 8000):
+            expected = sorted(
+                (geo.haversine(centre[0], centre[1], lat, lng), f'Spot {index}')
+                for index, (lat, lng) in enumerate(points)
+                if geo.haversine(centre[0], centre[1], lat, lng) <= radius
+            )[:100]
+            with count_queries() as counter:
+                response = self.client.get(
+                    '/api/itinerary/pois/nearby/',
+                    {'lat': centre[0], 'lng': centre[1], 'radius': radius, 'limit': 100}
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(counter.count, get_query_budget(POIViewSet(), 'nearby'))
+            results = response.data['data']['results']
+            self.assertEqual([poi['name'] for poi in results], [name for _, name in expected])
+            self.assertEqual([poi['distance'] for poi in results], [round(d, 1) for d, _ in expected])
+
+    def test_cells_cover_antimeridian(self):
+        cells = geo.covering_cells(0.0, 179.999, 5000)
+        self.assertTrue(any(cell.startswith('8') for cell in cells))
+        self.assertTrue(any(cell.startswith('2') for cell in cells))
+
+    def test_cell_range_uses_alphanumeric_bounds(self):
+        self.assertEqual(geo.cell_range('wx4g'), ('wx4g', 'wx4h'))
+        self.assertEqual(geo.cell_range('wx49'), ('wx49', 'wx4b'))
+        self.assertEqual(geo.cell_range('wx4z'), ('wx4z', 'wx5'))
+        self.assertEqual(geo.cell_range('zz'), ('zz', None))
+        # Case-insensitive collations compare like lower(); the bounds must hold there too
+        low, high = geo.cell_range('wx4g')
+        for geohash in ('wx4g', 'wx4g0', 'wx4gzzzz'):
+            self.assertTrue(low <= geohash < high)
+        for geohash in ('wx4f', 'wx4h', 'wx5'):
+            self.assertFalse(low <= geohash < high)
+
+    def test_invalid_params(self):
+        response = self.client.get('/api/itinerary/pois/nearby/', {'lat': 'north', 'lng': 1})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/itinerary/pois/nearby/', {'lat': 1, 'lng': 1, 'radius': 10 ** 7})
+        self.assertEqual(response.status_code, 400)
+
+    def test_coordinates_come_in_pairs(self):
+        response = self.client.post('/api/itinerary/pois/', {'name': 'Half', 'latitude': 10}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('longitude', response.data['data'])
+
+
+@override_settings(ITINERARY_ROUTING={'WORKERS': 0})
+class RouteOptimizationTestCase(AuthenticatedAPITestCase):
+    """
+    Days are reordered to shorten travel, alone or a whole itinerary at once
+    """
+
+    username = 'route'
+
+    def setUp(self):
+        super().setUp()
+        self.itinerary = Itinerary.objects.create(user=self.user, title='Route')
+
+    def create_day(self, day_number, coordinates):
+        schedule = DailySchedule.objects.create(
+            itinerary=self.itinerary, day_number=day_number, start_time=time(9, 0), end_time=time(18, 0)
+        )
+        for order, point in enumerate(coordinates):
+            latitude, longitude = point if point else (None, None)
+            poi = POI.objects.create(
+                name=f'Stop {day_number}-{order}', latitude=latitude, longitude=longitude
+            )
+            SchedulePOI.objects.create(schedule=schedule, poi=poi, order=order)
+        return schedule
+
+    def test_solver(self):
+        rng = random.Random(3)
+        points = [(rng.uniform(-33.95, -33.80), rng.uniform(151.10, 151.30)) for _ in range(25)]
+        order, before, after = routing.optimize_route(points)
+
+        self.assertEqual(sorted(order), list(range(25)))
+        self.assertLess(after, before)
+        matrix = routing.distance_matrix(points)
+        # 2-opt ran to convergence: no reversal shortens the result any further
+        self.assertEqual(routing.two_opt(order, matrix), order)
+        self.assertAlmostEqual(matrix[0, 1], geo.haversine(*points[0], *points[1]), places=3)
+        self.assertAlmostEqual(routing.route_length(order, matrix), after, places=3)
+
+        fixed, _, _ = routing.optimize_route(points, fixed_start=True)
+        self.assertEqual(fixed[0], 0)
+
+    def test_fixed_start_flag(self):
+        # Stop 0 sits in the middle of the line, so only fixed_start keeps it first
+        values = [('false', False), ('0', False), (False, False), ('true', True), ('1', True), (True, True)]
+        for day_number, (value, fixed) in enumerate(values, start=1):
+            schedule = self.create_day(day_number, [(0, 0.015), (0, 0.0), (0, 0.01), (0, 0.03)])
+            url = f'/api/itinerary/daily-schedules/{schedule.pk}/optimize-route/'
+            response = self.client.post(url, {'fixed_start': value}, format='json')
+            first = response.data['data']['pois'][0]['name']
+            self.assertEqual(first == f'Stop {day_number}-0', fixed, value)
+        response = self.client.post(url, {'fixed_start': 'maybe'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_optimize_day(self):
+        # Points on a line visited out of order; POIs without coordinates go last
+        schedule = self.create_day(1, [(0, 0.03), None, (0, 0.01), (0, 0.04), (0, 0.02), (0, 0.0)])
+        response = self.client.post(f'/api/itinerary/daily-schedules/{schedule.pk}/optimize-route/')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        names = [poi['name'] for poi in response.data['data']['pois']]
+        self.assertIn(names, (
+            ['Stop 1-5', 'Stop 1-2', 'Stop 1-4', 'Stop 1-0', 'Stop 1-3', 'Stop 1-1'],
+            ['Stop 1-3', 'Stop 1-0', 'Stop 1-4', 'Stop 1-2', 'Stop 1-5', 'Stop 1-1'],
+        ))
+        route = response.data['data']['route']
+        self.assertEqual(route['unrouted'], 1)
+        self.assertLess(route['distance_after'], route['distance_before'])
+
+    def test_optimize_itinerary_in_process_pool(self):
+        rng = random.Random(5)
+        for day in range(1, 5):
+            self.create_day(day, [(rng.uniform(0, 0.1), rng.uniform(0, 0.1)) for _ in range(12)])
+        tasks = [
+            (schedule.pk,
+             [(link.poi.latitude, link.poi.longitude)
+              for link in schedule.poi_links.select_related('poi').order_by('order')],
+             False)
+            for schedule in self.itinerary.daily_schedules.all()
+        ]
+        self.assertEqual(routing.optimize_routes_parallel(tasks, workers=2), routing.optimize_routes(tasks))
+
+        with override_settings(ITINERARY_ROUTING={'WORKERS': 2, 'PARALLEL_MIN_DAYS': 2}):
+            response = self.client.post(f'/api/itinerary/itineraries/{self.itinerary.pk}/optimize-routes/')
+        self.assertEqual(response.status_code, 200, response.data)
+        routes = response.data['data']['routes']
+        self.assertEqual(len(routes), 4)
+        for schedule in self.itinerary.daily_schedules.all():
+            orders = list(schedule.poi_links.order_by('order').values_list('order', flat=True))
+            self.assertEqual(orders, list(range(12)))
+            self.assertLessEqual(routes[schedule.pk]['distance_after'], routes[schedule.pk]['distance_before'])
+
+
+class FeasibilityTestCase(AuthenticatedAPITestCase):
+    """
+    Days are checked against opening hours parsed once when POIs are saved
+    """
+
+    username = 'feasible'
+
+    def create_itinerary(self, stops, start=time(9, 0), end=time(18, 0)):
+        itinerary = Itinerary.objects.create(user=self.user, title='Plan')
+        schedule = DailySchedule.objects.create(
+            itinerary=itinerary, day_number=1, start_time=start, end_time=end
+        )
+        for order, (name, hours, duration) in enumerate(stops):
+            poi = POI.objects.create(name=name, opening_hours=hours, avg_duration=duration)
+            SchedulePOI.objects.create(schedule=schedule, poi=poi, order=order)
+        return itinerary
+
+    def test_parse_opening_hours(self):
+        week = parse_opening_hours('Mon-Fri 09:00-17:00; Sat 10am-2pm; Sun closed')
+        self.assertEqual(week[0], [[540, 1020]])
+        self.assertEqual(week[5], [[600, 840]])
+        self.assertEqual(week[6], [])
+        overnight = parse_opening_hours('Fri 22:00-02:00')
+        self.assertEqual(overnight[4], [[1320, 1560]])
+        self.assertEqual(overnight[5], [[0, 120]])
+        self.assertEqual(parse_opening_hours('24/7')[2], [[0, 1440]])
+        self.assertIsNone(parse_opening_hours('ask at the desk'))
+
+        poi = POI.objects.create(name='Gallery', opening_hours='Tu,Th 10-18')
+        self.assertEqual(poi.opening_intervals[1], [[600, 1080]])
+        poi.opening_hours = ''
+        poi.save(update_fields=['opening_hours'])
+        poi.refresh_from_db()
+        self.assertIsNone(poi.opening_intervals)
+
+    def test_migration_parses_existing_hours(self):
+        migration = importlib.import_module('itinerary.migrations.0004_poi_opening_intervals')
+        POI.objects.create(name='Gallery', opening_hours='Tu,Th 10-18')
+        POI.objects.create(name='Club', opening_hours='Fri 22:00-02:00; Sat 9am-5pm')
+        POI.objects.update(opening_intervals=None)
+        migration.parse_existing_hours(django_apps, None)
+        for poi in POI.objects.all():
+            self.assertIsNotNone(poi.opening_intervals, poi.name)
+            self.assertEqual(poi.opening_intervals, parse_opening_hours(poi.opening_hours))
+
+    def test_rebuild_opening_hours(self):
+        POI.objects.create(name='Gallery', opening_hours='Tu,Th 10-18')
+        POI.objects.create(name='Square')
+        POI.objects.update(opening_intervals=None)
+        out = io.StringIO()
+        call_command('rebuild_opening_hours', missing_only=True, stdout=out)
+        self.assertIn('1 POIs', out.getvalue())
+        self.assertEqual(POI.objects.get(name='Gallery').opening_intervals[3], [[600, 1080]])
+        self.assertIsNone(POI.objects.get(name='Square').opening_intervals)
+
+    def test_conflicts(self):
+        # 2025-06-02 is a Monday
+        itinerary = self.create_itinerary([
+            ('Museum', 'Mon closed; Tue-Sun 10:00-17:00', 60),
+            ('Market', '10:00-11:30', 120),
+            ('Garden', '09:00-20:00', 420),
+            ('Unknown', '', 30),
+        ])
+        response = self.client.get(
+            f'/api/itinerary/itineraries/{itinerary.pk}/feasibility/', {'start_date': '2025-06-02'}
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        data = response.data['data']
+        self.assertFalse(data['feasible'])
+        self.assertEqual(
+            [(conflict['type'], conflict.get('poi_name')) for conflict in data['conflicts']],
+            [('closed_at_arrival', 'Museum'), ('closes_during_visit', 'Market'), ('day_overrun', None)],
+        )
+        self.assertIsNone(data['conflicts'][0]['opens_at'])
+        self.assertEqual(data['conflicts'][1]['closes_at'], '11:30')
+        self.assertEqual(data['conflicts'][2]['ends_at'], '19:30')
+
+        # On Tuesday the traveller waits for the museum to open
+        response = self.client.get(
+            f'/api/itinerary/itineraries/{itinerary.pk}/feasibility/', {'start_date': '2025-06-03'}
+        )
+        conflicts = response.data['data']['conflicts']
+        self.assertEqual(conflicts[0]['opens_at'], '10:00')
+        self.assertEqual(conflicts[1]['type'], 'closes_during_visit')
+
+    def test_batch(self):
+        feasible = self.create_itinerary([('Park', '24/7', 60)])
+        infeasible = self.create_itinerary([('Bar', '18:00-02:00', 60)])
+        with count_queries() as counter:
+            response = self.client.post('/api/itinerary/itineraries/feasibility/', {
+                'itinerary_ids': [feasible.pk, infeasible.pk], 'start_date': '2025-06-02'
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertLessEqual(counter.count, 2)
+        self.assertEqual([result['feasible'] for result in response.data['data']], [True, False])
+
+        response = self.client.post('/api/itinerary/itineraries/feasibility/', {'start_date': 'soon'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_checker_throughput(self):
+        hours = [parse_opening_hours(text) for text in ('09:00-17:00', 'Mon-Fri 10-18; Sat 10-14', '24/7')]
+        rows = [
+            (itinerary, itinerary * 10 + day, day, time(9, 0), time(18, 0),
+             stop % 50, f'POI {stop}', 60, hours[stop % 3], None, None)
+            for itinerary in range(2000)
+            for day in range(1, 4)
+            for stop in range(5)
+        ]
+        started = time_module.perf_counter()
+        results = FeasibilityChecker(speed_kmh=30).check_rows(rows, date(2025, 6, 2))
+        elapsed = time_module.perf_counter() - started
+        self.assertEqual(len(results), 2000)
+        self.assertLess(elapsed, 2.0)
+
+
+class POISearchTestCase(AuthenticatedAPITestCase):
+    """
+    Search ranks POIs through the token index and keeps it current
+    """
+
+    username = 'search'
+
+    def setUp(self):
+        super().setUp()
+        POI.objects.create(name='Australian Museum', category='Museum', description='Natural history')
+        POI.objects.create(name='Harbour Walk', category='Nature', description='Passes the museum of art')
+        POI.objects.create(name='Museum of Sydney', category='Museum', review_summary='Small but great')
+        POI.objects.create(name='Fish Market', category='Dining')
+
+    def search(self, **params):
+        with count_queries() as counter:
+            response = self.client.get('/api/itinerary/pois/search/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertLessEqual(counter.count, get_query_budget(POIViewSet(), 'search'))
+        return [poi['name'] for poi in response.data['data']['results']]
+
+    def test_ranking_and_filters(self):
+        names = self.search(q='museum')
+        self.assertEqual(set(names[:2]), {'Australian Museum', 'Museum of Sydney'})
+        self.assertEqual(names[2], 'Harbour Walk')
+        self.assertEqual(self.search(q='museum', category='Nature'), ['Harbour Walk'])
+        self.assertEqual(self.search(q='museum sydney'), ['Museum of Sydney'])
+        self.assertEqual(self.search(q='fish mar'), ['Fish Market'])
+        self.assertEqual(self.search(q='fish mar', prefix='false'), [])
+
+    def test_index_follows_changes(self):
+        poi = POI.objects.get(name='Fish Market')
+        poi.description = 'Oysters and prawns'
+        poi.save()
+        self.assertEqual(self.search(q='oysters'), ['Fish Market'])
+        poi.delete()
+        self.assertEqual(self.search(q='oysters'), [])
+
+        response = self.client.post('/api/itinerary/itineraries/', {
+            'title': 'Trip',
+            'daily_schedules': [{
+                'day_number': 1, 'start_time': '09:00:00', 'end_time': '18:00:00',
+                'pois': [{'name': 'Bondi Icebergs', 'category': 'Beach'}],
+            }],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.search(q='iceberg'), ['Bondi Icebergs'])
+
+        POISearchToken.objects.all().delete()
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search(q='iceberg'), ['Bondi Icebergs'])
+
+    def test_uses_token_index(self):
+        tokens = POISearchToken.objects.filter(token__gte='mus', token__lt='mus\U0010ffff')
+        plan = tokens.values('poi_id').explain()
+        self.assertIn('USING COVERING INDEX', plan)
+        self.assertNotIn('SCAN', plan)
+        self.assertEqual(poi_search.tokenize('Café-Bar  No.5'), ['café', 'bar', 'no', '5'])
+
+    def test_fulltext_short_terms(self):
+        poi = POI.objects.get(name='Museum of Sydney')
+        with mock.patch.object(poi_search, 'uses_fulltext', return_value=True):
+            # The token table only keeps what the FULLTEXT index leaves out
+            self.assertEqual(set(poi_search.build_tokens(poi)), {'of'})
+            with override_settings(POI_SEARCH={'FULLTEXT_MIN_TOKEN_SIZE': 4}):
+                self.assertEqual(set(poi_search.build_tokens(poi)), {'of', 'but'})
+
+            sql = str(poi_search.fulltext_queryset(POI.objects.all(), ['museum', 'of', 'sy'], True).query)
+            self.assertIn('AGAINST (+museum sy* IN BOOLEAN MODE)', sql)
+            self.assertIn('AGAINST (sy* IN BOOLEAN MODE)', sql)
+            self.assertEqual(sql.count('poi_search_tokens'), 2)
+            sql = str(poi_search.fulltext_queryset(POI.objects.all(), ['of', 'the'], False).query)
+            self.assertNotIn('AGAINST', sql)
+            self.assertEqual(sql.count('poi_search_tokens'), 2)
+
+    def test_migration_fills_token_table(self):
+        migration = importlib.import_module('itinerary.migrations.0005_poi_search')
+        poi = POI.objects.get(name='Museum of Sydney')
+        self.assertEqual(set(migration.build_tokens(poi, fulltext=True)), {'of'})
+
+        POISearchToken.objects.all().delete()
+        # Only MySQL runs DDL; the token rows need nothing but the connection
+        migration.create_search_index(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(self.search(q='museum sydney'), ['Museum of Sydney'])
+        self.assertEqual(
+            dict(POISearchToken.objects.filter(poi=poi).values_list('token', 'weight')),
+            poi_search.build_tokens(poi),
+        )
+
+    def test_requires_query(self):
+        response = self.client.get('/api/itinerary/pois/search/', {'q': ' !! '})
+        self.assertEqual(response.status_code, 400)
+
+
+class FilterPlannerTestCase(AuthenticatedAPITestCase):
+    """
+    Only index-backed filters are accepted, and each of them is planned as an index search
+    """
+
+    username = 'filters'
+
+    def setUp(self):
+        super().setUp()
+        itinerary_cache.get_cache().clear()
+
+    def test_declared_filters_are_indexed(self):
+        self.assertEqual(check_filter_indexes(), [])
+
+        class DescriptionFilter(IndexedFilterSet):
+            class Meta:
+                model = POI
+                fields = {'description': ['exact'], 'name': ['icontains']}
+
+        self.assertEqual(
+            DescriptionFilter.unindexed_filters(), [('description', 'exact'), ('name', 'icontains')]
+        )
+
+    def test_explain_uses_indexes(self):
+        for filterset in (ItineraryFilter, DailyScheduleFilter, POIFilter):
+            table = filterset._meta.model._meta.db_table
+            for field, lookup, queryset in probe_querysets(filterset):
+                plan = queryset.explain()
+                self.assertNotIn(f'SCAN {table}', plan, f'{filterset.__name__} {field}__{lookup}: {plan}')
+
+    def test_unsupported_filters_are_rejected(self):
+        for url in (
+            '/api/itinerary/pois/?description=Harbour',
+            '/api/itinerary/pois/?name__icontains=bridge',
+            '/api/itinerary/daily-schedules/?summary=Day%201',
+            '/api/itinerary/itineraries/?title__startswith=Syd',
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertTrue(response.data['data']['unsupported_filters'], url)
+
+        response = self.client.get('/api/itinerary/pois/nearby/', {'lat': 0, 'lng': 0, 'colour': 'red'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['data']['unsupported_filters'], ['colour'])
+
+    def test_allowed_filters_stay_within_budget(self):
+        build_itineraries(self.user, itineraries=4)
+        cases = {
+            ItineraryViewSet: ('/api/itinerary/itineraries/', {
+                'title': 'Trip 1', 'user': self.user.pk, 'itinerary_id__in': '1,2',
+                'create_time__gte': '2000-01-01T00:00:00Z', 'page_size': 5, 'count': 'true',
+            }),
+            DailyScheduleViewSet: ('/api/itinerary/daily-schedules/', {
+                'itinerary': Itinerary.objects.first().pk, 'day_number__lte': 2,
+            }),
+            POIViewSet: ('/api/itinerary/pois/', {
+                'category__in': 'Museum,Nature', 'name': 'POI 1-1-0', 'schedule': DailySchedule.objects.first().pk,
+            }),
+        }
+        for viewset, (url, params) in cases.items():
+            for name, value in params.items():
+                with count_queries() as counter:
+                    response = self.client.get(url, {name: value})
+                self.assertEqual(response.status_code, 200, (url, name, response.data))
+                self.assertLessEqual(counter.count, get_query_budget(viewset(), 'list'), (url, name))
+
+        response = self.client.get('/api/itinerary/itineraries/', {'title': 'Trip 1'})
+        self.assertEqual([item['title'] for item in response.data['data']['results']], ['Trip 1'])
+
+    def test_foreign_keys_filter_by_id(self):
+        build_itineraries(self.user, itineraries=2)
+        itinerary = Itinerary.objects.order_by('pk').first()
+        url = '/api/itinerary/daily-schedules/'
+        with count_queries() as unfiltered:
+            self.client.get(url)
+        # The id is used as is, without a query loading the itinerary
+        with count_queries() as filtered:
+            response = self.client.get(url, {'itinerary': itinerary.pk})
+        self.assertEqual(filtered.count, unfiltered.count)
+        self.assertEqual(
+            {item['schedule_id'] for item in response.data['data']['results']},
+            set(itinerary.daily_schedules.values_list('pk', flat=True)),
+        )
+        response = self.client.get(url, {'itinerary': 10 ** 6})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['results'], [])
+        self.assertEqual(self.client.get(url, {'itinerary': '1.5'}).status_code, 400)
+
+        schedule = itinerary.daily_schedules.get(day_number=2)
+        response = self.client.get('/api/itinerary/pois/', {'schedule': schedule.pk})
+        self.assertEqual(
+            sorted(item['name'] for item in response.data['data']['results']),
+            [f'POI {itinerary.pk}-2-0', f'POI {itinerary.pk}-2-1'],
+        )
+
+
+class SeedScaleTestCase(APITestCase):
+    """
+    seed_scale generates consistent, reproducible data
+    """
+
+    def seed(self, **options):
+        options = {'users': 6, 'pois': 300, 'itineraries': 25, 'reviews': 60,
+                   'chunk_size': 64, 'seed': 7, **options}
+        call_command('seed_scale', stdout=io.StringIO(), **options)
+
+    def test_seeded_rows(self):
+        self.seed()
+        self.assertEqual(User.objects.filter(username__startswith='seed_').count(), 6)
+        self.assertEqual(POI.objects.count(), 300)
+        self.assertEqual(Itinerary.objects.count(), 25)
+        self.assertEqual(Review.objects.count(), 60)
+
+        days = DailySchedule.objects.values_list('itinerary_id', 'day_number')
+        for itinerary in Itinerary.objects.all():
+            numbers = sorted(day for itinerary_id, day in days if itinerary_id == itinerary.pk)
+            self.assertEqual(numbers, list(range(1, len(numbers) + 1)))
+            self.assertTrue(1 <= len(numbers) <= 7)
+            self.assertTrue(itinerary.title.startswith(f'{len(numbers)}-day trip to '))
+
+        # Every stop of an itinerary is in its city
+        for title, location in SchedulePOI.objects.values_list('schedule__itinerary__title', 'poi__location'):
+            self.assertEqual(title.split(' to ', 1)[1], location.split(', ', 1)[1])
+
+        poi = POI.objects.order_by('pk').first()
+        self.assertIsNotNone(poi.catalog_key)
+        self.assertIsNotNone(poi.geohash)
+        if poi.opening_hours:
+            self.assertEqual(poi.opening_intervals, parse_opening_hours(poi.opening_hours))
+        self.assertTrue(poi_search.search(POI.objects.all(), poi.name))
+
+        response = self.client.post('/auth/login/', {
+            'email': User.objects.filter(username__startswith='seed_').first().email,
+            'password': seed_scale.SEED_PASSWORD,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_seeding_again_appends(self):
+        self.seed()
+        self.seed(seed=8)
+        self.assertEqual(POI.objects.count(), 600)
+        self.assertEqual(Itinerary.objects.count(), 50)
+        # The second run numbers its rows after the first one and links only its own POIs
+        first_poi = POI.objects.order_by('pk')[300].pk
+        second_run = SchedulePOI.objects.filter(schedule__itinerary__in=Itinerary.objects.order_by('pk')[25:])
+        self.assertFalse(second_run.filter(poi_id__lt=first_poi).exists())
+
+    def test_rows_do_not_depend_on_workers(self):
+        blocks = seed_scale.city_blocks(400)
+        tasks = [(3, chunk, 1 + chunk * 100, chunk * 100, 100, blocks, True) for chunk in range(4)]
+
+        def without_timestamps(results):
+            rows = []
+            for tables in results:
+                for model, names, table_rows in tables:
+                    keep = [i for i, name in enumerate(names) if name not in ('create_time', 'update_time')]
+                    rows.extend(tuple(row[i] for i in keep) for row in table_rows)
+            return rows
+
+        serial = without_timestamps(seed_scale.run_tasks(seed_scale.generate_pois, tasks, 1))
+        parallel = without_timestamps(seed_scale.run_tasks(seed_scale.generate_pois, tasks, 2))
+        self.assertEqual(serial, parallel)
+        self.assertNotEqual(
+            serial,
+            without_timestamps(seed_scale.run_tasks(
+                seed_scale.generate_pois, [(4, *task[1:]) for task in tasks], 1
+            )),
+        )
+
+
+class BenchmarkTestCase(APITestCase):
+    """
+    The benchmark suite runs within its query budgets and runs are compared with a baseline
+    """
+
+    def test_suite_within_budgets(self):
+        call_command('seed_scale', users=4, pois=200, itineraries=12, reviews=20, seed=5, stdout=io.StringIO())
+        # 200 POIs are 10 pages: depth 100 is skipped rather than failing
+        suite = benchmark_command.build_suite(depths=(1, 3, 100), sizes=(1, 5), auth_rounds=1)
+        with self.settings(INSTRUMENTATION={'ENABLED': False}):
+            run = benchmark.run_benchmarks(suite, rounds=2)
+
+        self.assertEqual(benchmark.budget_violations(run), [])
+        for name in ('serializer.itinerary_nested.5', 'pagination.keyset.depth_3',
+                     'pagination.page_number.depth_3', 'envelope.wrap_and_render',
+                     'endpoint.itinerary_list', 'endpoint.poi_search', 'endpoint.login', 'endpoint.register'):
+            self.assertIn(name, run['results'])
+        self.assertNotIn('pagination.page_number.depth_100', run['results'])
+        self.assertEqual(run['results']['endpoint.login']['rounds'], 1)
+        self.assertEqual(run['results']['pagination.keyset.depth_3']['queries'], 1)
+        self.assertEqual(run['environment']['database'], 'sqlite')
+
+    def test_history_and_comparison(self):
+        def run_with(**results):
+            return {'timestamp': 'now', 'results': {
+                name: {'median_ms': median, 'queries': queries, 'max_queries': None}
+                for name, (median, queries) in results.items()
+            }}
+
+        baseline = run_with(fast=(10.0, 1), slow=(10.0, 1), queries=(10.0, 1), same=(10.0, 1))
+        current = run_with(fast=(5.0, 1), slow=(20.0, 1), queries=(10.0, 2), same=(11.0, 1), added=(1.0, 0))
+        statuses = {row['name']: row['status'] for row in benchmark.compare(current, baseline, tolerance=0.25)}
+        self.assertEqual(statuses, {
+            'fast': 'improvement', 'slow': 'regression', 'queries': 'regression',
+            'same': 'unchanged', 'added': 'new',
+        })
+
+        with tempfile.TemporaryDirectory() as directory:
+            history = os.path.join(directory, 'history.json')
+            self.assertEqual(benchmark.load_history(history), [])
+            benchmark.append_history(baseline, history)
+            benchmark.append_history(current, history)
+            self.assertEqual(benchmark.load_history(history), [baseline, current])
+
+            path = os.path.join(directory, 'baseline.json')
+            self.assertIsNone(benchmark.load_baseline(path))
+            benchmark.save_baseline(baseline, path)
+            self.assertEqual(benchmark.load_baseline(path), baseline)
+
+
+@override_settings(
+    INSTRUMENTATION={'ENABLED': True, 'SAMPLE_RATE': 1.0, 'SLOW_QUERY_MS': 10 ** 6, 'SERVER_TIMING': True},
+    INTERNAL_IPS=['127.0.0.1'],
+)
+class InstrumentationTestCase(AuthenticatedAPITestCase):
+    """
+    Sampled requests report their SQL, serialization and render timings
+    """
+
+    username = 'timing'
+
+    def setUp(self):
+        super().setUp()
+        itinerary_cache.get_cache().clear()
+        build_itineraries(self.user, itineraries=2)
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('utils.instrumentation', 'INFO') as logs:
+            with count_queries() as counter:
+                response = self.client.get('/api/itinerary/itineraries/')
+        self.assertEqual(response.status_code, 200)
+
+        metrics = dict(
+            part.split(';')[0:2] for part in
+            (item.strip().replace('dur=', '') for item in response['Server-Timing'].split(','))
+        )
+        self.assertEqual(set(metrics), {'db', 'serialize', 'envelope', 'render', 'total'})
+        self.assertGreater(float(metrics['serialize']), 0)
+
+        record = json.loads(logs.records[-1].getMessage())
+        # The header rounds to 0.1 ms, which a small page can render in
+        self.assertGreater(record['render_ms'], 0)
+        self.assertEqual(record['event'], 'request')
+        self.assertEqual(record['queries'], counter.count)
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['view'], 'itinerary-list')
+        self.assertLessEqual(record['db_ms'], record['total_ms'])
+
+    def test_server_timing_for_internal_ips_only(self):
+        with self.assertLogs('utils.instrumentation', 'INFO'):
+            with self.settings(INTERNAL_IPS=['10.0.0.5']):
+                response = self.client.get('/api/itinerary/itineraries/', HTTP_X_FORWARDED_FOR='10.0.0.5')
+            self.assertNotIn('Server-Timing', response)
+            with self.settings(INSTRUMENTATION={'ENABLED': True, 'SAMPLE_RATE': 1.0}):
+                response = self.client.get('/api/itinerary/itineraries/')
+            self.assertNotIn('Server-Timing', response)
+
+    def test_slow_query_log(self):
+        with self.settings(INSTRUMENTATION={'ENABLED': True, 'SAMPLE_RATE': 1.0, 'SLOW_QUERY_MS': 0,
+                                            'LOG_REQUESTS': False}):
+            with self.assertLogs('utils.instrumentation.slow_queries', 'WARNING') as logs:
+                self.client.get('/api/itinerary/pois/', {'poi_id__in': '1,2,3'})
+        slow = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertTrue(any('IN (...)' in entry['sql'] for entry in slow))
+        self.assertTrue(all(len(entry['fingerprint']) == 12 for entry in slow))
+
+    def test_fingerprint(self):
+        first = fingerprint("SELECT * FROM poi WHERE name = 'Opera' AND poi_id IN (%s, %s) LIMIT 21")
+        second = fingerprint("SELECT *  FROM poi WHERE name = 'Bridge' AND poi_id IN (%s) LIMIT 5")
+        self.assertEqual(first, second)
+        self.assertEqual(first[0], 'SELECT * FROM poi WHERE name = ? AND poi_id IN (...) LIMIT ?')
+        rows = fingerprint('INSERT INTO poi (name, rating) VALUES (%s, %s), (%s, %s), (%s, %s)')
+        self.assertEqual(rows[0], 'INSERT INTO poi (name, rating) VALUES (...)')
+
+    def test_unsampled_requests_are_untouched(self):
+        for config in ({'ENABLED': True, 'SAMPLE_RATE': 0.0}, {'SAMPLE_RATE': 1.0}):
+            with self.settings(INSTRUMENTATION=config):
+                with self.assertNoLogs('utils.instrumentation', 'INFO'):
+                    response = self.client.get('/api/itinerary/itineraries/')
+            self.assertNotIn('Server-Timing', response)
+
+
+class DetailCacheTestCase(AuthenticatedAPITestCase):
+    """
+    Itinerary details are served from the cache until something in the tree changes
+    """
+
+    username = 'cache'
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            build_itineraries(self.user, itineraries=1, days=2, pois_per_day=2)
+        self.itinerary = Itinerary.objects.get()
+        self.url = f'/api/itinerary/itineraries/{self.itinerary.pk}/'
+        itinerary_cache.get_cache().clear()
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        with count_queries() as counter:
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        # Only the ETag validator aggregate reaches the database
+        self.assertEqual(counter.count, 1)
+
+    def test_invalidated_by_poi_change(self):
+        self.client.get(self.url)
+        poi = POI.objects.filter(schedules__itinerary=self.itinerary).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            poi.name = 'Renamed'
+            poi.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        names = [p['name'] for day in response.data['data']['daily_schedules'] for p in day['pois']]
+        self.assertIn('Renamed', names)
+
+    def test_invalidated_by_schedule_delete(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            DailySchedule.objects.filter(itinerary=self.itinerary, day_number=2).delete()
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data['data']['daily_schedules']), 1)
+
+    def test_key_normalised(self):
+        padded = f'/api/itinerary/itineraries/0{self.itinerary.pk}/'
+        self.assertEqual(self.client.get(padded)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            Itinerary.objects.filter(pk=self.itinerary.pk).first().save()
+        self.assertEqual(self.client.get(padded)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/itinerary/itineraries/abc/').status_code, 404)
+
+    def test_object_permissions_bypass_cache(self):
+        class OwnerOnly(permissions.BasePermission):
+            def has_object_permission(self, request, view, obj):
+                return obj.user_id != request.user.pk
+
+        self.client.get(self.url)
+        with mock.patch.object(ItineraryViewSet, 'permission_classes', [permissions.IsAuthenticated, OwnerOnly]):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('X-Cache', response)
+
+
+class ConditionalRequestTestCase(AuthenticatedAPITestCase):
+    """
+    ETag / Last-Modified validators answer unchanged reads with 304 and guard updates
+    """
+
+    username = 'etag'
+
+    def setUp(self):
+        super().setUp()
+        build_itineraries(self.user, itineraries=2, days=2, pois_per_day=1)
+        self.itinerary = Itinerary.objects.first()
+        self.url = f'/api/itinerary/itineraries/{self.itinerary.pk}/'
+        itinerary_cache.get_cache().clear()
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_nested_delete_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        POI.objects.filter(schedules__itinerary=self.itinerary).first().delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_depends_on_query(self):
+        etag = self.client.get('/api/itinerary/itineraries/')['ETag']
+        response = self.client.get('/api/itinerary/itineraries/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/api/itinerary/itineraries/?page_size=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_match_prevents_lost_update(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.patch(self.url, {'title': 'First'}, HTTP_IF_MATCH=etag, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(self.url, {'title': 'Second'}, HTTP_IF_MATCH=etag, format='json')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.data['success'], 0)
+        self.itinerary.refresh_from_db()
+        self.assertEqual(self.itinerary.title, 'First')
+
+    def test_if_match_checked_under_row_lock(self):
+        etag = self.client.get(self.url)['ETag']
+        original = QuerySet.select_for_update
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=original) as lock:
+            response = self.client.patch(self.url, {'title': 'Locked'}, HTTP_IF_MATCH=etag, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lock.call_count, 1)
+
+    def test_detail_etag_depends_on_fieldset(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, {'fields': 'title'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_validator_reads_page_rows_only(self):
+        url = '/api/itinerary/itineraries/?page_size=1'
+        with CaptureQueriesContext(connection) as queries:
+            etag = self.client.get(url)['ETag']
+        validator_sql = [q['sql'] for q in queries.captured_queries if 'COUNT(DISTINCT' in q['sql']]
+        self.assertEqual(len(validator_sql), 1)
+        self.assertIn(' IN (', validator_sql[0])
+
+        # Rows outside the page don't change its ETag, rows on it do
+        newest = Itinerary.objects.order_by('-update_time', '-pk').first()
+        other = Itinerary.objects.exclude(pk=newest.pk).first()
+        DailySchedule.objects.filter(itinerary=other).first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        POI.objects.filter(schedules__itinerary=newest).first().delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class SparseFieldsTestCase(AuthenticatedAPITestCase):
+    """
+    ?fields= and ?expand= shape reads and what they load; writes are unaffected
+    """
+
+    username = 'sparse'
+
+    def setUp(self):
+        super().setUp()
+        build_itineraries(self.user, itineraries=2, days=2, pois_per_day=2)
+        self.itinerary = Itinerary.objects.order_by('pk').first()
+        self.url = f'/api/itinerary/itineraries/{self.itinerary.pk}/'
+        itinerary_cache.get_cache().clear()
+
+    def test_nested_fields(self):
+        response = self.client.get(self.url, {'fields': 'itinerary_id,title,daily_schedules.day_number'})
+        self.assertEqual(response.status_code, 200)
+        data = response.data['data']
+        self.assertEqual(set(data), {'itinerary_id', 'title', 'daily_schedules'})
+        self.assertEqual(data['daily_schedules'], [{'day_number': 1}, {'day_number': 2}])
+        self.assertNotIn('X-Cache', response)
+
+    def test_nested_poi_fields(self):
+        response = self.client.get(self.url, {'fields': 'daily_schedules.pois.name'})
+        names = [poi for day in response.data['data']['daily_schedules'] for poi in day['pois']]
+        self.assertEqual(names[0], {'name': f'POI {self.itinerary.pk}-1-0'})
+        self.assertTrue(all(set(poi) == {'name'} for poi in names))
+
+    def test_expand_collapses_other_relations(self):
+        response = self.client.get(self.url, {'fields': 'title,daily_schedules', 'expand': ''})
+        days = response.data['data']['daily_schedules']
+        expected = list(self.itinerary.daily_schedules.order_by('day_number').values_list('pk', flat=True))
+        self.assertEqual(days, expected)
+
+        response = self.client.get(self.url, {'expand': 'daily_schedules'})
+        day = response.data['data']['daily_schedules'][0]
+        schedule = DailySchedule.objects.get(itinerary=self.itinerary, day_number=1)
+        expected = list(schedule.poi_links.order_by('order').values_list('poi_id', flat=True))
+        self.assertEqual(day['pois'], expected)
+
+    def test_loads_only_requested_columns(self):
+        with count_queries() as full:
+            self.client.get('/api/itinerary/itineraries/')
+        with CaptureQueriesContext(connection) as sparse:
+            self.client.get('/api/itinerary/itineraries/', {'fields': 'itinerary_id,title'})
+        self.assertLess(len(sparse.captured_queries), full.count)
+        select = next(q['sql'] for q in sparse.captured_queries if 'FROM "itineraries"' in q['sql'])
+        self.assertNotIn('"user_id"', select)
+
+    def test_unknown_names_are_rejected(self):
+        for params in (
+            {'fields': 'title,nope'},
+            {'fields': 'daily_schedules.nope'},
+            {'fields': 'title.day_number'},
+            {'expand': 'title'},
+        ):
+            with count_queries() as counter:
+                response = self.client.get('/api/itinerary/itineraries/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertEqual(counter.count, 0, params)
+
+    def test_writes_ignore_fieldset(self):
+        response = self.client.patch(f'{self.url}?fields=title', {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('daily_schedules', response.data['data'])
+
+    def test_poi_and_schedule_lists(self):
+        response = self.client.get('/api/itinerary/pois/', {'fields': 'poi_id,name'})
+        self.assertEqual(set(response.data['data']['results'][0]), {'poi_id', 'name'})
+        response = self.client.get('/api/itinerary/daily-schedules/', {'fields': 'day_number', 'expand': ''})
+        self.assertEqual(set(response.data['data']['results'][0]), {'day_number'})
+
+
+class CompiledSerializerTestCase(AuthenticatedAPITestCase):
+    """
+    list and retrieve render values() rows byte for byte like the serializers
+    """
+
+    username = 'compiled'
+
+    def setUp(self):
+        super().setUp()
+        build_itineraries(self.user, itineraries=3, days=2, pois_per_day=3)
+        POI.objects.filter(pk__in=POI.objects.order_by('pk').values('pk')[:4]).update(
+            latitude=34.6873, longitude=135.5259, rating=Decimal('4.5'), description='Castle'
+        )
+        self.itinerary = Itinerary.objects.order_by('pk').first()
+        itinerary_cache.get_cache().clear()
+
+    def get_both(self, url, params=None):
+        """Response bodies with the compiled path and with the serializer"""
+        compiled = self.client.get(url, params)
+        itinerary_cache.get_cache().clear()
+        with mock.patch.object(CustomModelViewSet, 'compiled_reads', False):
+            serialized = self.client.get(url, params)
+        itinerary_cache.get_cache().clear()
+        self.assertEqual(compiled.status_code, serialized.status_code)
+        return compiled.content, serialized.content
+
+    def test_same_output(self):
+        schedule = DailySchedule.objects.order_by('pk').first()
+        poi = POI.objects.order_by('pk').first()
+        for url, params in (
+            ('/api/itinerary/itineraries/', None),
+            ('/api/itinerary/itineraries/', {'page_size': 2, 'count': 'true'}),
+            (f'/api/itinerary/itineraries/{self.itinerary.pk}/', None),
+            (f'/api/itinerary/itineraries/{self.itinerary.pk}/', {'fields': 'title,daily_schedules.pois.rating'}),
+            ('/api/itinerary/itineraries/', {'fields': 'title,daily_schedules', 'expand': ''}),
+            ('/api/itinerary/itineraries/', {'expand': 'daily_schedules'}),
+            ('/api/itinerary/daily-schedules/', None),
+            (f'/api/itinerary/daily-schedules/{schedule.pk}/', None),
+            ('/api/itinerary/pois/', None),
+            (f'/api/itinerary/pois/{poi.pk}/', None),
+            ('/api/itinerary/pois/999999/', None),
+        ):
+            compiled, serialized = self.get_both(url, params)
+            self.assertEqual(compiled, serialized, (url, params))
+
+    def test_malformed_pk(self):
+        for url in ('/api/itinerary/pois/abc/', '/api/itinerary/daily-schedules/abc/'):
+            compiled, serialized = self.get_both(url)
+            self.assertEqual(compiled, serialized, url)
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_no_instances(self):
+        with mock.patch.object(POI, 'from_db', side_effect=AssertionError('instance built')), \
+                mock.patch.object(Itinerary, 'from_db', side_effect=AssertionError('instance built')):
+            response = self.client.get('/api/itinerary/itineraries/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']['results']), 3)
+
+    def test_same_cursor(self):
+        compiled = self.client.get('/api/itinerary/itineraries/', {'page_size': 1})
+        with mock.patch.object(CustomModelViewSet, 'compiled_reads', False):
+            serialized = self.client.get('/api/itinerary/itineraries/', {'page_size': 1})
+        self.assertEqual(compiled.data['data']['next'], serialized.data['data']['next'])
+
+    def test_unsupported_serializer_falls_back(self):
+        class ComputedSerializer(POISerializer):
+            label = serializers.SerializerMethodField()
+
+            def get_label(self, poi):
+                return poi.name.upper()
+
+        self.assertIsNotNone(compile_serializer(ItinerarySerializer))
+        self.assertIsNone(compile_serializer(ComputedSerializer))
+
+
+class RendererTestCase(AuthenticatedAPITestCase):
+    """
+    EnvelopeJSONRenderer / FastJSONParser behave exactly like DRF's JSON renderer and parser
+    """
+
+    username = 'render'
+
+    def setUp(self):
+        super().setUp()
+        build_itineraries(self.user, itineraries=2, days=2, pois_per_day=2)
+
+    def test_same_bytes_as_json_renderer(self):
+        response = self.client.get('/api/itinerary/itineraries/')
+        self.assertIsInstance(response.data, Envelope)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+        data = Envelope({
+            'rating': Decimal('4.50'),
+            'at': timezone.now(),
+            'day': date(2025, 5, 1),
+            'time': time(9, 30, 0, 5000),
+            'label': gettext_lazy('Operation successful'),
+            'text': 'caf\u00e9 \u2028 \u2029',
+            7: (1, 2),
+        }, success=0, msg='Custom')
+        with mock.patch('utils.renderers.orjson', None):
+            fallback = EnvelopeJSONRenderer().render(data)
+        self.assertEqual(EnvelopeJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(fallback, JSONRenderer().render(data))
+
+    def test_envelope_status(self):
+        response = self.client.get('/api/itinerary/itineraries/999999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['success'], 0)
+        self.assertEqual(response.json()['msg'], 'Operation failed')
+
+    def test_indent_and_wide_integers_fall_back(self):
+        response = self.client.get('/api/itinerary/itineraries/', HTTP_ACCEPT='application/json; indent=2')
+        self.assertIn(b'\n  "success": 1', response.content)
+        self.assertEqual(EnvelopeJSONRenderer().render({'n': 2 ** 70}), b'{"n":1180591620717411303424}')
+
+    def test_parser(self):
+        body = json.dumps({'title': 'Parsed \u00e9', 'daily_schedules': []})
+        response = self.client.post('/api/itinerary/itineraries/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['data']['title'], 'Parsed \u00e9')
+
+        response = self.client.post('/api/itinerary/itineraries/', '{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['data']['detail'])
+        with mock.patch('utils.renderers.orjson', None):
+            fallback = self.client.post('/api/itinerary/itineraries/', '{"title": ', content_type='application/json')
+        self.assertEqual(fallback.content, response.content)
+
+
+class AsyncReadTestCase(AuthenticatedAPITestCase):
+    """
+    The async endpoints return what the sync list and retrieve actions return
+    """
+
+    username = 'async'
+    token_auth = True
+
+    def setUp(self):
+        super().setUp()
+        build_itineraries(self.user, itineraries=3, days=2, pois_per_day=2)
+        self.itinerary = Itinerary.objects.order_by('pk').first()
+        itinerary_cache.get_cache().clear()
+
+    def assertSameResponse(self, path, params=None):
+        sync = self.client.get(f'/api/itinerary/{path}', params)
+        response = self.client.get(f'/api/itinerary/async/{path}', params)
+        self.assertEqual(response.status_code, sync.status_code)
+        # Page links point back to the endpoint they came from
+        body = response.content.decode().replace('/api/itinerary/async/', '/api/itinerary/')
+        self.assertEqual(json.loads(body), sync.json())
+        return response
+
+    def test_list(self):
+        for path in ('itineraries/', 'daily-schedules/', 'pois/'):
+            with self.subTest(path=path):
+                self.assertSameResponse(path)
+        response = self.assertSameResponse('itineraries/', {'page_size': 2, 'count': 'true'})
+        next_url = response.json()['data']['next']
+        self.assertSameResponse('itineraries/', {'page_size': 2, 'cursor': next_url.split('cursor=')[1]})
+
+    def test_filters_and_sparse_fields(self):
+        self.assertSameResponse('daily-schedules/', {'itinerary': self.itinerary.pk, 'day_number__gte': 2})
+        self.assertSameResponse('itineraries/', {'fields': 'itinerary_id,title'})
+        self.assertSameResponse('itineraries/', {'colour': 'red'})
+
+    def test_retrieve(self):
+        url = f'itineraries/{self.itinerary.pk}/'
+        response = self.assertSameResponse(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        itinerary_cache.get_cache().clear()
+        self.assertEqual(self.client.get(f'/api/itinerary/async/{url}')['X-Cache'], 'MISS')
+        schedule = self.itinerary.daily_schedules.first()
+        self.assertSameResponse(f'daily-schedules/{schedule.pk}/')
+        self.assertSameResponse(f'pois/{POI.objects.first().pk}/')
+
+    def test_errors(self):
+        self.assertSameResponse('itineraries/999999/')
+        self.client.credentials()
+        response = self.assertSameResponse('itineraries/')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(self.assertSameResponse('pois/').status_code, 401)
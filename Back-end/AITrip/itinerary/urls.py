@@ -1,12 +1,24 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import ItineraryViewSet, DailyScheduleViewSet, POIViewSet
+from .async_views import ItineraryAsyncView, DailyScheduleAsyncView, POIAsyncView
 
 router = DefaultRouter()
 router.register(r'itineraries', ItineraryViewSet, basename='itinerary')
 router.register(r'daily-schedules', DailyScheduleViewSet, basename='daily-schedule')
 router.register(r'pois', POIViewSet, basename='poi')
 
+# Async list/retrieve for ASGI deployments (see async_views.py)
+async_urlpatterns = [
+    path('itineraries/', ItineraryAsyncView.as_view(), name='itinerary-async-list'),
+    path('itineraries/<int:pk>/', ItineraryAsyncView.as_view(), name='itinerary-async-detail'),
+    path('daily-schedules/', DailyScheduleAsyncView.as_view(), name='daily-schedule-async-list'),
+    path('daily-schedules/<int:pk>/', DailyScheduleAsyncView.as_view(), name='daily-schedule-async-detail'),
+    path('pois/', POIAsyncView.as_view(), name='poi-async-list'),
+    path('pois/<int:pk>/', POIAsyncView.as_view(), name='poi-async-detail'),
+]
+
 urlpatterns = [
+    path('async/', include(async_urlpatterns)),
     path('', include(router.urls))
 ]
\ No newline at end of file
@@ -1,37 +1,320 @@
 from django.shortcuts import render
 
 # Create your views here.
-from rest_framework import viewsets, permissions
-from .models import Itinerary, DailySchedule, POI
+from django.http import Http404, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rest_framework import viewsets, permissions, serializers, status
+from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from .models import Itinerary, DailySchedule, POI, SchedulePOI
 from .serializers import ItinerarySerializer, DailyScheduleSerializer, POISerializer
-from django_filters.rest_framework import DjangoFilterBackend
 
-from utils.response import CustomModelViewSet
-from utils.customPagination import CustomPagination
+from utils.filterPlanner import StrictFilterBackend
+from utils.response import CustomModelViewSet, ResponseHandler
+from utils.sparseFields import SPARSE_QUERY_PARAMS
+from .catalog import optimize_schedule_routes
+from .export import stream_ndjson, stream_csv
+from .feasibility import check_itineraries
+from .filters import ItineraryFilter, DailyScheduleFilter, POIFilter
+from . import cache as itinerary_cache
+from . import geo
+from . import search as poi_search
+
+def get_flag(data, name):
+    """
+    Boolean body parameter, False when missing; accepts what BooleanField
+    does (true/false, 1/0, "yes"/"no", ...) and rejects anything else with 400
+    """
+    if name not in data:
+        return False
+    try:
+        return serializers.BooleanField().to_internal_value(data[name])
+    except serializers.ValidationError as e:
+        raise serializers.ValidationError({name: e.detail})
 
 class ItineraryViewSet(CustomModelViewSet):
     queryset = Itinerary.objects.all()
     serializer_class = ItinerarySerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = '__all__'
-    pagination_class = CustomPagination
+    filter_backends = [StrictFilterBackend]
+    filterset_class = ItineraryFilter
+    extra_query_params = SPARSE_QUERY_PARAMS
+    action_query_params = {'export': ('output',), 'feasibility': ('start_date',)}
+    query_budgets = {'list': 6, 'retrieve': 5}
+    validator_relations = ('daily_schedules', 'daily_schedules__poi_links', 'daily_schedules__pois')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Serve the itinerary tree from the read-through cache; sparse
+        responses (?fields= / ?expand=) are built directly
+
+        A cache hit never loads the object, so the cache is only used while
+        no permission class checks objects (see checks_object_permissions)
+        """
+        if self.get_sparse_fieldset() is not None or self.checks_object_permissions():
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            # '01' and '1' are the same itinerary; invalidation uses the int pk
+            itinerary_id = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404('No Itinerary matches the given query.')
+        data, hit = itinerary_cache.get_or_build(
+            itinerary_id,
+            self.get_object_data
+        )
+        response = Response(data)
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
+
+    @action(detail=False, methods=['get'], url_path='cache-stats',
+            permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        """Hit/miss counters of the itinerary detail cache in this process"""
+        return ResponseHandler.success(data=itinerary_cache.metrics.snapshot())
+
+    @action(detail=True, methods=['post'], url_path='optimize-routes')
+    def optimize_routes(self, request, pk=None):
+        """
+        Reorder the POIs of every day of the itinerary to minimise travel
+
+        Body:
+            fixed_start: Keep the current first POI of each day first (default false)
+        """
+        itinerary = self.get_object()
+        schedule_ids = [schedule.pk for schedule in itinerary.daily_schedules.all()]
+        routes = optimize_schedule_routes(schedule_ids, fixed_start=get_flag(request.data, 'fixed_start'))
+        itinerary = self.get_queryset().get(pk=itinerary.pk)
+        data = self.get_serializer(itinerary).data
+        data['routes'] = routes
+        return ResponseHandler.success(data=data, msg='Routes optimized')
+
+    feasibility_batch_limit = 1000
+
+    def get_start_date(self, value):
+        """Parse the date of day 1; defaults to today"""
+        if not value:
+            return timezone.localdate()
+        try:
+            return parse_date(str(value))
+        except ValueError:
+            return None
+
+    @action(detail=True, methods=['get'])
+    def feasibility(self, request, pk=None):
+        """
+        Check the days of the itinerary against opening hours and day end times
+
+        Query params:
+            start_date: Date of day 1 (YYYY-MM-DD, default today)
+        """
+        start_date = self.get_start_date(request.query_params.get('start_date'))
+        if start_date is None:
+            return ResponseHandler.error(msg='start_date must be a date (YYYY-MM-DD)')
+        itinerary = get_object_or_404(self.filter_queryset(Itinerary.objects.only('pk')), pk=pk)
+        self.check_object_permissions(request, itinerary)
+        return ResponseHandler.success(data=check_itineraries([itinerary.pk], start_date)[0])
+
+    @action(detail=False, methods=['post'], url_path='feasibility')
+    def batch_feasibility(self, request):
+        """
+        Check several of the user's itineraries in one pass
+
+        Body:
+            itinerary_ids: IDs to check (default: all of the user's itineraries)
+            start_date: Date of day 1 of every itinerary (YYYY-MM-DD, default today)
+        """
+        start_date = self.get_start_date(request.data.get('start_date'))
+        if start_date is None:
+            return ResponseHandler.error(msg='start_date must be a date (YYYY-MM-DD)')
+
+        queryset = Itinerary.objects.filter(user=request.user)
+        requested = request.data.get('itinerary_ids')
+        if requested is not None:
+            if not isinstance(requested, list) or not all(isinstance(pk, int) for pk in requested):
+                return ResponseHandler.error(msg='itinerary_ids must be a list of integers')
+            queryset = queryset.filter(pk__in=requested)
+        itinerary_ids = list(
+            queryset.order_by('pk').values_list('pk', flat=True)[:self.feasibility_batch_limit + 1]
+        )
+        if len(itinerary_ids) > self.feasibility_batch_limit:
+            return ResponseHandler.error(
+                msg=f'At most {self.feasibility_batch_limit} itineraries can be checked per request'
+            )
+        return ResponseHandler.success(data=check_itineraries(itinerary_ids, start_date))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream every itinerary of the current user as NDJSON (default) or CSV
+
+        Query params:
+            output: 'ndjson' or 'csv'
+        """
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            return ResponseHandler.error(msg="output must be 'ndjson' or 'csv'")
+
+        queryset = self.filter_queryset(Itinerary.objects.filter(user=request.user))
+        if output == 'csv':
+            response = StreamingHttpResponse(stream_csv(queryset), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(stream_ndjson(queryset), content_type='application/x-ndjson')
+        response['Content-Disposition'] = f'attachment; filename="itineraries.{output}"'
+        return response
+
 class DailyScheduleViewSet(CustomModelViewSet):
     queryset = DailySchedule.objects.all()
     serializer_class = DailyScheduleSerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = '__all__'
-    pagination_class = CustomPagination
+    filter_backends = [StrictFilterBackend]
+    filterset_class = DailyScheduleFilter
+    extra_query_params = SPARSE_QUERY_PARAMS
+    query_budgets = {'list': 5, 'retrieve': 4}
+    validator_relations = ('poi_links', 'pois')
+
+    @action(detail=True, methods=['post'], url_path='optimize-route')
+    def optimize_route(self, request, pk=None):
+        """
+        Reorder the POIs of this day to minimise travel between stops
+
+        Body:
+            fixed_start: Keep the current first POI first (default false)
+        """
+        schedule = self.get_object()
+        routes = optimize_schedule_routes([schedule.pk], fixed_start=get_flag(request.data, 'fixed_start'))
+        schedule = self.get_queryset().get(pk=schedule.pk)
+        data = self.get_serializer(schedule).data
+        data['route'] = routes[schedule.pk]
+        return ResponseHandler.success(data=data, msg='Route optimized')
+
+    @action(detail=True, methods=['delete'], url_path=r'pois/(?P<poi_id>[0-9]+)')
+    def remove_poi(self, request, pk=None, poi_id=None):
+        """
+        Take a POI off this day; the catalog entry itself is kept for the
+        other itineraries visiting it
+        """
+        schedule = self.get_object()
+        deleted, _ = SchedulePOI.objects.filter(schedule=schedule, poi_id=poi_id).delete()
+        if not deleted:
+            return ResponseHandler.error(msg='POI is not part of this day', status_code=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 class POIViewSet(CustomModelViewSet):
     queryset = POI.objects.all()
     serializer_class = POISerializer
     permission_classes = [permissions.IsAuthenticated]
-    filter_backends = [DjangoFilterBackend]
-    filterset_fields = '__all__'
-    pagination_class = CustomPagination
\ No newline at end of file
+    # Catalog reads only need an authenticated id (AUTH_USER_CACHE['CLAIMS_USER'])
+    claims_user = True
+    filter_backends = [StrictFilterBackend]
+    # Indexed columns only; text is searched through the search action
+    filterset_class = POIFilter
+    extra_query_params = SPARSE_QUERY_PARAMS
+    action_query_params = {
+        'nearby': ('lat', 'lng', 'radius', 'limit'),
+        'search': ('q', 'prefix', 'limit'),
+    }
+    query_budgets = {'list': 4, 'retrieve': 3, 'nearby': 2, 'search': 2}
+    nearby_default_radius = 1000
+    nearby_max_radius = 50000
+    nearby_default_limit = 20
+    nearby_max_limit = 100
+
+    search_default_limit = 20
+    search_max_limit = 100
+
+    def get_permissions(self):
+        """
+        Catalog entries are shared by every itinerary, so only staff may edit
+        or delete them; users add POIs through create and take them off a day
+        with DELETE /daily-schedules/{id}/pois/{poi_id}/
+        """
+        if self.action in ('update', 'partial_update', 'destroy'):
+            return [permissions.IsAdminUser()]
+        return super().get_permissions()
+
+    def create(self, request, *args, **kwargs):
+        """
+        201 with the new catalog entry, or 200 with the existing one for the
+        same name and location, which is returned unchanged
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        poi = serializer.save()
+        data = self.get_serializer(poi).data
+        if serializer.existing:
+            return ResponseHandler.success(
+                data=data, msg='Existing catalog entry returned; submitted details were not applied'
+            )
+        return Response(data, status=status.HTTP_201_CREATED, headers=self.get_success_headers(data))
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """
+        Full-text search over name, category, description and review summary
+
+        Query params:
+            q: Search text; every word must match (required)
+            category: Only POIs of this category
+            prefix: Let the last word match as a prefix (default true)
+            limit: Maximum number of results (default 20, max 100)
+        """
+        query = request.query_params.get('q', '')
+        if not poi_search.tokenize(query):
+            return ResponseHandler.error(msg='q must contain at least one word')
+        try:
+            limit = int(request.query_params.get('limit', self.search_default_limit))
+        except ValueError:
+            return ResponseHandler.error(msg='limit must be a number')
+        limit = max(1, min(limit, self.search_max_limit))
+        prefix = request.query_params.get('prefix', 'true').lower() not in ('0', 'false', 'no')
+
+        queryset = self.filter_queryset(self.get_queryset())
+        matches = poi_search.search(queryset, query, prefix=prefix, limit=limit)
+        pois = self.get_queryset().in_bulk([pk for pk, _ in matches])
+
+        results = []
+        for pk, score in matches:
+            data = self.get_serializer(pois[pk]).data
+            data['score'] = score
+            results.append(data)
+        return ResponseHandler.success(data={'count': len(results), 'results': results})
+
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        """
+        POIs within a radius of a point, nearest first, each with its distance
+
+        Query params:
+            lat, lng: Centre of the search in degrees (required)
+            radius: Radius in meters (default 1000, max 50000)
+            limit: Maximum number of results (default 20, max 100)
+            Any POI filter field, e.g. category
+        """
+        try:
+            latitude = float(request.query_params['lat'])
+            longitude = float(request.query_params['lng'])
+            radius = float(request.query_params.get('radius', self.nearby_default_radius))
+            limit = int(request.query_params.get('limit', self.nearby_default_limit))
+        except (KeyError, ValueError):
+            return ResponseHandler.error(msg='lat and lng are required; lat, lng, radius and limit must be numbers')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return ResponseHandler.error(msg='lat must be within [-90, 90] and lng within [-180, 180]')
+        if not 0 < radius <= self.nearby_max_radius:
+            return ResponseHandler.error(msg=f'radius must be within (0, {self.nearby_max_radius}] meters')
+        limit = max(1, min(limit, self.nearby_max_limit))
+
+        queryset = self.filter_queryset(self.get_queryset())
+        matches = geo.nearby(queryset, latitude, longitude, radius, limit)
+        pois = self.get_queryset().in_bulk([pk for pk, _ in matches])
+
+        results = []
+        for pk, distance in matches:
+            data = self.get_serializer(pois[pk]).data
+            data['distance'] = round(distance, 1)
+            results.append(data)
+        return ResponseHandler.success(data={'count': len(results), 'results': results})
\ No newline at end of file
@@ -0,0 +1,19 @@
+"""
+Filters accepted by the review viewset; only index-backed fields and lookups
+(see utils.filterPlanner)
+"""
+
+from utils.filterPlanner import IndexedFilterSet
+from .models import Review
+
+
+class ReviewFilter(IndexedFilterSet):
+    class Meta:
+        model = Review
+        fields = {
+            'id': ['exact', 'in'],
+            'user': ['exact'],
+            'category': ['exact'],
+            'itinerary': ['exact'],
+            'poi': ['exact'],
+        }
@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-18 16:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('itinerary', '0006_itinerary_title_index'),
+        ('review', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['category'], name='review_revi_categor_a574af_idx'),
+        ),
+    ]
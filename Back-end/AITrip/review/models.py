@@ -14,6 +14,11 @@ class Review(models.Model):
     itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, null=True, blank=True)
     poi = models.ForeignKey(POI, on_delete=models.CASCADE, null=True, blank=True)
     feedback_text = models.TextField()
-    
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category']),
+        ]
+
     def __str__(self):
         return f"{self.user} - {self.category}"
@@ -1,3 +1,41 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from utils.filterPlanner import probe_querysets
+from utils.testing import AuthenticatedAPITestCase
+from .filters import ReviewFilter
+from .models import Review
+from .views import ReviewViewSet
+
+
+class ReviewFilterTestCase(AuthenticatedAPITestCase):
+    """
+    Reviews can only be filtered on indexed columns
+    """
+
+    username = 'reviewer'
+
+    def setUp(self):
+        super().setUp()
+        Review.objects.create(user=self.user, category='poi', feedback_text='Clean and quiet')
+        Review.objects.create(user=self.user, category='itinerary', feedback_text='Too rushed')
+
+    def test_explain_uses_indexes(self):
+        for field, lookup, queryset in probe_querysets(ReviewFilter):
+            plan = queryset.explain()
+            self.assertNotIn('SCAN review_review', plan, f'{field}__{lookup}: {plan}')
+
+    def test_filters(self):
+        response = self.client.get('/api/review/reviews/', {'category': 'poi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([review['feedback_text'] for review in response.data['results']], ['Clean and quiet'])
+
+        response = self.client.get('/api/review/reviews/', {'feedback_text': 'Too rushed'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['unsupported_filters'], ['feedback_text'])
+
+    def test_compiled_list_matches_serializer(self):
+        compiled = self.client.get('/api/review/reviews/')
+        with mock.patch.object(ReviewViewSet, 'compiled_reads', False):
+            serialized = self.client.get('/api/review/reviews/')
+        self.assertEqual(compiled.content, serialized.content)
+        self.assertEqual(len(compiled.data['results']), 2)
@@ -1,7 +1,14 @@
 from rest_framework import viewsets
 from .models import Review
 from .serializers import ReviewSerializer
+from .filters import ReviewFilter
+from utils.compiledSerializer import CompiledReadMixin
+from utils.customPagination import KeysetPagination
+from utils.filterPlanner import StrictFilterBackend
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(CompiledReadMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [StrictFilterBackend]
+    filterset_class = ReviewFilter
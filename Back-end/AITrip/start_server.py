@@ -1,8 +1,22 @@
 #!/usr/bin/env python
 """
 AITrip 后端服务器启动脚本
+
+    python start_server.py                  交互式菜单（开发服务器 runserver）
+    python start_server.py --production     非交互式生产模式
+
+生产模式在当前进程内完成检查（依赖、system check、迁移、超级用户），然后启动
+gunicorn 预派生（pre-fork）多进程服务器：应用在主进程中加载完毕后再 fork
+worker，worker 以写时复制（copy-on-write）方式共享已加载的代码和数据。
+worker 数默认按 CPU 核数计算，--asgi 使用 uvicorn worker（启用
+/api/itinerary/async/ 异步接口）。缓存为进程内 LocMemCache 时拒绝启动，
+除非显式指定 --allow-local-cache（或 AITRIP_ALLOW_LOCAL_CACHE=1）。
+
+收到 SIGTERM 时主进程停止接收新连接，等待 worker 处理完正在进行的请求
+（最多 --graceful-timeout 秒）后退出；SIGHUP 平滑重启全部 worker。
 """
 
+import argparse
 import os
 import sys
 import subprocess
@@ -32,8 +46,13 @@ def show_menu():
             sys.exit(0)
 
 
-def check_dependencies():
-    """检查依赖是否安装"""
+def check_dependencies(extra=()):
+    """
+    检查依赖是否安装
+
+    Args:
+        extra: 额外需要检查的 (模块名, pip 包名)
+    """
     print("📦 检查依赖...")
     missing_deps = []
 
@@ -68,10 +87,17 @@ def check_dependencies():
         missing_deps.append("django-cors-headers")
 
     # Check MySQL driver
-    try:
-        import MySQLdb
-    except ImportError:
-        missing_deps.append("mysqlclient")
+    if os.environ.get("DB_ENGINE") != "sqlite":
+        try:
+            import MySQLdb
+        except ImportError:
+            missing_deps.append("mysqlclient")
+
+    for module, package in extra:
+        try:
+            __import__(module)
+        except ImportError:
+            missing_deps.append(package)
 
     if missing_deps:
         print("❌ 检测到缺少以下依赖:")
@@ -208,13 +234,189 @@ def direct_startup():
     return True
 
 
+def default_workers(asgi):
+    """
+    按可用 CPU 核数计算 worker 进程数
+
+    同步 worker 一次只处理一个请求，等待数据库时 CPU 空闲，按 gunicorn 推荐的
+    2 * CPU + 1；ASGI worker 在事件循环上并发处理请求，每个 CPU 一个即可。
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    return cpus if asgi else 2 * cpus + 1
+
+
+def prepare_production(skip_migrate=False, allow_local_cache=False):
+    """
+    在当前进程内完成检查、迁移和超级用户创建，只初始化一次 Django
+
+    Returns:
+        是否可以继续启动
+    """
+    import django
+    from django.conf import settings
+    from django.core.management import CommandError, call_command
+    from django.db import DEFAULT_DB_ALIAS, connections
+    from django.db.migrations.executor import MigrationExecutor
+
+    django.setup()
+
+    # LocMemCache 只存在于单个 worker 内：用户缓存失效、令牌吊销刷新、登录限流
+    # 和行程详情缓存都无法在 worker 之间同步
+    if settings.CACHES["default"]["BACKEND"].endswith("LocMemCache"):
+        if not allow_local_cache:
+            print("❌ 缓存为进程内 LocMemCache，多个 worker 之间无法共享用户缓存失效、登录限流等状态")
+            print("   请通过 CACHE_BACKEND / CACHE_LOCATION 配置 Redis 等共享缓存；")
+            print("   单 worker 或确认可以接受时使用 --allow-local-cache（或 AITRIP_ALLOW_LOCAL_CACHE=1）")
+            return False
+        print("⚠️ 已允许进程内 LocMemCache：各 worker 的缓存和登录限流相互独立")
+
+    print("🔍 运行 Django system check...")
+    call_command("check")
+
+    if skip_migrate:
+        print("⏭️ 跳过数据库迁移")
+    else:
+        # 只应用已提交的迁移，生产环境不执行 makemigrations
+        executor = MigrationExecutor(connections[DEFAULT_DB_ALIAS])
+        if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+            print("🔄 执行数据库迁移...")
+            call_command("migrate", interactive=False, verbosity=1)
+            print("✅ 数据库迁移完成")
+        else:
+            print("✅ 数据库迁移已是最新状态")
+
+    # 生产环境不使用默认密码，只有显式设置了环境变量才创建超级用户
+    if os.environ.get("DJANGO_SUPERUSER_PASSWORD"):
+        print("👤 检查超级用户...")
+        try:
+            call_command("createsuperuser", interactive=False, verbosity=0)
+            print(f"✅ 超级用户创建完成: {os.environ.get('DJANGO_SUPERUSER_EMAIL')}")
+        except CommandError:
+            print("✅ 超级用户已存在")
+
+    if settings.DEBUG:
+        print("⚠️ DEBUG 已开启，生产环境请设置 DJANGO_DEBUG=0 和 DJANGO_ALLOWED_HOSTS")
+    return True
+
+
+def load_application(asgi):
+    """在主进程中加载应用，fork 后由所有 worker 共享"""
+    if asgi:
+        from AITrip.asgi import application
+    else:
+        from AITrip.wsgi import application
+    return application
+
+
+def serve(application, options):
+    """以 gunicorn 运行已加载的应用"""
+    from gunicorn.app.base import BaseApplication
+
+    class AITripServer(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return application
+
+    AITripServer().run()
+
+
+def on_starting(server):
+    print(f"🚀 主进程 {os.getpid()} 已启动，正在派生 {server.cfg.workers} 个 worker")
+
+
+def on_exit(server):
+    print("🛑 服务器已停止")
+
+
+def production_startup(args):
+    """非交互式生产模式启动"""
+    print("\n🏭 生产模式启动...")
+    print("=" * 40)
+
+    extra = [("gunicorn", "gunicorn")]
+    if args.asgi:
+        extra.extend([("uvicorn", "uvicorn"), ("uvicorn_worker", "uvicorn-worker")])
+    if not check_dependencies(extra):
+        return False
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "AITrip.settings")
+    if not prepare_production(skip_migrate=args.skip_migrate, allow_local_cache=args.allow_local_cache):
+        return False
+
+    application = load_application(args.asgi)
+    # fork 前关闭检查和迁移打开的连接，避免多个 worker 共用同一个 socket
+    from django.db import connections
+    connections.close_all()
+
+    workers = args.workers or default_workers(args.asgi)
+    options = {
+        "bind": args.bind,
+        "workers": workers,
+        "worker_class": "uvicorn_worker.UvicornWorker" if args.asgi else "sync",
+        "preload_app": True,
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "keepalive": 5,
+        "accesslog": "-",
+        "errorlog": "-",
+        "proc_name": "aitrip",
+        "on_starting": on_starting,
+        "on_exit": on_exit,
+    }
+
+    print("\n" + "=" * 40)
+    print("✅ 初始化完成！")
+    print(f"🌐 监听地址: {args.bind}（{'ASGI' if args.asgi else 'WSGI'}，{workers} 个 worker）")
+    print("按 Ctrl+C 或发送 SIGTERM 停止服务器，SIGHUP 平滑重启 worker")
+    print("-" * 50)
+    serve(application, options)
+    return True
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AITrip 后端服务器启动脚本")
+    parser.add_argument(
+        "--production", action="store_true",
+        help="非交互式生产模式：进程内检查后启动 gunicorn 多进程服务器",
+    )
+    parser.add_argument("--asgi", action="store_true", help="使用 uvicorn worker 以 ASGI 方式运行")
+    parser.add_argument("--workers", type=int, help="worker 进程数（默认按 CPU 核数计算）")
+    parser.add_argument(
+        "--bind", default=os.environ.get("AITRIP_BIND", "0.0.0.0:8080"),
+        help="监听地址（默认 0.0.0.0:8080，或环境变量 AITRIP_BIND）",
+    )
+    parser.add_argument("--timeout", type=int, default=30, help="worker 处理单个请求的超时秒数")
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=30,
+        help="停止或重启时等待正在处理的请求完成的秒数",
+    )
+    parser.add_argument("--skip-migrate", action="store_true", help="跳过数据库迁移")
+    parser.add_argument(
+        "--allow-local-cache", action="store_true",
+        default=os.environ.get("AITRIP_ALLOW_LOCAL_CACHE") == "1",
+        help="允许生产模式使用进程内 LocMemCache（默认拒绝启动）",
+    )
+    return parser.parse_args()
+
+
 def main():
     """主函数"""
+    args = parse_args()
+
     # 检查当前目录
     if not Path("manage.py").exists():
         print("❌ 请在项目根目录运行此脚本")
         sys.exit(1)
 
+    if args.production:
+        sys.exit(0 if production_startup(args) else 1)
+
     while True:
         choice = show_menu()
 
@@ -0,0 +1,142 @@
+"""
+Model clients used by the itinerary generation service
+
+A client turns the travel preferences submitted by the frontend into an
+itinerary payload accepted by ``ItinerarySerializer``:
+{
+    "title": str,
+    "daily_schedules": [
+        {"day_number": int, "start_time": "HH:MM:SS", "end_time": "HH:MM:SS",
+         "summary": str, "pois": [{"name": str, ...}]}
+    ]
+}
+
+The client class is configured with settings.ITINERARY_GENERATION['CLIENT']
+and receives settings.ITINERARY_GENERATION['CLIENT_OPTIONS'] as keyword args.
+"""
+
+import hashlib
+import json
+import random
+import time
+import urllib.request
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseItineraryClient:
+    """
+    Interface every generation backend implements
+    """
+
+    def generate(self, preferences: dict) -> dict:
+        """
+        Generate an itinerary payload for the given preferences
+
+        Args:
+            preferences: Travel preferences (days, destination, attractions, themes...)
+
+        Returns:
+            Nested itinerary payload for ItinerarySerializer
+        """
+        raise NotImplementedError
+
+
+class StubItineraryClient(BaseItineraryClient):
+    """
+    Offline backend that builds a deterministic itinerary from the preferences
+
+    Used for local development and load tests; ``latency`` (seconds) simulates
+    the response time of a real model.
+    """
+    CATEGORIES = ['Landmark', 'Museum', 'Nature', 'Dining', 'Shopping', 'Beach']
+
+    def __init__(self, latency: float = 0.0, pois_per_day: int = 4):
+        self.latency = latency
+        self.pois_per_day = pois_per_day
+
+    def generate(self, preferences: dict) -> dict:
+        if self.latency:
+            time.sleep(self.latency)
+
+        seed = hashlib.sha256(
+            json.dumps(preferences, sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        rng = random.Random(seed)
+
+        try:
+            days = int(preferences.get('days') or 3)
+        except (TypeError, ValueError):
+            days = 3
+        days = max(1, min(days, 30))
+
+        destination = preferences.get('destination') or ['Sydney']
+        if isinstance(destination, (list, tuple)):
+            destination = ', '.join(str(part) for part in destination) or 'Sydney'
+        attractions = [str(name) for name in preferences.get('attractions') or []]
+        themes = [str(theme) for theme in preferences.get('themes') or []] or ['Sightseeing']
+
+        schedules = []
+        for day in range(1, days + 1):
+            pois = []
+            for slot in range(self.pois_per_day):
+                if attractions:
+                    name = attractions.pop(0)
+                else:
+                    name = f"{destination} {rng.choice(themes)} Spot {day}-{slot + 1}"
+                pois.append({
+                    'name': name[:255],
+                    'category': rng.choice(self.CATEGORIES),
+                    'location': destination[:255],
+                    'avg_duration': rng.choice([45, 60, 90, 120]),
+                    'opening_hours': '09:00-17:00',
+                    'rating': f"{rng.uniform(3.5, 5.0):.1f}",
+                })
+            schedules.append({
+                'day_number': day,
+                'start_time': '09:00:00',
+                'end_time': '18:00:00',
+                'summary': f"Day {day} in {destination}"[:500],
+                'pois': pois,
+            })
+
+        return {
+            'title': f"{days}-day trip to {destination}"[:255],
+            'daily_schedules': schedules,
+        }
+
+
+class HTTPItineraryClient(BaseItineraryClient):
+    """
+    Backend that posts the preferences to a JSON HTTP endpoint
+
+    The endpoint must answer with the itinerary payload described above.
+    """
+
+    def __init__(self, endpoint: str, api_key: str = '', timeout: float = 60.0):
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def generate(self, preferences: dict) -> dict:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps({'preferences': preferences}).encode('utf-8'),
+            headers=headers,
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read().decode('utf-8'))
+
+
+def get_client() -> BaseItineraryClient:
+    """
+    Build the client configured in settings.ITINERARY_GENERATION
+    """
+    config = settings.ITINERARY_GENERATION
+    client_class = import_string(config['CLIENT'])
+    return client_class(**config.get('CLIENT_OPTIONS', {}))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-18 16:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('itinerary', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('preferences', models.JSONField(default=dict, help_text='Travel preferences submitted by the frontend', verbose_name='Preferences')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('create_time', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Create Time')),
+                ('update_time', models.DateTimeField(auto_now=True, db_index=True, verbose_name='Update Time')),
+                ('itinerary', models.ForeignKey(blank=True, help_text='Itinerary persisted from the generated result', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='generation_jobs', to='itinerary.itinerary', verbose_name='Itinerary')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='generation_jobs', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Generation Job',
+                'verbose_name_plural': 'Generation Jobs',
+                'db_table': 'generation_jobs',
+                'indexes': [models.Index(fields=['user'], name='generation__user_id_6a273b_idx'), models.Index(fields=['status'], name='generation__status_1f19bc_idx'), models.Index(fields=['create_time'], name='generation__create__720ced_idx')],
+            },
+        ),
+    ]
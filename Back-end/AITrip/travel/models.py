@@ -0,0 +1,78 @@
+import uuid
+
+from django.db import models
+from django.conf import settings
+from itinerary.models import Itinerary
+
+# Create your models here.
+class GenerationJob(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    job_id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='generation_jobs',
+        verbose_name='User',
+        db_index=True
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='Status'
+    )
+    preferences = models.JSONField(
+        default=dict,
+        verbose_name='Preferences',
+        help_text='Travel preferences submitted by the frontend'
+    )
+    itinerary = models.ForeignKey(
+        Itinerary,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='generation_jobs',
+        verbose_name='Itinerary',
+        help_text='Itinerary persisted from the generated result'
+    )
+    error = models.TextField(
+        blank=True,
+        verbose_name='Error'
+    )
+    create_time = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Create Time',
+        db_index=True
+    )
+    update_time = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Update Time',
+        db_index=True
+    )
+
+    class Meta:
+        db_table = 'generation_jobs'
+        verbose_name = 'Generation Job'
+        verbose_name_plural = 'Generation Jobs'
+        indexes = [
+            models.Index(fields=['user']),
+            models.Index(fields=['status']),
+            models.Index(fields=['create_time']),
+        ]
+
+    def __str__(self):
+        return f"{self.job_id} ({self.status})"
@@ -0,0 +1,48 @@
+from rest_framework import serializers
+from itinerary.models import Itinerary
+from itinerary.serializers import ItinerarySerializer
+from .models import GenerationJob
+
+
+class GenerationRequestSerializer(serializers.Serializer):
+    """
+    Payload of POST /api/travel/itinerary/generate
+    Matches the travel plan form: {"preferences": {"days": 3, "destination": [...], ...}}
+    """
+    preferences = serializers.DictField(required=True)
+
+    def validate_preferences(self, value):
+        days = value.get('days')
+        if days is not None:
+            try:
+                days = int(days)
+            except (TypeError, ValueError):
+                raise serializers.ValidationError('days must be an integer.')
+            if not 1 <= days <= 30:
+                raise serializers.ValidationError('days must be between 1 and 30.')
+        return value
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    """
+    Job status; the generated itinerary tree is embedded once the job succeeded
+    """
+    itinerary = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GenerationJob
+        fields = (
+            'job_id', 'status', 'preferences', 'itinerary', 'error',
+            'create_time', 'update_time'
+        )
+        read_only_fields = fields
+
+    def get_itinerary(self, obj):
+        if obj.itinerary_id is None:
+            return None
+        itinerary = ItinerarySerializer.setup_eager_loading(
+            Itinerary.objects.filter(pk=obj.itinerary_id)
+        ).first()
+        if itinerary is None:
+            return None
+        return ItinerarySerializer(itinerary).data
@@ -0,0 +1,153 @@
+"""
+Asynchronous itinerary generation service
+
+Requests only create a GenerationJob row and hand it to a bounded pool of
+worker threads, so a slow model call never holds a WSGI worker. Workers call
+the configured model client and persist the result through
+ItinerarySerializer; job state lives in the database, so any process can
+answer status requests.
+
+Queued and running jobs only live in the executor of the process that
+accepted them, so a restart or deploy drops them. fail_stale_jobs() marks
+jobs that haven't moved for STALE_AFTER seconds as failed: every process
+sweeps once when its service starts, and the status endpoint checks the job
+it returns.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from itinerary.serializers import ItinerarySerializer
+from .clients import get_client
+from .models import GenerationJob
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationQueueFull(Exception):
+    """Raised when the service already holds the maximum number of pending jobs"""
+
+
+class GenerationService:
+    """
+    Bounded worker pool for generation jobs
+
+    Args:
+        workers: Number of worker threads; 0 runs jobs inline (tests, debugging)
+        max_pending: Maximum number of queued plus running jobs in this process
+        client: Model client; defaults to the one configured in settings
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 32, client=None):
+        self.workers = workers
+        self.client = client or get_client()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        if workers > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix='itinerary-generation'
+            )
+
+    def submit(self, user, preferences: dict) -> GenerationJob:
+        """
+        Create a job and queue it for generation
+
+        Raises:
+            GenerationQueueFull: when no slot is free
+        """
+        if not self._slots.acquire(blocking=False):
+            raise GenerationQueueFull('Too many itineraries are being generated, please retry later')
+
+        try:
+            job = GenerationJob.objects.create(user=user, preferences=preferences)
+        except Exception:
+            self._slots.release()
+            raise
+
+        if self._executor is None:
+            self._run(job.pk)
+            job.refresh_from_db()
+        else:
+            self._executor.submit(self._run, job.pk)
+        return job
+
+    def _run(self, job_id):
+        """Generate and persist one job; always frees its slot"""
+        try:
+            GenerationJob.objects.filter(pk=job_id).update(
+                status=GenerationJob.STATUS_RUNNING,
+                update_time=timezone.now(),
+            )
+            job = GenerationJob.objects.select_related('user').get(pk=job_id)
+
+            payload = self.client.generate(job.preferences)
+            serializer = ItinerarySerializer(data=payload)
+            serializer.is_valid(raise_exception=True)
+            itinerary = serializer.save(user=job.user)
+
+            job.itinerary = itinerary
+            job.status = GenerationJob.STATUS_SUCCEEDED
+            job.save(update_fields=['itinerary', 'status', 'update_time'])
+            logger.info(f"Itinerary generated: job {job_id} -> itinerary {itinerary.pk}")
+        except Exception as e:
+            logger.exception(f"Itinerary generation failed: job {job_id}")
+            GenerationJob.objects.filter(pk=job_id).update(
+                status=GenerationJob.STATUS_FAILED,
+                error=str(e)[:2000],
+                update_time=timezone.now(),
+            )
+        finally:
+            self._slots.release()
+            if self._executor is not None:
+                # Worker threads own their connection; don't leave it open between jobs
+                connection.close()
+
+
+STALE_ERROR = 'Generation was interrupted (server restart), please retry'
+
+
+def fail_stale_jobs(queryset=None):
+    """
+    Fail pending and running jobs not updated for STALE_AFTER seconds
+
+    Returns:
+        Number of jobs failed
+    """
+    stale_after = settings.ITINERARY_GENERATION.get('STALE_AFTER', 900)
+    if queryset is None:
+        queryset = GenerationJob.objects.all()
+    now = timezone.now()
+    return queryset.filter(
+        status__in=[GenerationJob.STATUS_PENDING, GenerationJob.STATUS_RUNNING],
+        update_time__lt=now - timedelta(seconds=stale_after),
+    ).update(status=GenerationJob.STATUS_FAILED, error=STALE_ERROR, update_time=now)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> GenerationService:
+    """
+    Return the per-process generation service, creating it on first use
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                config = settings.ITINERARY_GENERATION
+                _service = GenerationService(
+                    workers=config.get('WORKERS', 4),
+                    max_pending=config.get('MAX_PENDING', 32),
+                )
+                failed = fail_stale_jobs()
+                if failed:
+                    logger.warning(f"Failed {failed} generation jobs interrupted by a restart")
+    return _service
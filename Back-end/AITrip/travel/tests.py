@@ -0,0 +1,123 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from acounts.models import User
+from itinerary.models import DailySchedule, POI
+from utils.testing import AuthenticatedAPITestCase
+from .clients import StubItineraryClient
+from .models import GenerationJob
+from .services import STALE_ERROR, GenerationService, GenerationQueueFull, fail_stale_jobs
+
+
+PREFERENCES = {
+    'peopleCount': 2,
+    'days': 3,
+    'destination': ['Sydney'],
+    'attractions': ['Sydney Opera House', 'Bondi Beach'],
+    'themes': ['Culture'],
+}
+
+
+class GenerationApiTestCase(AuthenticatedAPITestCase):
+    """
+    Jobs are accepted, generated with the stub client and persisted as itineraries
+    """
+
+    username = 'planner'
+
+    def setUp(self):
+        super().setUp()
+        self.service = GenerationService(workers=0, max_pending=2, client=StubItineraryClient())
+        patcher = mock.patch('travel.views.get_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_generate_and_fetch(self):
+        response = self.client.post(
+            '/api/travel/itinerary/generate', {'preferences': PREFERENCES}, format='json'
+        )
+        self.assertEqual(response.status_code, 202, response.data)
+        job_id = response.data['data']['job_id']
+
+        response = self.client.get(f'/api/travel/itinerary/jobs/{job_id}/')
+        data = response.data['data']
+        self.assertEqual(data['status'], GenerationJob.STATUS_SUCCEEDED)
+        self.assertEqual(len(data['itinerary']['daily_schedules']), 3)
+        self.assertEqual(data['itinerary']['daily_schedules'][0]['pois'][0]['name'], 'Sydney Opera House')
+        self.assertEqual(DailySchedule.objects.count(), 3)
+        self.assertEqual(POI.objects.count(), 12)
+
+    def test_invalid_preferences(self):
+        response = self.client.post(
+            '/api/travel/itinerary/generate', {'preferences': {'days': 99}}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_failed_client(self):
+        self.service.client = mock.Mock(generate=mock.Mock(side_effect=RuntimeError('model offline')))
+        response = self.client.post(
+            '/api/travel/itinerary/generate', {'preferences': PREFERENCES}, format='json'
+        )
+        job = GenerationJob.objects.get(pk=response.data['data']['job_id'])
+        self.assertEqual(job.status, GenerationJob.STATUS_FAILED)
+        self.assertIn('model offline', job.error)
+
+    def test_interrupted_job_is_failed(self):
+        job = GenerationJob.objects.create(user=self.user, preferences=PREFERENCES)
+        GenerationJob.objects.filter(pk=job.pk).update(update_time=timezone.now() - timedelta(hours=1))
+        fresh = GenerationJob.objects.create(user=self.user, preferences=PREFERENCES)
+
+        response = self.client.get(f'/api/travel/itinerary/jobs/{job.pk}/')
+        self.assertEqual(response.data['data']['status'], GenerationJob.STATUS_FAILED)
+        self.assertEqual(response.data['data']['error'], STALE_ERROR)
+        response = self.client.get(f'/api/travel/itinerary/jobs/{fresh.pk}/')
+        self.assertEqual(response.data['data']['status'], GenerationJob.STATUS_PENDING)
+        self.assertEqual(fail_stale_jobs(), 0)
+
+
+class GatedClient(StubItineraryClient):
+    """Stub client that blocks until the test opens the gate"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def generate(self, preferences):
+        self.started.set()
+        self.gate.wait(timeout=10)
+        return super().generate(preferences)
+
+
+class GenerationWorkerPoolTestCase(TransactionTestCase):
+    """
+    Worker threads run jobs in the background and the queue is bounded
+    """
+
+    def test_background_generation(self):
+        user = User.objects.create_user(
+            email='pool@aitrip.com', username='pool', password='pool-pass-123'
+        )
+        client = GatedClient()
+        service = GenerationService(workers=1, max_pending=2, client=client)
+
+        first = service.submit(user, PREFERENCES)
+        self.assertTrue(client.started.wait(timeout=10))
+        second = service.submit(user, {'days': 1})
+        with self.assertRaises(GenerationQueueFull):
+            service.submit(user, PREFERENCES)
+
+        client.gate.set()
+        service._executor.shutdown(wait=True)
+        statuses = set(
+            GenerationJob.objects.filter(pk__in=[first.pk, second.pk])
+            .values_list('status', flat=True)
+        )
+        self.assertEqual(statuses, {GenerationJob.STATUS_SUCCEEDED})
+        # Both slots were released once the jobs finished
+        self.assertTrue(service._slots.acquire(blocking=False))
+        self.assertTrue(service._slots.acquire(blocking=False))
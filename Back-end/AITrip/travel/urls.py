@@ -0,0 +1,7 @@
+from django.urls import path, re_path
+from .views import ItineraryGenerateView, GenerationJobView
+
+urlpatterns = [
+    re_path(r'^itinerary/generate/?$', ItineraryGenerateView.as_view(), name='itinerary-generate'),
+    path('itinerary/jobs/<uuid:job_id>/', GenerationJobView.as_view(), name='itinerary-generation-job'),
+]
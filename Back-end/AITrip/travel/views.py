@@ -0,0 +1,66 @@
+from rest_framework import status, permissions
+from rest_framework.views import APIView
+
+import logging
+
+from .models import GenerationJob
+from .serializers import GenerationRequestSerializer, GenerationJobSerializer
+from .services import fail_stale_jobs, get_service, GenerationQueueFull
+from utils.response import ResponseHandler
+
+logger = logging.getLogger(__name__)
+
+
+class ItineraryGenerateView(APIView):
+    """
+    Queue an AI itinerary generation job
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        """Create a generation job and return it immediately (202)"""
+        serializer = GenerationRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return ResponseHandler.error(
+                msg='Invalid travel preferences',
+                data=serializer.errors
+            )
+
+        try:
+            job = get_service().submit(request.user, serializer.validated_data['preferences'])
+        except GenerationQueueFull as e:
+            return ResponseHandler.error(
+                msg=str(e),
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        logger.info(f"Itinerary generation queued: {job.job_id} for {request.user.email}")
+        return ResponseHandler.success(
+            data=GenerationJobSerializer(job).data,
+            msg='Itinerary generation started',
+            status_code=status.HTTP_202_ACCEPTED
+        )
+
+
+class GenerationJobView(APIView):
+    """
+    Status and result of a generation job
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, job_id):
+        """Return the job; the itinerary tree is included once it succeeded"""
+        job = GenerationJob.objects.filter(job_id=job_id, user=request.user).first()
+        if job is None:
+            return ResponseHandler.error(
+                msg='Generation job not found',
+                status_code=status.HTTP_404_NOT_FOUND
+            )
+        if job.status in (GenerationJob.STATUS_PENDING, GenerationJob.STATUS_RUNNING):
+            if fail_stale_jobs(GenerationJob.objects.filter(pk=job.pk)):
+                job.refresh_from_db()
+
+        return ResponseHandler.success(
+            data=GenerationJobSerializer(job).data,
+            msg='Generation job retrieved successfully'
+        )
@@ -0,0 +1,227 @@
+"""
+Microbenchmark harness for AITrip
+
+A Benchmark times one callable over several rounds and counts the queries
+it issues. A run collects the results of many benchmarks together with the
+environment they ran in; runs are appended to a JSON history file and can
+be compared with a baseline run, so regressions in time or query count show
+up before they ship.
+
+Configure the default paths and tolerance with settings.BENCHMARKS (see
+get_config). The suite itself lives in the ``benchmark`` management command.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.db import connection
+
+from .config import load_config
+from .queryBudget import count_queries
+
+
+def get_config():
+    benchmarks_dir = os.path.join(settings.BASE_DIR, 'benchmarks')
+    return load_config('BENCHMARKS', {
+        'HISTORY': os.path.join(benchmarks_dir, 'history.json'),
+        'BASELINE': os.path.join(benchmarks_dir, 'baseline.json'),
+        # Allowed relative slowdown of the median before a result is a regression
+        'TOLERANCE': 0.25,
+    })
+
+
+class Benchmark:
+    """
+    One timed operation
+
+    Args:
+        name: Dotted name, e.g. 'pagination.keyset.depth_10'
+        func: Callable taking the value returned by setup
+        setup: Callable run once before timing; its result is passed to func
+        number: Calls of func per round; the round time is divided by it
+        rounds: Rounds to time, overriding the run's default
+        max_queries: Query budget of one call of func, or None
+    """
+
+    def __init__(self, name, func, setup=None, number=1, rounds=None, max_queries=None):
+        self.name = name
+        self.func = func
+        self.setup = setup
+        self.number = number
+        self.rounds = rounds
+        self.max_queries = max_queries
+
+    def measure(self, rounds=10, warmup=1):
+        """
+        Time the benchmark
+
+        Returns:
+            Dict of timings in milliseconds per call, throughput and queries per call
+        """
+        rounds = self.rounds or rounds
+        state = self.setup() if self.setup is not None else None
+        for _ in range(warmup):
+            self.func(state)
+
+        with count_queries() as counter:
+            self.func(state)
+        queries = counter.count
+
+        timings = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(self.number):
+                self.func(state)
+            timings.append((time.perf_counter() - started) * 1000 / self.number)
+
+        timings.sort()
+        median = statistics.median(timings)
+        return {
+            'rounds': rounds,
+            'number': self.number,
+            'min_ms': round(timings[0], 4),
+            'median_ms': round(median, 4),
+            'mean_ms': round(statistics.fmean(timings), 4),
+            'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+            'ops_per_s': round(1000 / median, 2) if median else None,
+            'queries': queries,
+            'max_queries': self.max_queries,
+        }
+
+
+def _git_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_benchmarks(benchmarks, rounds=10, label=None, only=None, report=None):
+    """
+    Measure benchmarks and describe the run
+
+    Args:
+        benchmarks: Iterable of Benchmark
+        rounds: Default rounds per benchmark
+        label: Free text stored with the run
+        only: Substring a benchmark name must contain to run
+        report: Callable(name, result) called after every benchmark
+
+    Returns:
+        Run dict {'label', 'timestamp', 'commit', 'environment', 'results'}
+    """
+    results = {}
+    for benchmark in benchmarks:
+        if only and only not in benchmark.name:
+            continue
+        results[benchmark.name] = benchmark.measure(rounds=rounds)
+        if report is not None:
+            report(benchmark.name, results[benchmark.name])
+    return {
+        'label': label,
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'machine': platform.machine(),
+        },
+        'results': results,
+    }
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as handle:
+        json.dump(data, handle, indent=2, sort_keys=True)
+    os.replace(temporary, path)
+
+
+def load_history(path):
+    """Runs stored in a history file, oldest first; empty when it does not exist"""
+    try:
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)['runs']
+    except FileNotFoundError:
+        return []
+
+
+def append_history(run, path):
+    """Add a run to the end of a history file"""
+    runs = load_history(path)
+    runs.append(run)
+    _write_json(path, {'runs': runs})
+
+
+def load_baseline(path):
+    """The baseline run, or None when there is none yet"""
+    try:
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(run, path):
+    _write_json(path, run)
+
+
+def compare(run, baseline, tolerance=0.25):
+    """
+    Compare a run with a baseline run
+
+    A benchmark regresses when its median grows by more than ``tolerance``
+    or it runs more queries than in the baseline, and improves when its
+    median shrinks by more than ``tolerance``.
+
+    Returns:
+        List of dicts {'name', 'status', 'baseline_ms', 'current_ms', 'change',
+        'baseline_queries', 'queries'}; status is one of 'regression',
+        'improvement', 'unchanged' or 'new'
+    """
+    previous = (baseline or {}).get('results', {})
+    rows = []
+    for name, result in run['results'].items():
+        row = {
+            'name': name,
+            'current_ms': result['median_ms'],
+            'queries': result['queries'],
+            'baseline_ms': None,
+            'baseline_queries': None,
+            'change': None,
+            'status': 'new',
+        }
+        before = previous.get(name)
+        if before is not None:
+            row.update(baseline_ms=before['median_ms'], baseline_queries=before['queries'])
+            if before['median_ms']:
+                row['change'] = round(result['median_ms'] / before['median_ms'] - 1, 4)
+            if result['queries'] > before['queries'] or (row['change'] or 0) > tolerance:
+                row['status'] = 'regression'
+            elif (row['change'] or 0) < -tolerance:
+                row['status'] = 'improvement'
+            else:
+                row['status'] = 'unchanged'
+        rows.append(row)
+    return rows
+
+
+def budget_violations(run):
+    """Names of the benchmarks that ran more queries than their max_queries"""
+    return [
+        name for name, result in run['results'].items()
+        if result['max_queries'] is not None and result['queries'] > result['max_queries']
+    ]
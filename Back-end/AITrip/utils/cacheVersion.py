@@ -0,0 +1,19 @@
+"""
+Version counters for cache entries that are invalidated by bumping a version
+instead of deleting every key written under the old one
+"""
+
+
+def bump_version(cache, key):
+    """
+    Increment the version stored under key, creating it if missing.
+    The version is stored without a timeout: it must outlive any entry
+    written under it, or an expired counter would restart at 1 and revive
+    entries cached under that version.
+    """
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, 1, None)
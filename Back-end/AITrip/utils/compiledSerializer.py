@@ -0,0 +1,447 @@
+"""
+Compiled read-only serialization for list and retrieve
+
+DRF's ModelSerializer resolves every field of every instance through
+get_attribute() and the per-field machinery, on top of the model instances
+(and prefetch caches) the queryset builds. CompiledSerializer inspects a
+serializer once, turns it into a flat plan of (name, column, converter)
+entries and renders ``.values()`` rows with it: no model instances are
+created and nested lists are assembled by grouping the child rows on their
+foreign key.
+
+The plan reuses the serializer's own field objects for every conversion
+that is not an identity (dates, decimals, choices, ...), and the querysets of
+the Prefetch objects its setup_eager_loading() returns, so ordering and
+output are identical to the serializer's. Supported fields:
+
+    model columns and forward foreign keys (PrimaryKeyRelatedField)
+    reverse foreign keys rendered by a nested ModelSerializer(many=True); a
+        ListSerializer with ``item_source`` renders that related object of
+        every row instead (e.g. the POI of every SchedulePOI link)
+    reverse foreign keys rendered as id lists: PrimaryKeyRelatedField(many=True),
+        or a read-only field with ``id_column`` naming the column to list
+
+Anything else (method fields, dotted sources, custom to_representation)
+raises NotCompilable, and CompiledReadMixin falls back to the serializer.
+"""
+
+import datetime
+import decimal
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Prefetch
+from django.http import Http404
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.permissions import BasePermission
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .customPagination import KeysetPagination
+from .instrumentation import phase
+
+# Fields whose to_representation() is an identity for the values the database returns
+PASSTHROUGH_FIELDS = (
+    serializers.IntegerField, serializers.CharField, serializers.FloatField, serializers.ReadOnlyField,
+)
+
+
+class NotCompilable(Exception):
+    """The serializer uses something CompiledSerializer can't reproduce"""
+
+
+def _prefetch_queryset(eager_queryset, name, related_model):
+    """Queryset of the Prefetch for ``name`` in eager_queryset, else the default manager's"""
+    for lookup in getattr(eager_queryset, '_prefetch_related_lookups', ()):
+        if isinstance(lookup, Prefetch) and lookup.prefetch_to == name and lookup.queryset is not None:
+            return lookup.queryset
+    return related_model._default_manager.all()
+
+
+def _is_passthrough(field):
+    return (
+        type(field) in PASSTHROUGH_FIELDS
+        or (isinstance(field, serializers.CharField)
+            and type(field).to_representation is serializers.CharField.to_representation)
+    )
+
+
+class DateTimeConverter:
+    """
+    DateTimeField.to_representation with the current timezone resolved once
+    per serialize() call instead of once per value
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def bind(self, zone):
+        def convert(value):
+            if isinstance(value, str):
+                return value
+            if zone is not None:
+                value = value.astimezone(zone) if timezone.is_aware(value) else timezone.make_aware(value, zone)
+            elif timezone.is_aware(value):
+                value = timezone.make_naive(value, datetime.timezone.utc)
+            value = value.isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+
+
+def _decimal_converter(field):
+    """DecimalField.to_representation with its quantum and context built once"""
+    quantum = decimal.Decimal('.1') ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(quantum, rounding=rounding, context=context))
+    return convert
+
+
+def _converter(field):
+    """
+    Converter of a field's non-null values; None for an identity, the field's
+    own to_representation() unless a faster equivalent is known
+    """
+    if _is_passthrough(field):
+        return None
+    field_type = type(field)
+    if field_type is serializers.DateTimeField:
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if (output_format is not None and output_format.lower() == ISO_8601
+                and not hasattr(field, 'timezone') and settings.USE_TZ):
+            return DateTimeConverter(field)
+    elif field_type is serializers.TimeField:
+        output_format = getattr(field, 'format', api_settings.TIME_FORMAT)
+        if output_format is not None and output_format.lower() == ISO_8601:
+            return lambda value: value if isinstance(value, str) else value.isoformat()
+    elif field_type is serializers.DecimalField:
+        if (getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+                and field.decimal_places is not None and not field.localize and not field.normalize_output):
+            return _decimal_converter(field)
+    return field.to_representation
+
+
+class Relation:
+    """
+    A reverse foreign key of a compiled serializer
+
+    Rows of the related model are fetched with one query for every parent of
+    the page and grouped on their foreign key, in the queryset's order.
+    """
+
+    def __init__(self, model, source, eager_queryset):
+        try:
+            rel = model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise NotCompilable(f"{model.__name__}.{source} is not a relation")
+        if not rel.one_to_many or rel.concrete:
+            raise NotCompilable(f"{model.__name__}.{source} is not a reverse foreign key")
+        self.related_model = rel.related_model
+        self.lookup = f'{rel.field.name}__in'
+        self.group_column = rel.field.attname
+        self.parent_column = rel.field.target_field.attname
+        # Keeps the prefetches of the levels below, which nested plans read
+        self.queryset = _prefetch_queryset(eager_queryset, source, rel.related_model)
+
+    def rows(self, keys, *columns):
+        queryset = self.queryset.prefetch_related(None).filter(**{self.lookup: keys})
+        return queryset.values(self.group_column, *columns)
+
+
+class NestedRelation(Relation):
+    """Relation rendered by a nested compiled serializer"""
+
+    def __init__(self, model, field, eager_queryset):
+        super().__init__(model, field.source, eager_queryset)
+        item_source = getattr(field, 'item_source', None)
+        if item_source is None and type(field).to_representation is not serializers.ListSerializer.to_representation:
+            raise NotCompilable(f"{type(field).__name__} overrides to_representation")
+        if item_source is None:
+            self.serializer = CompiledSerializer(field.child, self.queryset)
+        else:
+            self.serializer = CompiledSerializer(field.child, prefix=f'{item_source}__')
+            if self.serializer.relations:
+                raise NotCompilable(f"Relations below {item_source} are not supported")
+
+    def fetch(self, keys):
+        rows = list(self.rows(keys, *self.serializer.columns))
+        return rows, self.serializer.fetch(rows)
+
+    async def afetch(self, keys):
+        rows = [row async for row in self.rows(keys, *self.serializer.columns).aiterator()]
+        return rows, await self.serializer.afetch(rows)
+
+    def render(self, fetched, zone):
+        rows, related = fetched
+        groups = {}
+        group_column = self.group_column
+        for row, item in zip(rows, self.serializer.render(rows, related, zone)):
+            groups.setdefault(row[group_column], []).append(item)
+        return groups
+
+
+class IdsRelation(Relation):
+    """Relation rendered as the list of one column of its rows"""
+
+    def __init__(self, model, source, id_column, eager_queryset):
+        super().__init__(model, source, eager_queryset)
+        self.id_column = id_column or self.related_model._meta.pk.attname
+
+    def fetch(self, keys):
+        groups = {}
+        for key, value in self.rows(keys, self.id_column).values_list(self.group_column, self.id_column):
+            groups.setdefault(key, []).append(value)
+        return groups
+
+    async def afetch(self, keys):
+        groups = {}
+        rows = self.rows(keys, self.id_column).values_list(self.group_column, self.id_column)
+        async for key, value in rows.aiterator():
+            groups.setdefault(key, []).append(value)
+        return groups
+
+    def render(self, fetched, zone):
+        return fetched
+
+
+class CompiledSerializer:
+    """
+    Read-only rendering plan of a ModelSerializer over ``.values()`` rows
+
+    serialize() is fetch() (one query per relation and level) followed by
+    render() (no queries); aserialize() and afetch() are their async ORM
+    counterparts. Rows are rendered by a function generated from the
+    plan, building each dict with a single dict display.
+
+    Args:
+        serializer: ModelSerializer instance (its context and fieldset apply)
+        eager_queryset: Queryset returned by the serializer's setup_eager_loading,
+            whose Prefetch querysets are used for the relations
+        prefix: Prefix of the columns in the rows, e.g. 'poi__'
+    """
+
+    def __init__(self, serializer, eager_queryset=None, prefix=''):
+        if type(serializer).to_representation is not serializers.Serializer.to_representation:
+            raise NotCompilable(f"{type(serializer).__name__} overrides to_representation")
+        model = serializer.Meta.model
+        self.model = model
+        self.prefix = prefix
+        self.entries = []
+        self.relations = []
+        self.converters = []
+        columns = {prefix + model._meta.pk.attname: None}
+
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source:
+                raise NotCompilable(f"Field '{field.field_name}' has source '{field.source}'")
+
+            relation = None
+            if isinstance(field, serializers.ListSerializer):
+                relation = NestedRelation(model, field, eager_queryset)
+            elif isinstance(field, serializers.ManyRelatedField):
+                child = field.child_relation
+                if type(child) is not serializers.PrimaryKeyRelatedField or child.pk_field is not None:
+                    raise NotCompilable(f"Field '{field.field_name}' is not a primary key list")
+                relation = IdsRelation(model, field.source, None, eager_queryset)
+            elif getattr(field, 'id_column', None):
+                relation = IdsRelation(model, field.source, field.id_column, eager_queryset)
+
+            if relation is not None:
+                column = prefix + relation.parent_column
+                self.entries.append((field.field_name, column, None, len(self.relations)))
+                self.relations.append(relation)
+            else:
+                column, convert = self.compile_field(field)
+                converter = None
+                if convert is not None:
+                    converter = len(self.converters)
+                    self.converters.append(convert)
+                self.entries.append((field.field_name, column, converter, None))
+            columns[column] = None
+        self.columns = list(columns)
+        self.render_row = self.generate_render_row()
+
+    def compile_field(self, field):
+        """Column and converter (None for an identity) of a field rendering a model column"""
+        if isinstance(field, serializers.BaseSerializer):
+            raise NotCompilable(f"Field '{field.field_name}' is a nested object")
+        try:
+            model_field = self.model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise NotCompilable(f"Field '{field.field_name}' is not a model column")
+        if not model_field.concrete or model_field.many_to_many:
+            raise NotCompilable(f"Field '{field.field_name}' is not a model column")
+        column = self.prefix + model_field.attname
+        if isinstance(field, serializers.RelatedField):
+            if type(field) is not serializers.PrimaryKeyRelatedField or field.pk_field is not None:
+                raise NotCompilable(f"Field '{field.field_name}' is not a primary key")
+            return column, None
+        return column, _converter(field)
+
+    def generate_render_row(self):
+        """
+        Build ``render_row(row, groups, converters)`` returning the dict of one row
+
+        Field names and columns are embedded as literals, so rendering a row
+        is one dict display instead of a loop over the fields.
+        """
+        items = []
+        for name, column, converter, relation in self.entries:
+            value = f'row[{column!r}]'
+            if relation is not None:
+                value = f'groups[{relation}].get({value}, [])'
+            elif converter is not None:
+                value = f'(None if (value := {value}) is None else converters[{converter}](value))'
+            items.append(f'{name!r}: {value}')
+        source = f"def render_row(row, groups, converters):\n    return {{{', '.join(items)}}}\n"
+        namespace = {}
+        exec(compile(source, f'<compiled {self.model.__name__} serializer>', 'exec'), namespace)
+        return namespace['render_row']
+
+    def values(self, queryset, *extra):
+        """The queryset as the ``.values()`` rows this plan renders"""
+        return queryset.prefetch_related(None).values(*dict.fromkeys([*self.columns, *extra]))
+
+    def fetch(self, rows):
+        """Rows of every relation of rows, one query per relation and level"""
+        related = []
+        for relation in self.relations:
+            keys = list({row[self.prefix + relation.parent_column] for row in rows})
+            related.append(relation.fetch(keys) if keys else None)
+        return related
+
+    async def afetch(self, rows):
+        """fetch() with the async ORM"""
+        related = []
+        for relation in self.relations:
+            keys = list({row[self.prefix + relation.parent_column] for row in rows})
+            related.append(await relation.afetch(keys) if keys else None)
+        return related
+
+    def render(self, rows, related, zone=None):
+        """Render rows and their fetched relations as the serializer would; runs no queries"""
+        if zone is None:
+            zone = timezone.get_current_timezone()
+        groups = [
+            relation.render(fetched, zone) if fetched is not None else {}
+            for relation, fetched in zip(self.relations, related)
+        ]
+        converters = [
+            convert.bind(zone) if isinstance(convert, DateTimeConverter) else convert
+            for convert in self.converters
+        ]
+        render_row = self.render_row
+        return [render_row(row, groups, converters) for row in rows]
+
+    def serialize(self, rows):
+        """
+        Render rows (from values()) as the serializer would render their instances
+
+        Runs one query per relation level for the whole list.
+        """
+        rows = rows if isinstance(rows, list) else list(rows)
+        return self.render(rows, self.fetch(rows))
+
+    async def aserialize(self, rows):
+        """serialize() of a list of rows with the async ORM"""
+        return self.render(rows, await self.afetch(rows))
+
+
+_plans = {}
+
+
+def compile_serializer(serializer_class, context=None):
+    """
+    CompiledSerializer of a serializer class, or None when it can't be compiled
+
+    Plans of requests without a sparse fieldset are built once per class.
+    """
+    fieldset = (context or {}).get('fieldset')
+    if fieldset is None and serializer_class in _plans:
+        return _plans[serializer_class]
+    model = serializer_class.Meta.model
+    setup_eager_loading = getattr(serializer_class, 'setup_eager_loading', None)
+    eager_queryset = None
+    if setup_eager_loading is not None:
+        queryset = model._default_manager.all()
+        eager_queryset = setup_eager_loading(queryset) if fieldset is None else setup_eager_loading(queryset, fieldset)
+    try:
+        plan = CompiledSerializer(serializer_class(context=context or {}), eager_queryset)
+    except NotCompilable:
+        plan = None
+    if fieldset is None:
+        _plans[serializer_class] = plan
+    return plan
+
+
+class CompiledReadMixin:
+    """
+    Serve list and retrieve through CompiledSerializer when the serializer allows it
+
+    Set ``compiled_reads = False`` on a viewset to always use its serializer.
+    Retrieve only takes the compiled path when no permission class checks
+    objects, since it never builds the instance.
+    """
+    compiled_reads = True
+
+    def get_compiled_serializer(self):
+        if not self.compiled_reads:
+            return None
+        return compile_serializer(self.get_serializer_class(), self.get_serializer_context())
+
+    def checks_object_permissions(self):
+        return any(
+            type(permission).has_object_permission is not BasePermission.has_object_permission
+            for permission in self.get_permissions()
+        )
+
+    def serialize_rows(self, compiled, rows):
+        rows = list(rows)
+        related = compiled.fetch(rows)
+        with phase('serialize'):
+            return compiled.render(rows, related)
+
+    def list(self, request, *args, **kwargs):
+        compiled = self.get_compiled_serializer()
+        if compiled is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        extra = ()
+        if isinstance(self.paginator, KeysetPagination):
+            ordering_field = self.paginator.get_ordering_field(queryset, self)
+            extra = (ordering_field,) if ordering_field else ()
+        queryset = compiled.values(queryset, *extra)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.serialize_rows(compiled, page))
+        return Response(self.serialize_rows(compiled, queryset))
+
+    def get_object_data(self):
+        """Serialized object of a detail route"""
+        compiled = self.get_compiled_serializer()
+        if compiled is None or self.checks_object_permissions():
+            return self.get_serializer(self.get_object()).data
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            # A malformed value such as 'abc' for an integer pk, as in DRF's get_object_or_404()
+            raise Http404
+        rows = list(compiled.values(queryset)[:1])
+        if not rows:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        return self.serialize_rows(compiled, rows)[0]
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_object_data())
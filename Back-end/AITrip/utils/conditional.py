@@ -0,0 +1,186 @@
+"""
+Conditional requests (ETag / Last-Modified) for AITrip viewsets
+The validator of a resource is the newest update_time and the row count of
+every table in its tree, read with a single aggregate query, so a matching
+If-None-Match / If-Modified-Since is answered with 304 before any
+serialization happens
+
+Details are validated before the object is loaded. Lists are validated once
+the page is known, over the rows of the page only (plus the query string and
+the pagination state), so the cost doesn't grow with the filtered table and
+keyset pagination keeps its bounded page cost.
+
+If-Match on PUT/PATCH is checked inside the update's transaction with the
+row locked (select_for_update), so two conditional writers can't both pass
+the check.
+"""
+
+import hashlib
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The resource was modified by another request.'
+    default_code = 'precondition_failed'
+
+
+class NotModified(Exception):
+    """Raised from initial() when the client's copy is still current"""
+
+
+class ConditionalRequestMixin:
+    """
+    ViewSet mixin adding validators to list/retrieve and If-Match to updates
+
+    Attributes:
+        validator_relations: Related paths whose rows are part of the resource,
+            e.g. ('daily_schedules', 'daily_schedules__pois')
+        validator_timestamp: Timestamp field present on every model of the tree
+    """
+    validator_relations = ()
+    validator_timestamp = 'update_time'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.validator = None
+        self.validate_page = False
+        if not self.supports_validators() or request.method not in ('GET', 'HEAD'):
+            return
+
+        if self.action == 'retrieve':
+            self.validator = self.get_validator()
+            if self.validator is not None and self.is_not_modified(request, *self.validator):
+                raise NotModified()
+        elif self.action == 'list':
+            # Checked by paginate_queryset() once the page is known
+            self.validate_page = True
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None and getattr(self, 'validate_page', False):
+            self.validator = self.get_page_validator(page)
+            if self.is_not_modified(self.request, *self.validator):
+                raise NotModified()
+        return page
+
+    def update(self, request, *args, **kwargs):
+        if 'HTTP_IF_MATCH' not in request.META or not self.supports_validators():
+            return super().update(request, *args, **kwargs)
+        with transaction.atomic():
+            # Held until the write commits, so the checked version is the one overwritten
+            lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+            locked = self.get_queryset().model._default_manager.select_for_update().filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+            list(locked.values_list('pk', flat=True))
+            validator = self.get_validator()
+            if validator is None or not self.etag_matches(request.META['HTTP_IF_MATCH'], validator[0]):
+                raise PreconditionFailed()
+            return super().update(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=self.get_validator_headers())
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, 'validator', None) is not None and response.status_code == status.HTTP_200_OK:
+            for header, value in self.get_validator_headers().items():
+                response[header] = value
+        return super().finalize_response(request, response, *args, **kwargs)
+
+    def supports_validators(self):
+        try:
+            self.get_queryset().model._meta.get_field(self.validator_timestamp)
+        except FieldDoesNotExist:
+            return False
+        return True
+
+    def get_validator_queryset(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        return queryset.order_by()
+
+    def aggregate_validator(self, queryset):
+        """Newest timestamp and row count of every table of the tree, in one query"""
+        aggregates = {
+            'count_0': Count('pk', distinct=True),
+            'max_0': Max(self.validator_timestamp),
+        }
+        for index, relation in enumerate(self.validator_relations, start=1):
+            aggregates[f'count_{index}'] = Count(f'{relation}__pk', distinct=True)
+            aggregates[f'max_{index}'] = Max(f'{relation}__{self.validator_timestamp}')
+        return queryset.aggregate(**aggregates)
+
+    def make_validator(self, values, *extra):
+        """(quoted ETag, newest timestamp) of aggregated values and extra ETag parts"""
+        timestamps = [value for key, value in values.items() if key.startswith('max_') and value]
+        last_modified = max(timestamps) if timestamps else None
+        parts = [f"{key}={value.isoformat() if hasattr(value, 'isoformat') else value}"
+                 for key, value in sorted(values.items())]
+        # Sparse fieldsets, filters and cursors change the body
+        parts.append(self.request.META.get('QUERY_STRING', ''))
+        parts.extend(str(part) for part in extra)
+        digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+        return quote_etag(digest), last_modified
+
+    def get_validator(self):
+        """
+        Compute (etag, last_modified) of the requested object with one aggregate query
+
+        Returns:
+            None for a missing object, otherwise the quoted ETag and the newest timestamp
+        """
+        try:
+            values = self.aggregate_validator(self.get_validator_queryset())
+        except (TypeError, ValueError):
+            return None
+        if not values['count_0']:
+            return None
+        return self.make_validator(values)
+
+    def get_page_validator(self, page):
+        """
+        (etag, last_modified) of a list page, aggregated over its rows only
+        """
+        model = self.get_queryset().model
+        pk_name = model._meta.pk.attname
+        pks = [row[pk_name] if isinstance(row, dict) else row.pk for row in page]
+        values = self.aggregate_validator(model._default_manager.filter(pk__in=pks).order_by())
+        paginator = self.paginator
+        return self.make_validator(
+            values, ','.join(map(str, pks)),
+            getattr(paginator, 'count', None),
+            getattr(paginator, 'has_next', None),
+            getattr(paginator, 'has_previous', None),
+        )
+
+    def get_validator_headers(self):
+        etag, last_modified = self.validator
+        headers = {'ETag': etag}
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified.timestamp())
+        return headers
+
+    @staticmethod
+    def etag_matches(header, etag):
+        etags = parse_etags(header)
+        return '*' in etags or etag in etags
+
+    def is_not_modified(self, request, etag, last_modified):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            return self.etag_matches(if_none_match, etag)
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        if if_modified_since is not None and last_modified is not None:
+            return int(last_modified.timestamp()) <= if_modified_since
+        return False
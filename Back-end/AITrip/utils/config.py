@@ -0,0 +1,19 @@
+"""
+Feature settings for AITrip
+
+Each feature keeps the defaults of its settings dict next to the code that
+reads it; settings.py only lists the keys a deployment changes.
+"""
+
+from django.conf import settings
+
+
+def load_config(name, defaults):
+    """
+    Return settings.<name> merged over defaults
+
+    Args:
+        name: Name of the settings dict, e.g. 'ITINERARY_CACHE'
+        defaults: Values of the keys the settings dict leaves out
+    """
+    return {**defaults, **getattr(settings, name, {})}
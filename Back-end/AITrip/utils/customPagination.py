@@ -1,11 +1,195 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class CustomPagination(PageNumberPagination):
-    page_size = 5 
+    page_size = 5
     page_size_query_param = 'page_size'
     max_page_size = 100
 
     def paginate_queryset(self, queryset, request, view=None):
         if not request.query_params.get(self.page_query_param) and not request.query_params.get(self.page_size_query_param):
             return None
-        return super().paginate_queryset(queryset, request, view)
\ No newline at end of file
+        return super().paginate_queryset(queryset, request, view)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks on an indexed (ordering_field, pk) pair
+
+    Pages are always bounded: without any query params the first
+    ``page_size`` rows are returned, newest first. Each page is a single
+    ``WHERE (field, pk) < (value, pk) ORDER BY field DESC, pk DESC LIMIT n``
+    query, so cost does not grow with page depth. ``COUNT(*)`` only runs
+    when the client sends ``?count=true``.
+
+    The ordering field comes from ``view.keyset_ordering_field``; when the
+    view does not set it, ``update_time`` is used if the model has one,
+    otherwise the primary key alone.
+
+    Response data:
+    {
+        "count": int,      // only when ?count=true
+        "next": str,       // link to the next (older) page or null
+        "previous": str,   // link to the previous (newer) page or null
+        "results": [...]
+    }
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    default_ordering_field = 'update_time'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_queryset, page_queryset = self.prepare(queryset, request, view)
+        self.count = count_queryset.count() if count_queryset is not None else None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() with the async ORM"""
+        count_queryset, page_queryset = self.prepare(queryset, request, view)
+        self.count = await count_queryset.acount() if count_queryset is not None else None
+        return self.set_page([row async for row in page_queryset.aiterator()])
+
+    def prepare(self, queryset, request, view):
+        """
+        Read the page parameters; returns the queryset to count (None unless
+        ?count=true) and the page query, one row longer than the page
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field = self.get_ordering_field(queryset, view)
+        self.pk_name = queryset.model._meta.pk.attname
+
+        count_queryset = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            count_queryset = queryset
+
+        self.cursor = self.decode_cursor(request)
+        self.reverse = bool(self.cursor and self.cursor.get('r'))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.seek_filter(self.cursor, self.reverse))
+
+        ordering = self.get_ordering(self.reverse)
+        return count_queryset, queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def set_page(self, rows):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+
+        if self.reverse:
+            self.has_next = self.cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        response_data = {}
+        if self.count is not None:
+            response_data['count'] = self.count
+        response_data['next'] = self.get_next_link()
+        response_data['previous'] = self.get_previous_link()
+        response_data['results'] = data
+        return response_data
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering_field(self, queryset, view):
+        field = getattr(view, 'keyset_ordering_field', None)
+        if field is not None:
+            return field or None
+        try:
+            queryset.model._meta.get_field(self.default_ordering_field)
+        except FieldDoesNotExist:
+            return None
+        return self.default_ordering_field
+
+    def get_ordering(self, reverse):
+        prefix = '' if reverse else '-'
+        if self.field is None:
+            return (f'{prefix}pk',)
+        return (f'{prefix}{self.field}', f'{prefix}pk')
+
+    def seek_filter(self, cursor, reverse):
+        op = 'gt' if reverse else 'lt'
+        if self.field is None:
+            return Q(**{f'pk__{op}': cursor['pk']})
+        return (
+            Q(**{f'{self.field}__{op}': cursor['v']})
+            | Q(**{self.field: cursor['v'], f'pk__{op}': cursor['pk']})
+        )
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    @staticmethod
+    def get_value(item, name):
+        """Read a value from a model instance or a ``.values()`` row"""
+        if isinstance(item, dict):
+            return item[name]
+        return getattr(item, name)
+
+    def encode_cursor(self, item, reverse):
+        if isinstance(item, dict):
+            position = {'pk': item['pk'] if 'pk' in item else item[self.pk_name]}
+        else:
+            position = {'pk': item.pk}
+        if self.field is not None:
+            value = self.get_value(item, self.field)
+            position['v'] = value.isoformat() if isinstance(value, datetime) else value
+        if reverse:
+            position['r'] = 1
+        token = base64.urlsafe_b64encode(
+            json.dumps(position, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii').rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            if 'pk' not in position:
+                raise KeyError('pk')
+            if self.field is not None:
+                value = position['v']
+                if isinstance(value, str):
+                    position['v'] = parse_datetime(value) or value
+        except (TypeError, ValueError, KeyError):
+            raise NotFound('Invalid cursor')
+        return position
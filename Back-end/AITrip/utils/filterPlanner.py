@@ -0,0 +1,195 @@
+"""
+Index-backed filtering for AITrip viewsets
+
+Every filterable viewset declares an IndexedFilterSet listing the fields and
+lookups it accepts. A field may only be listed when an index starts with its
+column (primary key, unique or db_index fields, foreign keys, Meta.indexes
+and unique constraints) and the lookup can use that index; a system check
+reports any other combination. A field may be a path through relations
+(``schedule_links__schedule``); the joins follow foreign keys, which are
+indexed, and the last field must be indexed in its own model.
+StrictFilterBackend answers requests using anything else (unknown fields,
+other lookups) with 400 instead of silently ignoring them or scanning the
+table.
+
+Foreign keys are filtered by id with IdFilter. django-filter's default,
+ModelChoiceFilter, validates the value with a query against the related
+table; an unknown id here simply matches nothing.
+"""
+
+import datetime
+
+from django import forms
+from django.core import checks
+from django.db import models
+from django.db.models.constants import LOOKUP_SEP
+from django.utils import timezone
+from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
+
+# Lookups a B-tree index on the column can answer
+INDEXABLE_LOOKUPS = frozenset({'exact', 'in', 'gt', 'gte', 'lt', 'lte', 'range', 'isnull'})
+
+# Query parameters understood by every list endpoint besides filters
+COMMON_QUERY_PARAMS = frozenset({'format'})
+
+
+class IdFilter(filters.NumberFilter):
+    """Filter on the integer id of a related row without loading it"""
+    field_class = forms.IntegerField
+
+
+def resolve_path(model, path):
+    """
+    Return (model, field) of the last field of a lookup path, e.g.
+    (SchedulePOI, SchedulePOI.schedule) for POI and 'schedule_links__schedule'
+    """
+    *relations, name = path.split(LOOKUP_SEP)
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model, model._meta.get_field(name)
+
+
+def indexed_columns(model):
+    """
+    Return the names of the fields that are the leading column of an index
+    """
+    opts = model._meta
+    columns = {opts.pk.name}
+    for field in opts.concrete_fields:
+        if field.db_index or field.unique or isinstance(field, models.ForeignKey):
+            columns.add(field.name)
+    for index in opts.indexes:
+        if index.fields:
+            columns.add(index.fields[0].lstrip('-'))
+    for constraint in opts.constraints:
+        if isinstance(constraint, models.UniqueConstraint) and constraint.fields:
+            columns.add(constraint.fields[0])
+    for fields in opts.unique_together:
+        columns.add(fields[0])
+    return columns
+
+
+class IndexedFilterSet(filters.FilterSet):
+    """
+    FilterSet whose Meta.fields is a dict {field: [lookups]} restricted to
+    index-backed combinations; declared filters are held to the same rule
+    """
+    FILTER_DEFAULTS = {
+        **filters.FilterSet.FILTER_DEFAULTS,
+        models.ForeignKey: {'filter_class': IdFilter},
+        models.OneToOneField: {'filter_class': IdFilter},
+    }
+
+    @classmethod
+    def filter_matrix(cls):
+        """Return {field path: [lookups]} of every filter"""
+        matrix = {}
+        for filter_ in cls.base_filters.values():
+            matrix.setdefault(filter_.field_name, []).append(filter_.lookup_expr)
+        return matrix
+
+    @classmethod
+    def unindexed_filters(cls):
+        """
+        Return the (field, lookup) pairs of this FilterSet no index supports
+        """
+        problems = []
+        for path, lookups in cls.filter_matrix().items():
+            model, field = resolve_path(cls._meta.model, path)
+            for lookup in lookups:
+                if field.name not in indexed_columns(model) or lookup not in INDEXABLE_LOOKUPS:
+                    problems.append((path, lookup))
+        return problems
+
+
+def _sample_value(field, lookup):
+    if isinstance(field, models.ForeignKey):
+        field = field.target_field
+    if isinstance(field, models.DateTimeField):
+        value = timezone.now()
+    elif isinstance(field, models.DateField):
+        value = datetime.date.today()
+    elif isinstance(field, (models.IntegerField, models.AutoField, models.FloatField, models.DecimalField)):
+        value = 1
+    else:
+        value = 'probe'
+    if lookup == 'in':
+        return [value, value]
+    if lookup == 'range':
+        return (value, value)
+    if lookup == 'isnull':
+        return False
+    return value
+
+
+def probe_querysets(filterset_class):
+    """
+    Yield (field, lookup, queryset) for every allowed filter, the queryset
+    filtered with a sample value so its plan can be checked with explain()
+    """
+    model = filterset_class._meta.model
+    for path, lookups in filterset_class.filter_matrix().items():
+        field = resolve_path(model, path)[1]
+        for lookup in lookups:
+            queryset = model._default_manager.filter(
+                **{f'{path}__{lookup}': _sample_value(field, lookup)}
+            ).order_by()
+            yield path, lookup, queryset
+
+
+def _all_subclasses(cls):
+    for subclass in cls.__subclasses__():
+        yield subclass
+        yield from _all_subclasses(subclass)
+
+
+@checks.register()
+def check_filter_indexes(app_configs=None, **kwargs):
+    """System check: every declared filter must be backed by an index"""
+    errors = []
+    for filterset in _all_subclasses(IndexedFilterSet):
+        if filterset._meta.model is None:
+            continue
+        for field, lookup in filterset.unindexed_filters():
+            errors.append(checks.Error(
+                f"{filterset.__name__} allows '{field}__{lookup}', which no index of "
+                f"{filterset._meta.model.__name__} supports",
+                hint='Add an index on the field or remove the filter',
+                obj=filterset,
+                id='utils.E001',
+            ))
+    return errors
+
+
+class StrictFilterBackend(filters.DjangoFilterBackend):
+    """
+    DjangoFilterBackend that rejects query parameters it does not know
+
+    Parameters that are not filters are allowed when the paginator uses them,
+    or when the view lists them in ``extra_query_params`` (all actions) or
+    ``action_query_params`` (a dict keyed by action name).
+    """
+
+    def allowed_params(self, request, view):
+        allowed = set(COMMON_QUERY_PARAMS)
+        allowed.update(getattr(view, 'extra_query_params', ()))
+        allowed.update(getattr(view, 'action_query_params', {}).get(getattr(view, 'action', None), ()))
+        paginator = getattr(view, 'paginator', None)
+        for attr in ('cursor_query_param', 'page_size_query_param', 'page_query_param', 'count_query_param'):
+            name = getattr(paginator, attr, None)
+            if name:
+                allowed.add(name)
+        return allowed
+
+    def filter_queryset(self, request, queryset, view):
+        filterset_class = self.get_filterset_class(view, queryset)
+        filter_names = set(filterset_class.base_filters) if filterset_class else set()
+        unknown = sorted(set(request.query_params) - filter_names - self.allowed_params(request, view))
+        if unknown:
+            raise ValidationError({
+                'detail': f"Unsupported query parameters: {', '.join(unknown)}",
+                'unsupported_filters': unknown,
+                'allowed_filters': sorted(filter_names),
+            })
+        return super().filter_queryset(request, queryset, view)
@@ -0,0 +1,276 @@
+"""
+Per-request timing instrumentation for AITrip
+
+For a sampled request InstrumentationMiddleware records
+    db         number of queries and total SQL time (execute wrapper)
+    serialize  time spent in serializer.to_representation (CustomModelViewSet)
+    envelope   time spent wrapping the response in {success, msg, data}
+    render     time spent rendering the response body
+    total      time spent inside the middleware
+and reports them as one JSON log line and, for clients listed in
+settings.INTERNAL_IPS, in a Server-Timing header.
+Queries slower than SLOW_QUERY_MS are logged with a normalized fingerprint,
+so the same statement with different parameters groups together.
+
+Unsampled requests only pay for one random() call. Configure it with
+settings.INSTRUMENTATION (see DEFAULTS); it is off unless ENABLED is set, and
+the header additionally needs SERVER_TIMING, as it reveals query counts and
+timings.
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .config import load_config
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(f"{__name__}.slow_queries")
+
+DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.1,
+    'SLOW_QUERY_MS': 100,
+    'SERVER_TIMING': False,
+    'LOG_REQUESTS': True,
+}
+
+PHASES = ('serialize', 'envelope', 'render')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def get_config():
+    return load_config('INSTRUMENTATION', DEFAULTS)
+
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_ROWS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """
+    Normalize a statement so executions that differ only in their values match
+
+    Returns:
+        Tuple (normalized_sql, short_hash)
+    """
+    normalized = _STRING.sub('?', sql)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _IN_LIST.sub('IN (...)', normalized)
+    normalized = _VALUES_ROWS.sub('(...)', normalized)
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    return normalized, hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+class RequestMetrics:
+    """
+    Timings collected for one request; times are in milliseconds
+    """
+
+    def __init__(self, request, slow_query_ms):
+        self.request = request
+        self.slow_query_ms = slow_query_ms
+        self.queries = 0
+        self.db_ms = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.slow_queries = 0
+        self._depth = dict.fromkeys(PHASES, 0)
+        self._render_started = None
+
+    def __call__(self, execute, sql, params, many, context):
+        """Database execute wrapper"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.db_ms += elapsed
+            if elapsed >= self.slow_query_ms:
+                self.log_slow_query(sql, elapsed, context)
+
+    def log_slow_query(self, sql, elapsed, context):
+        self.slow_queries += 1
+        normalized, digest = fingerprint(sql)
+        slow_query_logger.warning(json.dumps({
+            'event': 'slow_query',
+            'fingerprint': digest,
+            'sql': normalized,
+            'duration_ms': round(elapsed, 2),
+            'database': context['connection'].alias,
+            'method': self.request.method,
+            'path': self.request.path,
+        }))
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in the block to a phase; nested blocks count once"""
+        self._depth[name] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[name] -= 1
+            if self._depth[name] == 0:
+                self.phases[name] += (time.perf_counter() - started) * 1000
+
+    def render_started(self):
+        self._render_started = time.perf_counter()
+
+    def render_finished(self):
+        if self._render_started is not None:
+            self.phases['render'] += (time.perf_counter() - self._render_started) * 1000
+            self._render_started = None
+
+    def server_timing(self, total_ms):
+        parts = [f'db;dur={self.db_ms:.1f};desc="{self.queries} queries"']
+        parts.extend(f'{name};dur={value:.1f}' for name, value in self.phases.items())
+        parts.append(f'total;dur={total_ms:.1f}')
+        return ', '.join(parts)
+
+    def as_dict(self, response, total_ms):
+        match = getattr(self.request, 'resolver_match', None)
+        return {
+            'event': 'request',
+            'method': self.request.method,
+            'path': self.request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': self.queries,
+            'db_ms': round(self.db_ms, 2),
+            **{f'{name}_ms': round(value, 2) for name, value in self.phases.items()},
+            'total_ms': round(total_ms, 2),
+            'slow_queries': self.slow_queries,
+        }
+
+
+def current_metrics():
+    """Metrics of the request being handled, or None when it isn't sampled"""
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """
+    Time a block as one of PHASES for the current request; free when unsampled
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.phase(name):
+        yield
+
+
+def time_serializer(serializer):
+    """
+    Count the serializer's to_representation() as serialize time
+
+    Only the given (top level) serializer is wrapped, so nested serializers are
+    not counted twice.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return serializer
+    to_representation = serializer.to_representation
+
+    def timed_to_representation(*args, **kwargs):
+        with metrics.phase('serialize'):
+            return to_representation(*args, **kwargs)
+
+    serializer.to_representation = timed_to_representation
+    return serializer
+
+
+class InstrumentationMiddleware:
+    """
+    Sample requests and report their SQL, serialization and render timings
+
+    Add it at the top of MIDDLEWARE so ``total`` covers the whole stack.
+    Works in sync and async stacks, so it never forces async views onto a
+    thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = get_config()
+        if not config['ENABLED'] or random.random() >= config['SAMPLE_RATE']:
+            return self.get_response(request)
+
+        metrics = RequestMetrics(request, config['SLOW_QUERY_MS'])
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        try:
+            with self.wrap_connections(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(config, metrics, response, started)
+
+    async def __acall__(self, request):
+        config = get_config()
+        if not config['ENABLED'] or random.random() >= config['SAMPLE_RATE']:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics(request, config['SLOW_QUERY_MS'])
+        token = _current.set(metrics)
+        started = time.perf_counter()
+        # Connections belong to threads: install the wrappers in the thread
+        # that runs this request's async ORM queries
+        stack = await sync_to_async(self.wrap_connections)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        return self.report(config, metrics, response, started)
+
+    @staticmethod
+    def wrap_connections(metrics):
+        """Entered ExitStack adding metrics to every connection of this thread"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        return stack
+
+    @staticmethod
+    def report(config, metrics, response, started):
+        total_ms = (time.perf_counter() - started) * 1000
+        # REMOTE_ADDR rather than X-Forwarded-For, which any client can set
+        if config['SERVER_TIMING'] and metrics.request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS:
+            response['Server-Timing'] = metrics.server_timing(total_ms)
+        if config['LOG_REQUESTS']:
+            logger.info(json.dumps(metrics.as_dict(response, total_ms)))
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before the response is rendered; the callback runs right after
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.render_started()
+            response.add_post_render_callback(lambda rendered: metrics.render_finished())
+        return response
@@ -0,0 +1,93 @@
+"""
+Per-action SQL query budgets for AITrip viewsets
+Counts the queries issued while a request is dispatched and logs a warning
+whenever an endpoint goes over its configured maximum
+"""
+
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """
+    Database execute wrapper that only counts executed statements
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """
+    Count the queries executed on the default connection inside the block
+
+    Yields:
+        QueryCounter whose ``count`` attribute is updated as queries run
+    """
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def get_query_budget(view, action):
+    """
+    Resolve the maximum number of queries allowed for a viewset action
+
+    Lookup order:
+        1. settings.QUERY_BUDGETS['<ViewSetName>.<action>']
+        2. view.query_budgets[action]
+        3. settings.QUERY_BUDGETS['default']
+
+    Returns:
+        Maximum query count, or None when the action has no budget
+    """
+    overrides = getattr(settings, 'QUERY_BUDGETS', {})
+    key = f"{view.__class__.__name__}.{action}"
+    if key in overrides:
+        return overrides[key]
+    view_budgets = getattr(view, 'query_budgets', None) or {}
+    if action in view_budgets:
+        return view_budgets[action]
+    return overrides.get('default')
+
+
+class QueryBudgetMixin:
+    """
+    View mixin that enforces ``query_budgets`` per action
+
+    ViewSets are budgeted per action; plain APIViews have no action and are
+    budgeted per lower-case HTTP method instead.
+
+    Example:
+        class ItineraryViewSet(CustomModelViewSet):
+            query_budgets = {'list': 5, 'retrieve': 4}
+
+        class UserLoginView(QueryBudgetMixin, APIView):
+            query_budgets = {'post': 1}
+    """
+    query_budgets = {}
+
+    def dispatch(self, request, *args, **kwargs):
+        with count_queries() as counter:
+            response = super().dispatch(request, *args, **kwargs)
+
+        action = getattr(self, 'action', None) or request.method.lower()
+        budget = get_query_budget(self, action)
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                "Query budget exceeded: %s.%s ran %d queries (budget %d) for %s %s",
+                self.__class__.__name__, action, counter.count, budget,
+                request.method, request.path,
+            )
+        self.query_count = counter.count
+        return response
@@ -0,0 +1,124 @@
+"""
+JSON renderer and parser for AITrip
+
+EnvelopeJSONRenderer and FastJSONParser use orjson when it is installed and
+fall back to DRF's stdlib-based JSONRenderer / JSONParser otherwise, or
+whenever orjson can't reproduce their output:
+
+    - indented output (``Accept: application/json; indent=4``, browsable API)
+    - UNICODE_JSON / COMPACT_JSON turned off
+    - values orjson rejects, e.g. integers wider than 64 bits
+
+Types orjson doesn't know natively (Decimal, dates and times, lazy strings,
+querysets, ...) go through DRF's JSONEncoder.default, so they are encoded
+exactly as before. NaN and infinity are rendered as null rather than
+rejected.
+
+Bodies of CustomModelViewSet responses are Envelope dicts; the renderer
+writes the ``{"success":..,"msg":..,"data":`` frame around the encoded data
+directly, with the frames of the default messages encoded once.
+"""
+
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SUCCESS_MSG = 'Operation successful'
+ERROR_MSG = 'Operation failed'
+
+
+class Envelope(dict):
+    """
+    Response body in the unified {success, msg, data} format
+
+    A plain dict to everything reading ``response.data``; EnvelopeJSONRenderer
+    recognises it and writes the frame itself.
+    """
+
+    def __init__(self, data=None, success=1, msg=None):
+        if msg is None:
+            msg = SUCCESS_MSG if success else ERROR_MSG
+        super().__init__(success=success, msg=msg, data=data)
+
+    @classmethod
+    def for_status(cls, data, status_code):
+        """Success envelope below 400, error envelope otherwise"""
+        return cls(data, success=1 if status_code < 400 else 0)
+
+
+class EnvelopeJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer encoding with orjson and writing Envelope frames directly
+    """
+    _encoder = encoders.JSONEncoder()
+    _frames = {}
+
+    @staticmethod
+    def default(obj):
+        return EnvelopeJSONRenderer._encoder.default(obj)
+
+    def dumps(self, data):
+        return orjson.dumps(
+            data, default=self.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+
+    def frame(self, success, msg):
+        """Encoded ``{"success":..,"msg":..,"data":`` prefix; default messages are cached"""
+        key = (success, msg)
+        prefix = self._frames.get(key)
+        if prefix is None:
+            prefix = b'{"success":' + self.dumps(success) + b',"msg":' + self.dumps(msg) + b',"data":'
+            if msg in (SUCCESS_MSG, ERROR_MSG) and type(success) is int:
+                self._frames[key] = prefix
+        return prefix
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (orjson is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            if type(data) is Envelope and len(data) == 3:
+                ret = self.frame(data['success'], data['msg']) + self.dumps(data['data']) + b'}'
+            else:
+                ret = self.dumps(data)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same strict javascript subset as JSONRenderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser decoding UTF-8 bodies with orjson
+    """
+    renderer_class = EnvelopeJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # Let JSONParser decide (and word the error) for what orjson rejects
+            return super().parse(io.BytesIO(body), media_type, parser_context)
@@ -7,6 +7,14 @@ from rest_framework.response import Response
 from rest_framework import status, viewsets
 from typing import Any
 
+from .compiledSerializer import CompiledReadMixin
+from .conditional import ConditionalRequestMixin
+from .customPagination import KeysetPagination
+from .instrumentation import phase, time_serializer
+from .queryBudget import QueryBudgetMixin
+from .renderers import Envelope
+from .sparseFields import SparseFieldset, SparseFieldsMixin
+
 
 class ResponseHandler:
     """
@@ -37,11 +45,7 @@ class ResponseHandler:
         Returns:
             Response object with success format
         """
-        response_data = {
-            'success': 1,
-            'msg': msg,
-            'data': data
-        }
+        response_data = Envelope(data, success=1, msg=msg)
         
         return Response(response_data, status=status_code)
     
@@ -62,23 +66,58 @@ class ResponseHandler:
         Returns:
             Response object with error format
         """
-        response_data = {
-            'success': 0,
-            'msg': msg,
-            'data': data
-        }
+        response_data = Envelope(data, success=0, msg=msg)
         
         return Response(response_data, status=status_code)
 
-class CustomModelViewSet(viewsets.ModelViewSet):
+class CustomModelViewSet(CompiledReadMixin, QueryBudgetMixin, ConditionalRequestMixin, viewsets.ModelViewSet):
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        """
+        Let the serializer eager-load the relations it is going to render
+        """
+        queryset = super().get_queryset()
+        setup_eager_loading = getattr(self.get_serializer_class(), 'setup_eager_loading', None)
+        if setup_eager_loading is not None:
+            fieldset = self.get_sparse_fieldset()
+            queryset = setup_eager_loading(queryset) if fieldset is None else setup_eager_loading(queryset, fieldset)
+        return queryset
+
+    def get_sparse_fieldset(self):
+        """
+        The ?fields= / ?expand= selection of a read, validated against the
+        serializer; None for writes and for serializers without SparseFieldsMixin
+        """
+        if not hasattr(self, '_sparse_fieldset'):
+            fieldset = None
+            serializer_class = self.get_serializer_class()
+            if self.request.method in ('GET', 'HEAD') and issubclass(serializer_class, SparseFieldsMixin):
+                fieldset = SparseFieldset.from_query_params(self.request.query_params)
+                if fieldset is not None:
+                    fieldset.validate(serializer_class())
+            self._sparse_fieldset = fieldset
+        return self._sparse_fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_sparse_fieldset()
+        return context
+
+    def get_serializer(self, *args, **kwargs):
+        return time_serializer(super().get_serializer(*args, **kwargs))
+
     def finalize_response(self, request, response, *args, **kwargs):
+        if not isinstance(response, Response) or response.status_code == status.HTTP_304_NOT_MODIFIED:
+            # Streaming responses and bodiless 304s are passed through untouched
+            return super().finalize_response(request, response, *args, **kwargs)
+
         if isinstance(response.data, dict) and 'success' in response.data:
             return super().finalize_response(request, response, *args, **kwargs)
 
-        if response.status_code < 400:
-            response.data = ResponseHandler.success(data=response.data).data
-        else:
-            response.data = ResponseHandler.error(data=response.data).data
+        # The renderer writes the envelope frame; no intermediate Response is built
+        with phase('envelope'):
+            response.data = Envelope.for_status(response.data, response.status_code)
 
         return super().finalize_response(request, response, *args, **kwargs)
 
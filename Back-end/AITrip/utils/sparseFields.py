@@ -0,0 +1,190 @@
+"""
+Sparse fieldsets and opt-in expansion for nested serializers
+
+GET requests can shape the response with two query parameters:
+
+    fields  Fields to render; dotted paths select fields of nested objects,
+            e.g. ``fields=itinerary_id,title,daily_schedules.day_number``.
+            Naming a nested field alone renders all of its fields.
+    expand  Relations to embed, e.g. ``expand=daily_schedules,daily_schedules.pois``.
+            When present, relations that are not listed are rendered as
+            lists of primary keys. Without it every relation is embedded.
+
+CustomModelViewSet parses them into a SparseFieldset before any query runs,
+answers unknown names with 400, passes the fieldset to the serializer's
+setup_eager_loading (which loads only the needed columns and relations) and
+to the serializer through its context. Writes always use every field.
+"""
+
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+SPARSE_QUERY_PARAMS = ('fields', 'expand')
+
+
+def _split(value):
+    return [path.strip() for path in value.split(',') if path.strip()]
+
+
+class SparseFieldset:
+    """
+    Fields and expanded relations requested for one level of a serializer tree
+
+    Attributes:
+        fields: Names to render, or None for every field
+        expand: Relations to embed, or None to embed every relation
+        children: SparseFieldset of every nested field named in a dotted path
+    """
+
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+        self.children = {}
+
+    @classmethod
+    def from_query_params(cls, query_params):
+        """
+        Parse ``fields`` and ``expand``; None when the request uses neither
+        """
+        fields = query_params.get('fields')
+        expand = query_params.get('expand')
+        if fields is None and expand is None:
+            return None
+        fieldset = cls()
+        if fields is not None:
+            fieldset.add_paths('fields', _split(fields))
+        if expand is not None:
+            # An empty expand still collapses every relation
+            fieldset.expand = set()
+            fieldset._expand_nothing_below(fieldset)
+            fieldset.add_paths('expand', _split(expand))
+        return fieldset
+
+    def child(self, name):
+        """Fieldset of a nested field; nothing below it is expanded if expand was given"""
+        child = self.children.get(name)
+        if child is None:
+            child = self.children[name] = SparseFieldset(expand=None if self.expand is None else set())
+        return child
+
+    def add_paths(self, kind, paths):
+        for path in paths:
+            node = self
+            parts = path.split('.')
+            for depth, name in enumerate(parts):
+                selected = getattr(node, kind)
+                if selected is None:
+                    selected = set()
+                    setattr(node, kind, selected)
+                    if kind == 'expand':
+                        # expand applies to every level once it is given
+                        self._expand_nothing_below(node)
+                selected.add(name)
+                if depth < len(parts) - 1:
+                    node = node.child(name)
+
+    def _expand_nothing_below(self, node):
+        for child in node.children.values():
+            if child.expand is None:
+                child.expand = set()
+            self._expand_nothing_below(child)
+
+    def includes(self, name):
+        return self.fields is None or name in self.fields
+
+    def expands(self, name):
+        return self.expand is None or name in self.expand
+
+    def column_names(self, model, always=('create_time', 'update_time')):
+        """
+        Concrete model fields of the requested fields, plus the primary key
+        and the timestamps pagination and validators read; None for all columns
+        """
+        if self.fields is None:
+            return None
+        concrete = {field.name for field in model._meta.concrete_fields}
+        return {model._meta.pk.name} | ((set(self.fields) | set(always)) & concrete)
+
+    def validate(self, serializer, path=''):
+        """
+        Check every name against the serializer tree
+
+        Raises:
+            ValidationError listing the unknown fields and relations
+        """
+        errors = []
+        fields = serializer.fields
+        expandable = getattr(serializer, 'expandable_fields', {})
+        for name in sorted(self.fields or ()):
+            if name not in fields:
+                errors.append(f"Unknown field '{path}{name}'")
+        for name in sorted(self.expand or ()):
+            if name not in expandable:
+                errors.append(f"'{path}{name}' can't be expanded")
+        for name, child in self.children.items():
+            nested = fields.get(name)
+            nested = getattr(nested, 'child', nested)
+            if isinstance(nested, serializers.BaseSerializer):
+                try:
+                    child.validate(nested, f'{path}{name}.')
+                except ValidationError as error:
+                    errors.extend(error.detail['fields'])
+            elif name in fields:
+                errors.append(f"'{path}{name}' has no nested fields")
+        if errors:
+            raise ValidationError({'fields': errors})
+
+
+def load_only(queryset, fieldset, required=()):
+    """
+    Restrict a queryset to the columns a fieldset renders
+
+    Args:
+        required: Fields that must be loaded anyway, e.g. foreign keys used to
+            join prefetched relations
+    """
+    if fieldset is None:
+        return queryset
+    columns = fieldset.column_names(queryset.model)
+    if columns is None:
+        return queryset
+    return queryset.only(*columns, *required)
+
+
+class SparseFieldsMixin:
+    """
+    ModelSerializer mixin rendering only the fields of its SparseFieldset
+
+    The fieldset of the top-level serializer comes from ``context['fieldset']``;
+    nested serializers using the mixin receive the fieldset of their path.
+
+    Attributes:
+        expandable_fields: {name: callable returning the field rendered when the
+            relation is not expanded}
+    """
+    expandable_fields = {}
+
+    def get_fieldset(self):
+        if hasattr(self, '_fieldset'):
+            return self._fieldset
+        parent = self.parent
+        if parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None):
+            return self.context.get('fieldset')
+        return None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return fields
+        for name in list(fields):
+            if not fieldset.includes(name):
+                del fields[name]
+        for name, collapsed in self.expandable_fields.items():
+            if name in fields and not fieldset.expands(name):
+                fields[name] = collapsed()
+        for name, field in fields.items():
+            nested = getattr(field, 'child', field)
+            if isinstance(nested, SparseFieldsMixin):
+                nested._fieldset = fieldset.child(name)
+        return fields
@@ -0,0 +1,30 @@
+"""
+Test helpers shared by the AITrip apps
+"""
+
+from django.contrib.auth import get_user_model
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class AuthenticatedAPITestCase(APITestCase):
+    """
+    APITestCase whose client is logged in as self.user, a fresh user named
+    after the class attribute username
+
+    With token_auth the client sends a real JWT instead of bypassing
+    authentication, for tests that cover the authentication path too.
+    """
+
+    username = 'tester'
+    token_auth = False
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email=f'{self.username}@aitrip.com', username=self.username, password=f'{self.username}-pass-123'
+        )
+        if self.token_auth:
+            token = RefreshToken.for_user(self.user).access_token
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        else:
+            self.client.force_authenticate(self.user)